@@ -0,0 +1,68 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare archiving a run as the JSON of its datasets with the binary
+columnar archives of dzclient.archive: file size, and time to load back
+into a collection.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_archive
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report, synthetic_request, synthetic_result
+from dzclient import archive
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+SHAPES = [
+    ('talos run', dict(suites=10, tests=50, replicates=25)),
+    ('many replicates', dict(suites=5, tests=5, replicates=20000)),
+    ('large aux/xperf', dict(suites=5, tests=5, replicates=20,
+                             aux=50000, xperf=50000)),
+]
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        for name, shape in SHAPES:
+            req = synthetic_request(synthetic_result(**shape))
+            json_path = os.path.join(directory, 'run.json')
+            binary_path = os.path.join(directory, 'run.dzc')
+            f = open(json_path, 'w')
+            json.dump(req.datasets(), f)
+            f.close()
+            archive.dump(req, binary_path)
+
+            def load_json():
+                f = open(json_path)
+                try:
+                    archive.from_datasets(json.load(f))
+                finally:
+                    f.close()
+
+            for label, path, func in (
+                    ('json', json_path, load_json),
+                    ('binary', binary_path,
+                     lambda: archive.load(binary_path)),
+                    ('binary, compact', binary_path,
+                     lambda: archive.load(binary_path, compact=True))):
+                elapsed, peak_kb = measure(func)
+                report('%s: load %s' % (name, label), elapsed, peak_kb,
+                       file_kb=os.path.getsize(path) / 1024)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
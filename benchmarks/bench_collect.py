@@ -0,0 +1,81 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare collecting results from worker processes by returning pickled
+DatazillaResults and joining them with join_results, with the packed
+transfer and single join of dzclient.collect.ProcessCollector.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_collect
+"""
+
+import multiprocessing
+
+from benchmarks.common import measure, report, synthetic_result
+from dzclient import DatazillaResult
+from dzclient.collect import ProcessCollector
+
+WORKERS = 4
+SHAPES = [
+    ('talos run', dict(suites=10, tests=50, replicates=25)),
+    ('many replicates', dict(suites=2, tests=5, replicates=20000)),
+    ('large aux', dict(suites=2, tests=5, replicates=20, aux=100000)),
+]
+
+
+_results = {}
+
+
+class Task(object):
+    """
+    A worker task returning the synthetic result of a given shape, made
+    before the workers are forked so that the transfer and join are what
+    is timed.
+    """
+
+    def __init__(self, shape):
+        self.key = tuple(sorted(shape.items()))
+        if self.key not in _results:
+            _results[self.key] = synthetic_result(**shape)
+
+    def __call__(self, seed):
+        return _results[self.key]
+
+
+def main():
+    for name, shape in SHAPES:
+        task = Task(shape)
+        seeds = range(WORKERS * 2)
+
+        def pickled():
+            pool = multiprocessing.Pool(WORKERS)
+            try:
+                res = DatazillaResult()
+                for part in pool.imap(task, seeds):
+                    res.join_results(part)
+            finally:
+                pool.close()
+                pool.join()
+
+        def packed(compact):
+            collector = ProcessCollector(WORKERS, compact=compact)
+            try:
+                collector.map(task, seeds)
+            finally:
+                collector.close()
+
+        values = len(seeds) * shape['suites'] * (
+            shape['tests'] * shape['replicates'] + shape.get('aux', 0))
+        for label, func in (('pickle + join_results', pickled),
+                            ('packed', lambda: packed(False)),
+                            ('packed, compact', lambda: packed(True))):
+            elapsed, peak_kb = measure(func)
+            report('%s: %s' % (name, label), elapsed, peak_kb,
+                   values_per_s=int(values / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Time long counter captures added in small batches, as a harness sampling
+memory would, with each compactor of dzclient.compaction and without, and
+report the size of the JSON sent.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compaction
+"""
+
+import math
+
+from benchmarks.common import measure, report
+from dzclient import DatazillaResult
+from dzclient.compaction import Buckets, Downsample, RunLength
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+SAMPLES = 200000
+BATCH = 50
+
+COMPACTORS = [
+    ('verbatim', None),
+    ('downsample', Downsample(1000)),
+    ('run length (delta)', RunLength(delta=True)),
+    ('buckets', Buckets(100, percentiles=(50, 95))),
+]
+
+
+def main():
+    samples = [int(1e6 + 1e5 * math.sin(i / 1000.0)) // 4096 * 4096
+               for i in range(SAMPLES)]
+    batches = [samples[i:i + BATCH] for i in range(0, SAMPLES, BATCH)]
+    for name, compactor in COMPACTORS:
+        compaction = compactor and {'*': compactor}
+
+        def capture():
+            res = DatazillaResult(compaction=compaction)
+            for batch in batches:
+                res.add_talos_auxiliary('tp5', 'rss', batch)
+            return res
+
+        elapsed, peak_kb = measure(capture)
+        size = len(json.dumps(capture().talos_aux))
+        report(name, elapsed, peak_kb, json_kb=size // 1024,
+               samples_per_s=int(SAMPLES / elapsed))
+
+
+if __name__ == '__main__':
+    main()
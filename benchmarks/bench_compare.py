@@ -0,0 +1,49 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Time comparing a run with a baseline (dzclient.compare), with NumPy and
+in pure Python, for runs of many tests.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compare
+"""
+
+from benchmarks.common import measure, report, synthetic_result
+from dzclient import compare
+
+SHAPES = [
+    ('talos run', dict(suites=10, tests=50, replicates=25)),
+    ('thousands of tests', dict(suites=20, tests=250, replicates=25)),
+    ('many replicates', dict(suites=5, tests=5, replicates=20000)),
+]
+
+
+def main():
+    for name, shape in SHAPES:
+        current = synthetic_result(seed=1, **shape)
+        baseline = synthetic_result(seed=2, **shape)
+        tests = shape['suites'] * shape['tests']
+
+        def python():
+            numpy = compare.numpy
+            compare.numpy = None
+            try:
+                compare.compare_results(current, baseline)
+            finally:
+                compare.numpy = numpy
+
+        runs = [('numpy', lambda: compare.compare_results(current, baseline))]
+        if compare.numpy is None:
+            runs = []
+        runs.append(('python', python))
+        for label, func in runs:
+            elapsed, peak_kb = measure(func)
+            report('%s: %s' % (name, label), elapsed, peak_kb,
+                   tests_per_s=int(tests / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare the copying datasets() with the copy-free iter_datasets().
+
+Run from the repository root:
+
+    python -m benchmarks.bench_datasets
+"""
+
+from benchmarks.common import measure, report, synthetic_request, synthetic_result
+
+SHAPES = [
+    ('many suites', dict(suites=200, tests=5, replicates=20)),
+    ('many replicates', dict(suites=5, tests=5, replicates=20000)),
+    ('large aux/xperf', dict(suites=5, tests=5, replicates=20,
+                             aux=50000, xperf=50000)),
+]
+
+
+def main():
+    for name, shape in SHAPES:
+        req = synthetic_request(synthetic_result(**shape))
+        for method in ('datasets', 'iter_datasets'):
+            elapsed, peak_kb = measure(lambda: list(getattr(req, method)()))
+            report('%s: %s()' % (name, method), elapsed, peak_kb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare building a signed load_test body in memory, as the oauth2 library
+does, with streaming it through FormBody.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_encoding
+"""
+
+import urllib
+
+import oauth2 as oauth
+
+from benchmarks.common import measure, report, synthetic_request, synthetic_result
+from dzclient.encoding import FormBody
+from dzclient.signing import OAuthSigner
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+URL = 'http://127.0.0.1/project/api/load_test'
+# as OAuthSigner.parameters() gives them, so that both bodies carry the
+# same parameters
+PARAMS = {'user': 'project', 'oauth_version': '1.0',
+          'oauth_nonce': '46810593', 'oauth_timestamp': 1342229050,
+          'oauth_token': '', 'oauth_consumer_key': 'key',
+          'oauth_body_hash': OAuthSigner.body_hash,
+          'oauth_signature_method': OAuthSigner.signature_method}
+
+
+def oauth2_body(dataset):
+    params = dict(PARAMS, data=urllib.quote(json.dumps(dataset)))
+    req = oauth.Request(method="POST", url=URL, parameters=params)
+    req.sign_request(oauth.SignatureMethod_HMAC_SHA1(),
+                     oauth.Consumer(key='key', secret='secret'),
+                     oauth.Token(key='', secret=''))
+    return len(req.to_postdata())
+
+
+def streamed_body(dataset):
+    body = FormBody(dataset, PARAMS, OAuthSigner('key', 'secret'), URL)
+    block = body.read(8192)
+    while block:
+        block = body.read(8192)
+    return len(body)
+
+
+def main():
+    shapes = [
+        ('talos suite', dict(suites=1, tests=50, replicates=25)),
+        ('large aux/xperf', dict(suites=1, tests=10, replicates=100,
+                                 aux=200000, xperf=200000)),
+    ]
+    for name, shape in shapes:
+        req = synthetic_request(synthetic_result(**shape))
+        dataset = list(req.iter_datasets())[0]
+        size = streamed_body(dataset)
+        for encoder in (oauth2_body, streamed_body):
+            elapsed, peak_kb = measure(lambda: encoder(dataset))
+            report('%s: %s' % (name, encoder.__name__), elapsed, peak_kb,
+                   body_kb=size / 1024)
+
+
+if __name__ == '__main__':
+    main()
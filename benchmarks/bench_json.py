@@ -0,0 +1,65 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare the JSON encoders of dzclient.encoders on Talos-like payloads,
+serializing whole datasets and building signed load_test bodies.
+Encoders whose module is not installed are skipped.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_json
+"""
+
+from benchmarks.common import measure, report, synthetic_request, synthetic_result
+from dzclient.encoders import FloatListEncoder, get_encoder
+from dzclient.encoding import FormBody
+from dzclient.signing import OAuthSigner
+
+URL = 'http://127.0.0.1/project/api/load_test'
+PARAMS = {'user': 'project', 'oauth_version': '1.0',
+          'oauth_nonce': '46810593', 'oauth_timestamp': 1342229050,
+          'oauth_token': '', 'oauth_consumer_key': 'key'}
+
+# tp5: 100 pages of 25 replicates with memory counters; a long xperf run
+SHAPES = [
+    ('tp5', dict(suites=1, tests=100, replicates=25, aux=2500)),
+    ('xperf', dict(suites=1, tests=10, replicates=25, aux=100000,
+                   xperf=100000)),
+]
+
+
+def encoders():
+    found = []
+    for name in ('json', 'ujson'):
+        try:
+            found.append((name, get_encoder(name)))
+        except ImportError:
+            pass
+    for precision in (6, 9, 17):
+        found.append(('floats, precision %d' % precision,
+                      FloatListEncoder(precision)))
+    return found
+
+
+def main():
+    signer = OAuthSigner('key', 'secret')
+    for shape_name, shape in SHAPES:
+        req = synthetic_request(synthetic_result(**shape))
+        dataset = list(req.iter_datasets())[0]
+        for name, encoder in encoders():
+            size = len(encoder.encode(dataset))
+            elapsed, peak_kb = measure(lambda: encoder.encode(dataset))
+            report('%s: encode, %s' % (shape_name, name), elapsed, peak_kb,
+                   json_kb=size / 1024)
+
+            def body():
+                FormBody(dataset, PARAMS, signer, URL,
+                         dumps=encoder.dumps).getvalue()
+            elapsed, peak_kb = measure(body)
+            report('%s: body, %s' % (shape_name, name), elapsed, peak_kb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Measure OAuth signing throughput, per MB of body, of the oauth2 library
+and of a reused OAuthSigner.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_signing
+"""
+
+import time
+import urllib
+
+import oauth2 as oauth
+
+from benchmarks.common import synthetic_request, synthetic_result
+from dzclient.encoding import FormBody, signature_escape
+from dzclient.signing import OAuthSigner
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+URL = 'http://127.0.0.1/project/api/load_test'
+
+
+def best_of(func, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    for aux in (10000, 100000, 400000):
+        req = synthetic_request(synthetic_result(suites=1, aux=aux))
+        dataset = list(req.iter_datasets())[0]
+        signer = OAuthSigner('key', 'secret')
+        params = dict(signer.parameters(), user='project')
+        quoted = urllib.quote(json.dumps(dataset))
+        megabytes = len(FormBody(dataset, params, signer, URL)) / 1e6
+
+        def oauth2_sign():
+            request = oauth.Request(method="POST", url=URL,
+                                    parameters=dict(params, data=quoted))
+            request.sign_request(oauth.SignatureMethod_HMAC_SHA1(),
+                                 oauth.Consumer(key='key', secret='secret'),
+                                 oauth.Token(key='', secret=''))
+
+        # FormBody signs the body pieces as it encodes them; time the
+        # signing of already encoded pieces
+        pieces = list(FormBody(dataset, params, buffer_limit=0)._iter_body())
+
+        def signer_sign():
+            digest = signer.digest('POST', URL)
+            for piece in pieces:
+                digest.update(signature_escape(piece))
+            signer.signature(digest)
+
+        for name, sign in (('oauth2', oauth2_sign),
+                           ('OAuthSigner', signer_sign)):
+            elapsed = best_of(sign)
+            print '%-12s %7.2f MB body  %9.2f ms  %9.1f MB/s' % (
+                name, megabytes, elapsed * 1000, megabytes / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compare the memory used to collect replicates in list-backed and compact
+DatazillaResult storage.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_storage
+"""
+
+import random
+
+from benchmarks.common import measure, report
+from dzclient import DatazillaResult
+
+SUITES = 10
+TESTS = 50
+BATCHES = 20
+BATCH = 500 # values added per call
+
+
+def collect(compact):
+    rand = random.Random(0)
+    res = DatazillaResult(compact=compact)
+    for batch in range(BATCHES):
+        for s in range(SUITES):
+            for t in range(TESTS):
+                res.add_test_results(
+                    'suite%d' % s, 'test%d' % t,
+                    [rand.uniform(100, 200) for i in range(BATCH)])
+    return res
+
+
+def main():
+    values = SUITES * TESTS * BATCHES * BATCH
+    for compact in (False, True):
+        elapsed, peak_kb = measure(lambda: collect(compact), repeat=1)
+        report('collect %d values, compact=%s' % (values, compact),
+               elapsed, peak_kb)
+
+
+if __name__ == '__main__':
+    main()
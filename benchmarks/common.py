@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Helpers shared by the dzclient benchmarks."""
+
+import os
+import random
+import resource
+import time
+import traceback
+
+from dzclient import DatazillaRequest, DatazillaResult
+
+
+def synthetic_result(suites=10, tests=10, replicates=100, aux=0, xperf=0,
+                     seed=0):
+    """
+    Return a DatazillaResult of `suites` suites with `tests` tests of
+    `replicates` values each, plus `aux` talos_aux and `xperf` results_xperf
+    counter values per suite.
+    """
+    rand = random.Random(seed)
+    res = DatazillaResult()
+    for s in range(suites):
+        suite = 'suite%d' % s
+        for t in range(tests):
+            res.add_test_results(
+                suite, 'test%d' % t,
+                [rand.uniform(100, 200) for i in range(replicates)])
+        if aux:
+            res.add_talos_auxiliary(
+                suite, 'memory', [rand.uniform(1e6, 1e7) for i in range(aux)])
+        if xperf:
+            res.add_xperf_results(
+                suite, 'io', [rand.randint(0, 1 << 20) for i in range(xperf)])
+        res.options[suite] = {'tpcycles': 10}
+    return res
+
+
+def synthetic_request(result=None, **kw):
+    """Return a DatazillaRequest for the local host holding `result`."""
+    options = dict(protocol='http', host='127.0.0.1', project='project',
+                   oauth_key='key', oauth_secret='secret',
+                   machine_name='qm-pxp01', os='linux',
+                   os_version='Ubuntu 11.10', platform='x86_64',
+                   build_name='Firefox', version='14.0a2',
+                   revision='785345035a3b', branch='Mozilla-Aurora',
+                   id='20120228122102')
+    options.update(kw)
+    req = DatazillaRequest(**options)
+    if result is not None:
+        req.add_datazilla_result(result)
+    return req
+
+
+def measure(func, repeat=3):
+    """
+    Run func() `repeat` times, each in a forked child, and return the best
+    wall time in seconds and the largest peak memory growth in KiB.
+    """
+    best_time = None
+    peak_kb = 0
+    for i in range(repeat):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # the child must never return into the caller's code
+            try:
+                os.close(read_fd)
+                baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                start = time.time()
+                func()
+                elapsed = time.time() - start
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                os.write(write_fd, '%r %d' % (elapsed, peak - baseline))
+            except:
+                traceback.print_exc()
+            os._exit(0)
+        os.close(write_fd)
+        output = os.read(read_fd, 100)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        if not output:
+            raise RuntimeError("benchmark %r failed" % func.__name__)
+        elapsed, growth = output.split()
+        elapsed = float(elapsed)
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+        peak_kb = max(peak_kb, int(growth))
+    return best_time, peak_kb
+
+
+def report(name, elapsed, peak_kb, **extra):
+    """Print one benchmark result line."""
+    fields = ''.join(['  %s=%s' % item for item in sorted(extra.items())])
+    print '%-40s %9.2f ms %9d KiB%s' % (name, elapsed * 1000, peak_kb, fields)
@@ -0,0 +1,192 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Benchmark the serialization and submission path end to end: joining
+results, building datasets, JSON encoding, body encoding and submit()
+against a local stub server, for payloads of several shapes.
+
+Run from the repository root:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json --tolerance 0.25
+
+With --compare, benchmarks more than `tolerance` slower, or using that much
+more memory, than in the saved run are listed and the exit status is 1.
+"""
+
+import sys
+from optparse import OptionParser
+
+from benchmarks.common import measure, report, synthetic_request, synthetic_result
+from dzclient import DatazillaResult
+from dzclient.encoding import FormBody, json_default
+from dzclient.signing import OAuthSigner
+from dzclient.tests.stubserver import StubServer
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+SHAPES = [
+    ('many suites', dict(suites=200, tests=5, replicates=20)),
+    ('many tests', dict(suites=2, tests=2000, replicates=20)),
+    ('many replicates', dict(suites=5, tests=5, replicates=20000)),
+    ('large aux/xperf', dict(suites=5, tests=5, replicates=20,
+                             aux=50000, xperf=50000)),
+]
+
+PARTS = 10 # results joined by the join_results benchmark
+
+
+def count_values(res):
+    count = 0
+    for block in (res.results, res.results_aux, res.results_xperf,
+                  res.talos_aux):
+        for tests in block.values():
+            for values in tests.values():
+                count += len(values)
+    return count
+
+
+def benchmarks(shape, server):
+    """
+    Return the (name, func, units, unit name) benchmarks of a shape, where
+    `units` is the amount of work each run of func() does.
+    """
+    result = synthetic_result(**shape)
+    values = count_values(result)
+    part_shape = dict(shape, replicates=max(1, shape['replicates'] / PARTS))
+    parts = [synthetic_result(seed=i, **part_shape) for i in range(PARTS)]
+    part_values = count_values(parts[0]) * PARTS
+
+    req = synthetic_request(result)
+    datasets = list(req.iter_datasets())
+    json_bytes = sum([len(json.dumps(d, default=json_default))
+                      for d in datasets])
+    submit_req = synthetic_request(result, host=server.host)
+    params = {'user': 'project', 'oauth_version': '1.0',
+              'oauth_nonce': '46810593', 'oauth_timestamp': 1342229050,
+              'oauth_token': '', 'oauth_consumer_key': 'key'}
+    signer = OAuthSigner('key', 'secret')
+    url = 'http://127.0.0.1/project/api/load_test'
+
+    def join_results():
+        joined = DatazillaResult()
+        for part in parts:
+            joined.join_results(part)
+
+    def datasets_():
+        req.datasets()
+
+    def json_encoding():
+        for dataset in datasets:
+            json.dumps(dataset, default=json_default)
+
+    def body_encoding():
+        for dataset in datasets:
+            body = FormBody(dataset, params, signer, url)
+            while body.read(65536):
+                pass
+
+    def submit():
+        submit_req.submit()
+        submit_req.close()
+
+    return [('join_results', join_results, part_values, 'values'),
+            ('datasets', datasets_, values, 'values'),
+            ('json encoding', json_encoding, json_bytes, 'bytes'),
+            ('body encoding', body_encoding, json_bytes, 'bytes'),
+            ('submit', submit, json_bytes, 'bytes')]
+
+
+def throughput(units, unit, elapsed):
+    if unit == 'bytes':
+        return 'MB/s', '%.1f' % (units / elapsed / (1 << 20))
+    return 'values/s', '%.0f' % (units / elapsed)
+
+
+def run(shapes, repeat):
+    """Run the benchmarks of `shapes`; return {name: [seconds, KiB]}."""
+    server = StubServer().start()
+    results = {}
+    try:
+        for shape_name, shape in shapes:
+            for name, func, units, unit in benchmarks(shape, server):
+                elapsed, peak_kb = measure(func, repeat)
+                del server.requests[:], server.datasets[:]
+                key = '%s: %s' % (shape_name, name)
+                rate_name, rate = throughput(units, unit, elapsed)
+                report(key, elapsed, peak_kb, **{rate_name: rate})
+                results[key] = [elapsed, peak_kb]
+    finally:
+        server.stop()
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Return descriptions of results worse than baseline by `tolerance`."""
+    found = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        elapsed, peak_kb = results[key]
+        base_elapsed, base_kb = baseline[key]
+        if elapsed > base_elapsed * (1 + tolerance):
+            found.append('%s: %.2f ms, was %.2f ms' %
+                         (key, elapsed * 1000, base_elapsed * 1000))
+        # ignore noise in small allocations
+        if peak_kb > max(base_kb * (1 + tolerance), base_kb + 1024):
+            found.append('%s: %d KiB, was %d KiB' % (key, peak_kb, base_kb))
+    return found
+
+
+def main(args=sys.argv[1:]):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--shape', action='append',
+                      help="only run this shape; may be repeated")
+    parser.add_option('--repeat', type='int', default=3,
+                      help="runs per benchmark, the best of which is kept")
+    parser.add_option('--save', help="save the results to this JSON file")
+    parser.add_option('--compare',
+                      help="compare the results with this saved JSON file")
+    parser.add_option('--tolerance', type='float', default=0.25,
+                      help="fraction by which a benchmark may get worse")
+    options, args = parser.parse_args(args)
+
+    shapes = SHAPES
+    if options.shape:
+        shapes = [(name, shape) for name, shape in SHAPES
+                  if name in options.shape]
+        if not shapes:
+            parser.error("unknown shape; choose from: %s" %
+                         ', '.join([name for name, shape in SHAPES]))
+
+    results = run(shapes, options.repeat)
+
+    if options.save:
+        f = open(options.save, 'w')
+        try:
+            json.dump(results, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+    if options.compare:
+        f = open(options.compare)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        found = regressions(results, baseline, options.tolerance)
+        for line in found:
+            print 'REGRESSION %s' % line
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
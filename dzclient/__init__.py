@@ -2,4 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from .client import DatazillaResult, DatazillaResultsCollection, DatazillaRequest
+from .client import DatazillaResult, DatazillaResultsCollection, DatazillaRequest, DatazillaSubmitError
+from .pool import ConnectionPool
+from .background import AsyncDatazillaRequest
+from .workers import Pending, PendingTimeout, Cancelled
+from .spool import DatazillaSpool, SpoolUploader
+from .signing import OAuthSigner
+from .metrics import SubmissionMetrics
+from .retry import RetryPolicy, DeadlineExceeded
+from .encoders import FloatListEncoder, get_encoder
+from .flushing import AutoFlushingResult
+from .collect import PackedResult, ProcessCollector
+from .sentcache import SentCache
+from .query import DatazillaQuery, ResponseCache
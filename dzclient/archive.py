@@ -0,0 +1,280 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A compact binary archive format for DatazillaResultsCollection.
+
+An archive holds the values of each numeric series (a test's results, or
+an auxiliary or xperf counter) as a column of packed little-endian
+doubles, followed by a JSON header with the collection's metadata, the
+options, an index of the columns and any non-numeric series:
+
+    magic | column | column | ... | header JSON | footer
+
+where the footer packs the header's offset and length ('<QQ') and the
+magic again. Archives are memory mapped when read, so a column can be
+used in place, e.g. with numpy.frombuffer(archive.buffer(column)), and
+loading copies each column in one block:
+
+    dump(req, 'run.dzc')
+    req = load('run.dzc', DatazillaRequest, protocol='https', ...)
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from .client import DatazillaResult, DatazillaResultsCollection
+
+SUFFIX = '.dzc' # conventional file name suffix
+MAGIC = 'DZCOL01\n'
+FOOTER = struct.Struct('<QQ')
+
+BLOCKS = ('results', 'results_aux', 'results_xperf', 'talos_aux')
+METADATA = ('machine_name', 'os', 'os_version', 'platform', 'build_name',
+            'version', 'revision', 'branch', 'id', 'test_date')
+
+MAX_EXACT_INT = 1 << 53 # integers a double holds exactly
+
+
+class ArchiveError(Exception):
+    """Raised when a file is not a valid archive."""
+
+
+def _column(values):
+    """
+    Return (doubles, integral) for a series that can be stored as a
+    column, where `integral` tells whether its values were all integers,
+    or None for a series that cannot. Series of booleans, alone or among
+    integers, are left to the JSON header, so that they are not read back
+    as numbers.
+    """
+    if isinstance(values, array):
+        if values.typecode == 'd':
+            return values, False
+        return array('d', values), values.typecode not in 'fd'
+    # array('d') refuses values that are not numbers, but takes booleans,
+    # so integral series are also scanned for those
+    try:
+        doubles = array('d', values)
+    except TypeError:
+        return None
+    if doubles and type(values[0]) is float:
+        return doubles, False
+    if bool in set(map(type, values)):
+        return None
+    try:
+        integers = array('l', values)
+    except TypeError: # a float among the integers
+        return doubles, False
+    except OverflowError:
+        return None
+    if integers and (max(integers) > MAX_EXACT_INT or
+                     min(integers) < -MAX_EXACT_INT):
+        return None
+    return doubles, True
+
+
+def write_columns(result, f, offset=0):
+    """
+    Write the numeric series of a DatazillaResult to file `f` as columns
+    starting at `offset`; return the index of the columns and the
+    non-numeric series, as in an archive's header.
+    """
+    columns = []
+    other = {}
+    for block in BLOCKS:
+        for suite, series in getattr(result, block).items():
+            for name, values in series.items():
+                column = _column(values)
+                if column is None:
+                    other.setdefault(block, {}).setdefault(
+                        suite, {})[name] = list(values)
+                    continue
+                doubles, integral = column
+                if sys.byteorder == 'big':
+                    doubles = array('d', doubles)
+                    doubles.byteswap()
+                f.write(doubles.tostring())
+                columns.append({'block': block,
+                                'suite': suite,
+                                'name': name,
+                                'offset': offset,
+                                'count': len(doubles),
+                                'integral': integral})
+                offset += len(doubles) * doubles.itemsize
+    return columns, other
+
+
+def read_column(data, column, compact=False):
+    """
+    Return the values of a column of `data`, a string, buffer or mmap:
+    an array of doubles if `compact`, else a list of floats, or of
+    integers if they all were.
+    """
+    values = array('d')
+    # read through a buffer, so that the packed doubles are not copied
+    values.fromstring(buffer(data, column['offset'], column['count'] * 8))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    if compact:
+        return values
+    values = values.tolist()
+    if column['integral']:
+        values = map(int, values)
+    return values
+
+
+def build_result(data, options, suites, columns, other, compact=False):
+    """Return a DatazillaResult from the parts of an archive."""
+    result = DatazillaResult(options=options, compact=compact)
+    for suite in suites:
+        result.results[suite] = {}
+    # each series is decoded on its own, so that no more than one is
+    # held twice at a time
+    for column in columns:
+        getattr(result, column['block']).setdefault(
+            column['suite'], {})[column['name']] = read_column(data, column,
+                                                               compact)
+    for block, suites in other.items():
+        series = getattr(result, block)
+        for suite, values in suites.items():
+            series.setdefault(suite, {}).update(values)
+    return result
+
+
+def dump(collection, path):
+    """Write a DatazillaResultsCollection to an archive at `path`."""
+    result = collection.results
+    f = open(path, 'wb')
+    try:
+        f.write(MAGIC)
+        columns, other = write_columns(result, f, len(MAGIC))
+        offset = f.tell()
+        text = json.dumps({'metadata': dict([(name, getattr(collection, name))
+                                             for name in METADATA]),
+                           'options': result.options,
+                           'suites': result.results.keys(),
+                           'columns': columns,
+                           'other': other})
+        f.write(text)
+        f.write(FOOTER.pack(offset, len(text)))
+        f.write(MAGIC)
+    finally:
+        f.close()
+
+
+class Archive(object):
+    """
+    A memory-mapped archive, giving its `metadata`, `options`, `suites`,
+    `columns` (dicts of 'block', 'suite', 'name', 'offset', 'count' and
+    'integral') and `other` (non-numeric series, as
+    {block: {suite: {name: values}}}).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(MAGIC) * 2 + FOOTER.size:
+                raise ArchiveError("%s is not a datazilla archive" % path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        footer = size - len(MAGIC) - FOOTER.size
+        if (self._map[:len(MAGIC)] != MAGIC or
+            self._map[size - len(MAGIC):] != MAGIC):
+            self.close()
+            raise ArchiveError("%s is not a datazilla archive" % path)
+        offset, length = FOOTER.unpack(self._map[footer:footer + FOOTER.size])
+        header = json.loads(self._map[offset:offset + length])
+        self.metadata = header['metadata']
+        self.options = header['options']
+        self.suites = header['suites']
+        self.columns = header['columns']
+        self.other = header['other']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def buffer(self, column):
+        """Return a buffer of a column's packed doubles, without copying."""
+        return buffer(self._map, column['offset'], column['count'] * 8)
+
+    def values(self, column, compact=False):
+        """
+        Return a column's values: an array of doubles if `compact`, else
+        a list of floats, or of integers if they all were.
+        """
+        return read_column(self._map, column, compact)
+
+    def result(self, compact=False):
+        """Return the archived results as a DatazillaResult."""
+        return build_result(self._map, self.options, self.suites,
+                            self.columns, self.other, compact)
+
+
+def load(path, cls=DatazillaResultsCollection, compact=False, **kw):
+    """
+    Load an archive into a new instance of `cls`, a
+    DatazillaResultsCollection or subclass such as DatazillaRequest, made
+    with the archived metadata and the further arguments `kw`. With
+    `compact`, values are loaded as arrays of doubles (see
+    DatazillaResult).
+    """
+    archive = Archive(path)
+    try:
+        options = dict([(str(name), value)
+                        for name, value in archive.metadata.items()])
+        options.update(kw)
+        collection = cls(compact=compact, **options)
+        collection.results = archive.result(compact)
+    finally:
+        archive.close()
+    return collection
+
+
+def from_datasets(datasets, cls=DatazillaResultsCollection, compact=False,
+                  **kw):
+    """
+    Rebuild a collection from the output of its `datasets()`, e.g. to
+    convert a JSON archive; `cls`, `compact` and `kw` are as for load().
+    """
+    result = DatazillaResult(compact=compact)
+    options = {}
+    for dataset in datasets:
+        build = dataset['test_build']
+        machine = dataset['test_machine']
+        testrun = dataset['testrun']
+        options = {'machine_name': machine['name'], 'os': machine['os'],
+                   'os_version': machine['osversion'],
+                   'platform': machine['platform'],
+                   'build_name': build['name'], 'version': build['version'],
+                   'revision': build['revision'], 'branch': build['branch'],
+                   'id': build['id'], 'test_date': testrun['date']}
+        suite = testrun['suite']
+        result.results.setdefault(suite, {})
+        result.options[suite] = testrun.get('options', {})
+        for block in BLOCKS:
+            for name, values in dataset.get(block, {}).items():
+                result._extend(getattr(result, block), suite, name, values)
+    options.update(kw)
+    collection = cls(compact=compact, **options)
+    collection.results = result
+    return collection
@@ -0,0 +1,56 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from .client import DatazillaRequest
+from .pool import ConnectionPool
+from .workers import BackgroundWorkers
+
+
+class AsyncDatazillaRequest(DatazillaRequest):
+    """
+    A DatazillaRequest whose uploads do not block the caller.
+
+    send_async() and submit_async() queue uploads on a bounded set of
+    background threads and return Pending objects, which can be waited on
+    with a timeout, cancelled before they start, or given callbacks. An
+    event loop can be notified from a callback, e.g. with
+    `loop.call_soon_threadsafe`.
+    """
+
+    def __init__(self, protocol, host, project, oauth_key, oauth_secret,
+                 timeout=None, **kw):
+        """
+        - timeout : socket timeout in seconds for each upload's connection;
+          only used if no `pool` is given
+        - **kw : arguments to DatazillaRequest.__init__; `max_workers`
+          bounds the number of uploads in flight and defaults to 4
+        """
+        if kw.get('pool') is None:
+            kw['pool'] = ConnectionPool(timeout=timeout)
+        kw.setdefault('max_workers', 4)
+        DatazillaRequest.__init__(self, protocol, host, project, oauth_key,
+                                  oauth_secret, **kw)
+        self.workers = BackgroundWorkers(self.max_workers)
+
+    def send_async(self, dataset):
+        """Queue the upload of a dataset, or list of datasets; return its Pending."""
+        return self.workers.start(self.send, dataset)
+
+    def submit_async(self):
+        """
+        Queue the upload of the datasets, or batches, and return a list of
+        Pending objects, one per POST, in order.
+        """
+        return [self.send_async(payload) for payload in self.payloads()]
+
+    def close(self, cancel=False):
+        """
+        Wait for the queued uploads, or cancel those not yet started if
+        `cancel` is true, then close the pool's idle connections.
+        """
+        self.workers.shutdown(cancel)
+        DatazillaRequest.close(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(cancel=exc_type is not None)
@@ -5,16 +5,49 @@
 import inspect
 import httplib
 import oauth2 as oauth
+import socket
 import time
 import urllib
+from array import array
 from copy import deepcopy
 from urlparse import urlparse
 
+from .compare import compare_results
+from .encoders import get_encoder
+from .encoding import FormBody, compress
+from .metrics import SubmissionMetrics
+from .pool import ConnectionPool
+from .retry import RetryPolicy
+from .sentcache import dataset_key
+from .signing import OAuthSigner
+from .stats import summarize_suites
+from .workers import run_concurrently
+
 try:
     import json
 except ImportError:
     import simplejson as json
 
+class DatazillaSubmitError(Exception):
+    """
+    Raised by a concurrent DatazillaRequest.submit() when some datasets
+    could not be sent. The datasets that were sent are not affected.
+
+    - responses : list of responses in dataset order, None where sending failed
+    - errors : dict of {dataset index: exception}
+    - payloads : list of what was sent, datasets or batches, in the same
+      order
+    """
+
+    def __init__(self, responses, errors, payloads=None):
+        self.responses = responses
+        self.errors = errors
+        self.payloads = payloads
+        Exception.__init__(self, "%d of %d datasets failed to send: %s" %
+                           (len(errors), len(responses),
+                            ', '.join([repr(e) for e in errors.values()])))
+
+
 class DatazillaResult(object):
     """
     A helper class for managing testsuites and their test results.
@@ -24,13 +57,29 @@ class DatazillaResult(object):
 
 
     Each suite may also have an options dictionary
+
+    With `compact=True`, added values are stored as arrays of doubles
+    (array.array('d')) rather than lists of Python floats, which takes a
+    fraction of the memory; series holding non-numeric values, such as
+    xperf tuples, fall back to lists. Values are converted back to lists
+    when datasets are serialized, integers then becoming floats.
+
+    `compaction` maps the names of results_xperf and talos_aux series
+    ('*' matching any) to compactors from dzclient.compaction, which
+    downsample or encode those series as values are added, so that long
+    counter captures take bounded memory and upload size. Series whose
+    first values the compactor does not accept are stored as they are.
     """
-    def __init__(self, results=None, results_aux=None, results_xperf=None, talos_aux=None, options=None):
+    def __init__(self, results=None, results_aux=None, results_xperf=None, talos_aux=None, options=None, compact=False, compaction=None):
         self.results = results or {}
         self.results_aux = results_aux or {}
         self.results_xperf = results_xperf or {}
         self.talos_aux = talos_aux or {}
         self.options = options or {}
+        self.compact = compact
+        self.compaction = compaction or {}
+        self._compactors = {} # (block, suite, name) -> compactor
+        self._uncompacted = {} # (block, suite, name) -> series refused
 
     def add_testsuite(self, suite_name, results=None, results_aux=None, results_xperf=None, talos_aux=None, options=None):
         """Add a testsuite of {"testname":[values],...} to the results."""
@@ -42,45 +91,172 @@ class DatazillaResult(object):
 
     def add_test_results(self, suite_name, test_name, values):
         """Add a list of result values to the given testsuite/testname pair."""
-        suite = self.results.setdefault(suite_name, {})
-        suite.setdefault(test_name, []).extend(values)
+        self._extend(self.results, suite_name, test_name, values)
 
     def add_auxiliary_results(self, suite_name, results_name, values):
         """Add auxiliary results for a test suite"""
-        suite = self.results_aux.setdefault(suite_name, {})
-        suite.setdefault(results_name, []).extend(values)
+        self._extend(self.results_aux, suite_name, results_name, values)
 
     def add_xperf_results(self, suite_name, results_name, values):
         """Add auxiliary results for a test suite"""
-        suite = self.results_xperf.setdefault(suite_name, {})
-        suite.setdefault(results_name, []).extend(values)
+        self._extend(self.results_xperf, suite_name, results_name, values)
 
     def add_talos_auxiliary(self, suite_name, results_name, values):
         """Add auxiliary results for a test suite"""
-        suite = self.talos_aux.setdefault(suite_name, {})
-        suite.setdefault(results_name, []).extend(values)
-
-    def join_results(self, results):
-        """merge an existing DatazillaResult instance with this one"""
-
-        for suite_name, tests in results.results.items():
-            suite = self.results.setdefault(suite_name, {})
-            for test_name, values in tests.items():
-                suite.setdefault(test_name, []).extend(values)
-        for suite_name, results_aux in results.results_aux.items():
-            suite = self.results_aux.setdefault(suite_name, {})
-            for results_name, values in results_aux.items():
-                suite.setdefault(results_name, []).extend(values)
-        for suite_name, results_xperf in results.results_xperf.items():
-            suite = self.results_xperf.setdefault(suite_name, {})
-            for results_name, values in results_xperf.items():
-                suite.setdefault(results_name, []).extend(values)
-        for suite_name, talos_aux in results.talos_aux.items():
-            suite = self.talos_aux.setdefault(suite_name, {})
-            for results_name, values in talos_aux.items():
-                suite.setdefault(results_name, []).extend(values)
-        for suite_name, options in results.options.items():
-            self.options.setdefault(suite_name, {}).update(options)
+        self._extend(self.talos_aux, suite_name, results_name, values)
+
+    def join_results(self, results, take=False):
+        """
+        merge an existing DatazillaResult instance with this one
+
+        With `take=True` the value lists of `results` are moved into this
+        instance rather than copied, and `results` is left empty.
+        """
+
+        self.join_all([results], take)
+
+    def join_all(self, results, take=False):
+        """
+        Merge many DatazillaResult instances into this one, in order.
+
+        Every series is assembled in a single pass over the instances. With
+        `take=True`, a series not already held here takes over the first
+        source's value list (if its storage matches) instead of copying
+        it, and all of `results` are left empty; use this when the sources
+        are no longer needed.
+        """
+
+        results = list(results)
+        for attr in ('results', 'results_aux', 'results_xperf', 'talos_aux'):
+            data = getattr(self, attr)
+            parts = {}
+            for res in results:
+                for suite_name, series in getattr(res, attr).items():
+                    for name, values in series.items():
+                        parts.setdefault((suite_name, name), []).append(values)
+            for (suite_name, name), values_list in parts.items():
+                suite = data.setdefault(suite_name, {})
+                if (take and name not in suite and self._owns(values_list[0])
+                    and self._prototype(attr, name) is None):
+                    suite[name] = values_list.pop(0)
+                for values in values_list:
+                    self._extend(data, suite_name, name, values)
+
+        for res in results:
+            for suite_name, options in res.options.items():
+                self.options.setdefault(suite_name, {}).update(options)
+
+        if take:
+            for res in results:
+                res.results, res.results_aux, res.results_xperf = {}, {}, {}
+                res.talos_aux, res.options = {}, {}
+
+    def _owns(self, values):
+        """Whether a value list can be adopted as is by this instance."""
+        if self.compact:
+            return isinstance(values, array)
+        return type(values) is list
+
+    def summaries(self):
+        """
+        Return summary statistics of the results, as
+        {suite: {"tests": {test: summary}, "suite": suite summary}};
+        see dzclient.stats.
+        """
+        return summarize_suites(self.results)
+
+    def compare(self, baseline, **kw):
+        """
+        Compare the results with those of `baseline`, another
+        DatazillaResult, returning {suite: {test: comparison}}; see
+        dzclient.compare.compare_results for the keyword arguments.
+        """
+        return compare_results(self, baseline, **kw)
+
+    def _prototype(self, block, name):
+        """Return the compactor configured for a series, if any."""
+        if not self.compaction or block not in ('results_xperf', 'talos_aux'):
+            return None
+        return self.compaction.get(name, self.compaction.get('*'))
+
+    def _compactor(self, data, suite_name, name, stored, values):
+        """
+        Return the compactor of the data[suite_name][name] series, if it
+        is compacted, starting one if the series is new or was replaced
+        and the compactor accepts its values.
+        """
+        if data is self.results_xperf:
+            block = 'results_xperf'
+        elif data is self.talos_aux:
+            block = 'talos_aux'
+        else:
+            return None
+        prototype = self._prototype(block, name)
+        if prototype is None:
+            return None
+        key = (block, suite_name, name)
+        if stored is not None and stored is self._uncompacted.get(key):
+            return None # stored as is, the compactor not accepting it
+        compactor = self._compactors.get(key)
+        if compactor is None or stored is not compactor.output:
+            compactor = deepcopy(prototype)
+            if not (compactor.accepts(stored or ()) and
+                    compactor.accepts(values)):
+                # kept as is while this series is stored; a series
+                # replacing it is checked afresh
+                self._compactors.pop(key, None)
+                if stored is None:
+                    stored = data[suite_name][name] = self._new_series()
+                self._uncompacted[key] = stored
+                return None
+            self._uncompacted.pop(key, None)
+            if stored:
+                compactor.add(stored)
+            self._compactors[key] = compactor
+        return compactor
+
+    def _new_series(self):
+        if self.compact:
+            return array('d')
+        return []
+
+    def _extend(self, data, suite_name, name, values):
+        """Add values to the data[suite_name][name] series."""
+        suite = data.setdefault(suite_name, {})
+        stored = suite.get(name)
+        compactor = self._compactor(data, suite_name, name, stored, values)
+        if compactor is not None:
+            compactor.add(values)
+            suite[name] = compactor.output
+            return
+        stored = suite.get(name)
+        if stored is None:
+            stored = suite[name] = self._new_series()
+
+        if not isinstance(stored, array):
+            stored.extend(values)
+        elif isinstance(values, array):
+            stored.extend(values)
+        else:
+            try:
+                # fromlist leaves the array unchanged if a value is invalid
+                stored.fromlist(list(values))
+            except TypeError:
+                suite[name] = stored.tolist() + list(values)
+
+
+def copy_values(obj):
+    """
+    Return a deep copy of a dataset or part of one, with compactly stored
+    arrays of values converted to lists.
+    """
+    if isinstance(obj, dict):
+        return dict([(key, copy_values(value)) for key, value in obj.items()])
+    if isinstance(obj, list):
+        return [copy_values(value) for value in obj]
+    if isinstance(obj, array):
+        return obj.tolist()
+    return deepcopy(obj)
 
 
 class DatazillaResultsCollection(object):
@@ -88,7 +264,8 @@ class DatazillaResultsCollection(object):
 
     def __init__(self, machine_name="", os="", os_version="", platform="",
                  build_name="", version="", revision="", branch="", id="",
-                 test_date=None):
+                 test_date=None, compact=False, summaries=False,
+                 max_values=None):
         """
         - machine_name: host name of the test machine
         - os: name of the os of the test machine ('linux', 'win', 'mac')
@@ -100,6 +277,11 @@ class DatazillaResultsCollection(object):
         - branch: branch of the product under test
         - id: the build ID for which the dzresults are for; a unique identifier to which these results belong
         - test_date: time stamp (seconds since epoch) of the test run, or now if not specified
+        - compact: store joined results compactly; see DatazillaResult
+        - summaries: attach summary statistics of each suite's results to
+          its dataset, as `results_summary`
+        - max_values: leave out the raw values of tests with more than this
+          many, sending only their summaries (implies summaries)
         """
 
         self.machine_name = machine_name
@@ -114,54 +296,88 @@ class DatazillaResultsCollection(object):
         if test_date is None:
             test_date = int(time.time())
         self.test_date = test_date
-        self.results = DatazillaResult()
+        self.compact = compact
+        self.summaries = summaries
+        self.max_values = max_values
+        self.results = DatazillaResult(compact=compact)
 
-    def add_datazilla_result(self, res):
-        """Join a DatazillaResult object to the results."""
-        self.results.join_results(res)
+    def add_datazilla_result(self, res, take=False):
+        """
+        Join a DatazillaResult object to the results; with `take=True` its
+        values are moved rather than copied (see join_results).
+        """
+        self.results.join_results(res, take)
 
     def datasets(self):
-        """Return the datasets in JSON serializable form"""
-
-        perf_json = {
-            'test_machine' : {
-                'name': self.machine_name,
-                'os' : self.os,
-                'osversion': self.os_version,
-                'platform': self.platform
-            },
-            'test_build' : {
-                'name': self.build_name,
-                'version': self.version,
-                'revision': self.revision[:50],
-                'branch': self.branch,
-                'id': self.id
-            },
-            'testrun' : {
-                'date': self.test_date,
-            }
-        }
+        """
+        Return the datasets in JSON serializable form.
+
+        The datasets are deep copies and may be freely modified; see
+        `iter_datasets()` for a copy-free alternative.
+        """
+
+        return [copy_values(dataset) for dataset in self.iter_datasets()]
+
+    def json_datasets(self, encoder=None):
+        """
+        Generate the JSON text of each dataset, serialized by `encoder`, an
+        encoder from dzclient.encoders or its name (see get_encoder()).
+        """
+
+        encoder = get_encoder(encoder)
+        for dataset in self.iter_datasets():
+            yield encoder.encode(dataset)
+
+    def iter_datasets(self):
+        """
+        Generate the datasets without copying the results.
+
+        Each dataset and its header dicts are new, but the results,
+        options and auxiliary data are shared with `self.results`, so they
+        must be treated as read-only. Compactly stored values are left as
+        arrays, which the request encoders serialize as JSON lists.
+        """
 
-        datasets = []
         for suite, data in self.results.results.items():
-            dataset = deepcopy(perf_json)
-            dataset['testrun']['suite'] = suite
-            dataset['results'] = deepcopy(data)
+            dataset = {
+                'test_machine' : {
+                    'name': self.machine_name,
+                    'os' : self.os,
+                    'osversion': self.os_version,
+                    'platform': self.platform
+                },
+                'test_build' : {
+                    'name': self.build_name,
+                    'version': self.version,
+                    'revision': self.revision[:50],
+                    'branch': self.branch,
+                    'id': self.id
+                },
+                'testrun' : {
+                    'date': self.test_date,
+                    'suite': suite,
+                },
+                'results': data,
+            }
+            if self.summaries or self.max_values:
+                dataset['results_summary'] = summarize_suites({suite: data})[suite]
+            if self.max_values:
+                dataset['results'] = dict(
+                    [(test, values) for test, values in data.items()
+                     if len(values) <= self.max_values])
             options = self.results.options.get(suite)
             if options:
-                dataset['testrun']['options'] = deepcopy(options)
+                dataset['testrun']['options'] = options
             results_aux = self.results.results_aux.get(suite)
             talos_aux = self.results.talos_aux.get(suite)
             if results_aux:
-                dataset['results_aux'] = deepcopy(results_aux)
+                dataset['results_aux'] = results_aux
             if talos_aux:
-                dataset['talos_aux'] = deepcopy(talos_aux)
+                dataset['talos_aux'] = talos_aux
             results_xperf = self.results.results_xperf.get(suite)
             if results_xperf:
-                dataset['results_xperf'] = deepcopy(results_xperf)
-            datasets.append(dataset)
-
-        return datasets
+                dataset['results_xperf'] = results_xperf
+            yield dataset
 
 
 class DatazillaRequest(DatazillaResultsCollection):
@@ -173,31 +389,63 @@ class DatazillaRequest(DatazillaResultsCollection):
     """
 
     protocols = set(['http', 'https']) # supported protocols
+    compressions = set(['gzip', 'deflate']) # supported Content-Encodings
 
     @classmethod
     def create(cls, protocol, host, project, oauth_key,
-                oauth_secret, collection):
-        """create a DatazillaRequest instance from a results collection"""
+                oauth_secret, collection, take=False, **options):
+        """
+        create a DatazillaRequest instance from a results collection
+
+        - take : move the collection's results into the request rather
+          than copying them, leaving the collection empty
+        - **options : extra keyword arguments to DatazillaRequest.__init__
+        """
 
         # get attributes from the collection
         attributes, _, _, _ = inspect.getargspec(DatazillaResultsCollection.__init__)
         attributes = attributes[1:] # remove `self`
         kw = dict([(i, getattr(collection, i))
                    for i in attributes])
+        kw.update(options)
 
         # create the instance
         instance = cls(protocol, host, project, oauth_key, oauth_secret, **kw)
 
         # add the results
-        instance.add_datazilla_result(collection.results)
+        instance.add_datazilla_result(collection.results, take)
 
         return instance
 
-    def __init__(self, protocol, host, project, oauth_key, oauth_secret, **kw):
+    def __init__(self, protocol, host, project, oauth_key, oauth_secret,
+                 pool=None, max_workers=1, batch_max_bytes=None,
+                 batch_max_datasets=None, compression=None, spool=None,
+                 metrics=None, retry_policy=None, json_encoder=None,
+                 sent_cache=None, **kw):
         """
         - host : datazilla host to post to
         - project : name of the project in datazilla: http://host/project
         - oauth_key, oauth_secret : oauth credentials
+        - pool : ConnectionPool to send through; may be shared between
+          requests. A private pool is created if not given.
+        - max_workers : number of datasets submit() sends in parallel
+        - batch_max_bytes, batch_max_datasets : if either is given,
+          submit() packs datasets into batches of at most this many bytes
+          of JSON / datasets, posting each batch as a single JSON list
+        - compression : 'gzip' or 'deflate' to compress request bodies,
+          sent with a matching Content-Encoding
+        - spool : DatazillaSpool in which submit() leaves the datasets it
+          fails to send, and defer() puts datasets to be sent later
+        - metrics : object whose record() method receives timings and
+          sizes for every send() and submit(); a SubmissionMetrics
+          collector is created if not given
+        - retry_policy : RetryPolicy giving the timeouts, retries and
+          deadline of each POST; by default a POST is tried once, with the
+          pool's timeout
+        - json_encoder : encoder from dzclient.encoders, or its name,
+          serializing the datasets; defaults to the json module
+        - sent_cache : SentCache recording the datasets the server has
+          accepted, which submit() skips (see `skipped`)
         - **kw : arguments to DatazillaResultsCollection.__init__
         """
 
@@ -205,6 +453,30 @@ class DatazillaRequest(DatazillaResultsCollection):
         self.project = project
         self.oauth_key = oauth_key
         self.oauth_secret = oauth_secret
+        self.signer = None
+        if oauth_key and oauth_secret:
+            self.signer = OAuthSigner(oauth_key, oauth_secret)
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+        self.max_workers = max_workers
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_datasets = batch_max_datasets
+
+        if compression and compression not in self.compressions:
+            raise AssertionError("Compression '%s' not supported; please use one of %s" %
+                                 (compression, ', '.join(self.compressions)))
+        self.compression = compression
+        if metrics is None:
+            metrics = SubmissionMetrics()
+        self.metrics = metrics
+        if retry_policy is None:
+            retry_policy = RetryPolicy(retries=0)
+        self.retry_policy = retry_policy
+        self.json_encoder = get_encoder(json_encoder)
+        self.spool = spool
+        self.sent_cache = sent_cache
+        self.skipped = [] # datasets the last submit() found in sent_cache
 
         if protocol not in self.protocols:
             raise AssertionError("Protocol '%s' not supported; please use one of %s" %
@@ -216,67 +488,247 @@ class DatazillaRequest(DatazillaResultsCollection):
         # ensure the required parameters are given
         assert self.branch, "%s: branch required for posting" % (self.__class__.__name__)
 
-    def submit(self):
-        """Submit test data to datazilla server, return list of responses."""
+    def __enter__(self):
+        return self
 
-        responses = []
-        for dataset in self.datasets():
-            responses.append(self.send(dataset))
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        return responses
+    def close(self):
+        """Close the idle connections of this request's pool."""
+        self.pool.close()
 
-    def send(self, dataset):
-        """Send given dataset to server; returns httplib Response."""
-        path = "/%s/api/load_test" % (self.project)
-        uri = "%s://%s%s" % (self.protocol, self.host, path)
-        user = self.project
+    def submit(self, max_workers=None):
+        """
+        Submit test data to datazilla server, return list of responses.
+
+        If batching is enabled, each POST carries a batch of datasets
+        (see `batches()`) and one response per batch is returned.
+
+        With more than one worker (`max_workers`, defaulting to the
+        request's), datasets are sent in parallel and the responses are
+        returned in dataset order. A dataset that fails to send does not
+        stop the others; DatazillaSubmitError is raised once all have
+        been attempted.
+
+        If the request has a spool, datasets that fail to send, or are not
+        accepted (any status but 2xx), are spooled for a later upload
+        instead of raising; their responses are None.
 
-        params = {
-            'data': urllib.quote(json.dumps(dataset)),
-        }
+        Each POST is timed out and retried as `retry_policy` says, and its
+        deadline, if any, bounds the whole submission.
 
-        use_oauth = bool(self.oauth_key and self.oauth_secret)
-        if use_oauth:
+        If the request has a sent_cache, datasets the server has already
+        accepted are not sent again but listed in `skipped`, and those
+        accepted now are added to the cache.
+        """
 
-            params.update({'user': user,
-                           'oauth_version': "1.0",
-                           'oauth_nonce': oauth.generate_nonce(),
-                           'oauth_timestamp': int(time.time())})
+        if max_workers is None:
+            max_workers = self.max_workers
+
+        start = time.time()
+        end = self.retry_policy.end()
+        datasets = self.iter_datasets()
+        keys = None
+        self.skipped = []
+        if self.sent_cache is not None:
+            datasets, keys = self._unsent(datasets)
+        payloads = list(self.payloads(datasets))
+        datasets_time = time.time() - start
+        method = self.send
+        if self.spool is not None:
+            method = self._send_or_spool
+
+        # the policy's deadline covers the whole submission
+        def send(payload):
+            if end is None:
+                response = method(payload)
+            else:
+                response = method(payload, end)
+            if (keys is not None and response is not None and
+                200 <= response.status < 300):
+                if not isinstance(payload, list):
+                    payload = [payload]
+                for dataset in payload:
+                    self.sent_cache.add(keys[id(dataset)])
+            return response
+
+        try:
+            if max_workers <= 1:
+                responses = []
+                for payload in payloads:
+                    responses.append(send(payload))
+                return responses
+
+            responses, errors = run_concurrently(send, payloads, max_workers)
+            if errors:
+                raise DatazillaSubmitError(responses, errors, payloads)
+            return responses
+        finally:
+            if self.sent_cache is not None:
+                self.sent_cache.save()
+            self.metrics.record({'event': 'submit',
+                                 'datasets_time': datasets_time,
+                                 'payloads': len(payloads),
+                                 'skipped': len(self.skipped),
+                                 'total_time': time.time() - start})
+
+    def _unsent(self, datasets):
+        """
+        Return the datasets not in the sent_cache, adding the others to
+        `skipped`, and the cache keys of those returned, by their id().
+        """
+        destination = '%s://%s/%s' % (self.protocol, self.host, self.project)
+        unsent = []
+        keys = {}
+        for dataset in datasets:
+            key = dataset_key(dataset, destination)
+            if key in self.sent_cache:
+                self.skipped.append(dataset)
+            else:
+                unsent.append(dataset)
+                keys[id(dataset)] = key
+        return unsent, keys
+
+    def defer(self):
+        """Put all datasets in the request's spool, to be sent later."""
+        for dataset in self.iter_datasets():
+            self.spool.enqueue(dataset)
+
+    def _send_or_spool(self, payload, end=None):
+        """Send a payload, spooling its datasets unless it is accepted."""
+        try:
+            if end is None:
+                response = self.send(payload)
+            else:
+                response = self.send(payload, end)
+            if 200 <= response.status < 300:
+                return response
+            response.read() # so that its connection can be reused
+        except (socket.error, httplib.HTTPException, IOError):
+            pass
+
+        if not isinstance(payload, list):
+            payload = [payload]
+        for dataset in payload:
+            self.spool.enqueue(dataset)
+        return None
+
+    def payloads(self, datasets=None):
+        """
+        Return what submit() sends of `datasets` (by default, all the
+        request's): the batches if batching is enabled, else the datasets.
+        """
+        if datasets is None:
+            datasets = self.iter_datasets()
+        if self.batch_max_bytes or self.batch_max_datasets:
+            return self.batches(datasets)
+        return datasets
 
+    def batches(self, datasets=None):
+        """
+        Return the datasets (by default, all the request's) packed into
+        lists bounded by the request's batch_max_bytes (of serialized
+        JSON) and batch_max_datasets. A dataset larger than
+        batch_max_bytes is sent in a batch of its own.
 
-            # There is no requirement for the token in two-legged
-            # OAuth but we still need the token object.
-            token = oauth.Token(key="", secret="")
-            consumer = oauth.Consumer(key=self.oauth_key, secret=self.oauth_secret)
+        As with `iter_datasets()`, the batched datasets share their results
+        with the request.
+        """
 
-            params['oauth_token'] = token.key
-            params['oauth_consumer_key'] = consumer.key
+        batches = []
+        batch = []
+        batch_size = 0
+        if datasets is None:
+            datasets = self.iter_datasets()
+        for dataset in datasets:
+            size = len(self.json_encoder.encode(dataset)) + 2 # separator, list brackets
+            full = batch and (
+                (self.batch_max_datasets and
+                 len(batch) >= self.batch_max_datasets) or
+                (self.batch_max_bytes and
+                 batch_size + size > self.batch_max_bytes))
+            if full:
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+            batch.append(dataset)
+            batch_size += size
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def send(self, dataset, end=None):
+        """
+        Send given dataset, or list of datasets, to server; returns httplib
+        Response.
 
-            try:
-                req = oauth.Request(method="POST", url=uri, parameters=params)
-            except AssertionError, e:
-                print 'uri: %s' % uri
-                print 'params: %s' % params
-                raise
-
-            # Set the signature
-            signature_method = oauth.SignatureMethod_HMAC_SHA1()
-
-            # Sign the request
-            req.sign_request(signature_method, consumer, token)
-            body = req.to_postdata()
-        else:
-            body = urllib.urlencode(params)
+        The upload is timed out and retried as `retry_policy` says; no
+        attempt is started after `end` (a time.time() value) if given,
+        else after the policy's deadline.
+
+        The time spent in each phase of the upload, the sizes of the body
+        before and after compression, and the outcome are passed to
+        `metrics`.
+        """
+        path = "/%s/api/load_test" % (self.project)
+        uri = "%s://%s%s" % (self.protocol, self.host, path)
+
+        record = {'event': 'send',
+                  'encode_time': 0,
+                  'compress_time': 0,
+                  'datasets': 1}
+        if isinstance(dataset, list):
+            record['datasets'] = len(dataset)
+
+        def attempt(timeouts):
+            # each attempt is signed afresh, with a new nonce and timestamp
+            content, header = self._encode(dataset, uri, record)
+            # Make the POST request over a pooled keep-alive connection
+            return self.pool.request(self.protocol, self.host, "POST", path,
+                                     content, header, record, timeouts)
+
+        if end is None:
+            end = self.retry_policy.end()
+        try:
+            response = self.retry_policy.run(attempt, end, record)
+        except Exception, e:
+            record['error'] = repr(e)
+            self.metrics.record(record)
+            raise
+        record['status'] = response.status
+        self.metrics.record(record)
+        return response
+
+    def _encode(self, dataset, uri, record):
+        """
+        Return the (content, header) of a signed load_test body, adding
+        the time spent and the sizes to `record`.
+        """
+        params = {}
+        if self.signer is not None:
+            params['user'] = self.project
+            params.update(self.signer.parameters())
+
+        # The dataset is serialized, encoded and signed incrementally;
+        # large bodies are streamed to the connection as they are read.
+        start = time.time()
+        body = FormBody(dataset, params, self.signer, uri,
+                        dumps=self.json_encoder.dumps)
+        record['encode_time'] += time.time() - start
 
         # Build the header
         header = {'Content-type': 'application/x-www-form-urlencoded'}
 
-        # Make the POST request
-        conn = None
-        if self.protocol == 'http':
-            conn = httplib.HTTPConnection(self.host)
-        else:
-            conn = httplib.HTTPSConnection(self.host)
-
-        conn.request("POST", path, body, header)
-        return conn.getresponse()
+        content = body.content()
+        if self.compression:
+            start = time.time()
+            content = compress(body, self.compression)
+            record['compress_time'] += time.time() - start
+            header['Content-Encoding'] = self.compression
+        header['Content-Length'] = str(len(content))
+
+        record['body_bytes'] = len(body)
+        record['sent_bytes'] = len(content)
+        return content, header
@@ -0,0 +1,131 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Collection of results from worker processes.
+
+Returning a DatazillaResult from a worker pickles each of its values in
+turn, and the parent then unpickles and joins them value by value. A
+PackedResult instead holds the numeric series as one string of packed
+doubles, in the columns of dzclient.archive, so it crosses the process
+boundary as a single block and each series is unpacked in one copy:
+
+    def run_page(page):
+        res = DatazillaResult()
+        res.add_test_results('tp5', page, measure(page))
+        return res
+
+    collector = ProcessCollector(processes=4, compact=True)
+    try:
+        req.add_datazilla_result(collector.map(run_page, pages), take=True)
+    finally:
+        collector.close()
+
+Workers managed otherwise can send PackedResult(res) through any
+multiprocessing queue or pipe, and the parent join the unpacked results
+with DatazillaResult.join_all(..., take=True).
+"""
+
+from cStringIO import StringIO
+
+from . import archive
+from .client import DatazillaResult
+
+
+class PackedResult(object):
+    """
+    A DatazillaResult packed for transfer between processes: `data`, the
+    numeric series as packed doubles, with the `columns` indexing them,
+    and the `options`, `suites` and `other` (non-numeric) series.
+    """
+
+    def __init__(self, result):
+        f = StringIO()
+        self.columns, self.other = archive.write_columns(result, f)
+        self.data = f.getvalue()
+        self.options = result.options
+        self.suites = result.results.keys()
+
+    def unpack(self, compact=False):
+        """Return the packed results as a DatazillaResult."""
+        return archive.build_result(self.data, self.options, self.suites,
+                                    self.columns, self.other, compact)
+
+
+class _PackedCall(object):
+    """Calls `func` in a worker and packs the DatazillaResult it returns."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        return PackedResult(self.func(item))
+
+
+def join_packed(packed, compact=False):
+    """
+    Return a DatazillaResult joining the PackedResults of an iterable, in
+    order, without copying any series twice.
+    """
+    result = DatazillaResult(compact=compact)
+    results = []
+    for p in packed:
+        for suite in p.suites:
+            result.results.setdefault(suite, {})
+        results.append(p.unpack(compact))
+    result.join_all(results, take=True)
+    return result
+
+
+class ProcessCollector(object):
+    """
+    Runs functions returning DatazillaResults in a pool of `processes`
+    worker processes (one per CPU by default) and joins their results.
+    With `compact`, the joined result stores its values as arrays (see
+    DatazillaResult). Requires the multiprocessing module (Python 2.6 or
+    later).
+    """
+
+    def __init__(self, processes=None, compact=False):
+        # imported here, so that dzclient itself imports on Python 2.5
+        import multiprocessing
+        self.compact = compact
+        self.pool = multiprocessing.Pool(processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def map(self, func, iterable, chunksize=1):
+        """
+        Call func(item) in the workers for each item of `iterable` and
+        return a DatazillaResult joining the results in order. `func` must
+        be picklable, e.g. a module-level function. An exception raised
+        by `func` is raised here.
+        """
+        packed = self.pool.imap(_PackedCall(func), iterable, chunksize)
+        return join_packed(packed, self.compact)
+
+    def collect(self, collection, func, iterable, chunksize=1):
+        """
+        Like map(), but add the joined result to `collection`, a
+        DatazillaResultsCollection such as a DatazillaRequest.
+        """
+        collection.add_datazilla_result(
+            self.map(func, iterable, chunksize), take=True)
+
+    def close(self):
+        """Let the workers finish and wait for them to exit."""
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """Stop the workers at once."""
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,262 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compaction of long counter series, such as memory, I/O or CPU samples
+added with add_xperf_results() and add_talos_auxiliary().
+
+A DatazillaResult made with `compaction`, a dict of series names to
+compactors ('*' matching any series), feeds the values of those
+results_xperf and talos_aux series through a copy of the compactor, per
+suite and series, as they are added. Only the compacted series is kept,
+and sent in place of the values. A series whose first values the
+compactor does not accept, such as xperf (file, reads, writes) tuples
+for Buckets, is kept as is:
+
+    res = DatazillaResult(compaction={'memory': Downsample(500),
+                                      'io_bytes': RunLength(delta=True),
+                                      '*': Buckets(100, percentiles=(95,))})
+
+Results holding compacted series should not be joined to others holding
+the same series, as the compacted forms cannot all be concatenated.
+"""
+
+from .stats import percentile
+
+
+NUMBER_TYPES = frozenset([int, long, float])
+
+
+def number_type(cls):
+    """
+    Whether instances of a type are real numbers: the built-in ones, or
+    others convertible to float, such as NumPy's, but not complex.
+    """
+    return (cls in NUMBER_TYPES or
+            (hasattr(cls, '__float__') and not issubclass(cls, complex)))
+
+
+def numeric(values):
+    """Whether all of `values` are numbers."""
+    # the types are collected at C speed, so that each is checked once
+    for cls in set(map(type, values)):
+        if not number_type(cls):
+            return False
+    return True
+
+
+class Compactor(object):
+    """
+    Compacts a series incrementally. `output` is the compacted series, the
+    list sent in place of the values; it is kept up to date, in place, as
+    values are added. This base class keeps the values as they are.
+    """
+
+    def __init__(self):
+        self.output = []
+
+    def accepts(self, values):
+        """Whether the values can be added to the series."""
+        return True
+
+    def add(self, values):
+        """
+        Add values to the series. Raises TypeError, leaving the series
+        unchanged, if they are not accepted.
+        """
+        self.output.extend(values)
+
+    def _check(self, values):
+        values = list(values)
+        if not self.accepts(values):
+            raise TypeError("%s cannot compact %r" %
+                            (self.__class__.__name__, values[:3]))
+        return values
+
+
+def lttb(xs, ys, points):
+    """
+    Return the indices of the `points` points of the series (xs, ys)
+    chosen by the Largest-Triangle-Three-Buckets algorithm, which keeps
+    the series' shape: its first and last point, and from each of
+    `points` - 2 buckets the point forming the largest triangle with the
+    previous point kept and the mean of the next bucket.
+    """
+    length = len(xs)
+    if points >= length:
+        return range(length)
+    if points < 3:
+        return [0, length - 1][:points]
+
+    every = (length - 2) / float(points - 2)
+    kept = [0]
+    previous = 0
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        mean_x = sum(xs[end:next_end]) / float(next_end - end)
+        mean_y = sum(ys[end:next_end]) / float(next_end - end)
+
+        x, y = xs[previous], ys[previous]
+        best, best_area = start, -1
+        for i in range(start, end):
+            area = abs((x - mean_x) * (ys[i] - y) - (x - xs[i]) * (mean_y - y))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+        previous = best
+    kept.append(length - 1)
+    return kept
+
+
+class Downsample(Compactor):
+    """
+    Keeps at most about `points` points of a series, chosen by LTTB (see
+    lttb()) so that its peaks and shape survive. Values are numbers, at
+    successive positions, or [x, y, ...] items, which are kept whole.
+    Values are held until there are twice `points`, and then downsampled.
+    With `index`, numbers are output as [position, value] pairs, so that
+    the spacing of the points kept is known.
+    """
+
+    def __init__(self, points=1000, index=False):
+        Compactor.__init__(self)
+        self.points = points
+        self.index = index
+        self.count = 0 # values added
+        self._xs = []
+        self._ys = []
+
+    def accepts(self, values):
+        if numeric(values):
+            return True
+        for value in values:
+            if isinstance(value, (list, tuple)):
+                if not numeric(value[:2]):
+                    return False
+            elif not number_type(type(value)):
+                return False
+        return True
+
+    def add(self, values):
+        for value in self._check(values):
+            if isinstance(value, (list, tuple)):
+                x, y, item = value[0], value[1], value
+            else:
+                x, y, item = self.count, value, value
+                if self.index:
+                    item = [x, value]
+            self.count += 1
+            self._xs.append(x)
+            self._ys.append(y)
+            self.output.append(item)
+        if len(self.output) > 2 * self.points:
+            kept = lttb(self._xs, self._ys, self.points)
+            self._xs = [self._xs[i] for i in kept]
+            self._ys = [self._ys[i] for i in kept]
+            self.output[:] = [self.output[i] for i in kept]
+
+
+class RunLength(Compactor):
+    """
+    Encodes a series as [value, count] runs of equal values, or with
+    `delta`, of equal differences from the previous value (the first from
+    0), which also compacts counters rising at a steady rate. The encoding
+    is lossless, except that float differences may be rounded; see
+    decode().
+    """
+
+    def __init__(self, delta=False):
+        Compactor.__init__(self)
+        self.delta = delta
+        self._previous = 0
+
+    def accepts(self, values):
+        return not self.delta or numeric(values)
+
+    def add(self, values):
+        output = self.output
+        for value in self._check(values):
+            if self.delta:
+                value, self._previous = value - self._previous, value
+            if output and output[-1][0] == value:
+                output[-1][1] += 1
+            else:
+                output.append([value, 1])
+
+    @staticmethod
+    def decode(runs, delta=False):
+        """Return the values of a run-length encoded series."""
+        values = []
+        total = 0
+        for value, count in runs:
+            if delta:
+                for i in range(count):
+                    total += value
+                    values.append(total)
+            else:
+                values.extend([value] * count)
+        return values
+
+
+class Buckets(Compactor):
+    """
+    Summarizes each `size` successive values of a series as a bucket,
+    [count, min, max, mean] followed by the given `percentiles` (numbers
+    from 0 to 100), the last bucket covering the values added since the
+    last complete one. Past `max_buckets`, adjacent buckets are merged
+    pairwise and the bucket size doubles; the counts, minima, maxima and
+    means of merged buckets are exact, their percentiles the mean of the
+    two merged.
+    """
+
+    def __init__(self, size=100, percentiles=(), max_buckets=500):
+        Compactor.__init__(self)
+        self.size = size
+        self.percentiles = tuple(percentiles)
+        self.max_buckets = max_buckets
+        self._pending = [] # values of the incomplete last bucket
+
+    def summarize(self, values):
+        """Return the bucket of a list of values."""
+        ordered = sorted(values)
+        bucket = [len(ordered), ordered[0], ordered[-1],
+                  sum(ordered) / float(len(ordered))]
+        bucket.extend([percentile(ordered, p / 100.0)
+                       for p in self.percentiles])
+        return bucket
+
+    def accepts(self, values):
+        return numeric(values)
+
+    def add(self, values):
+        values = self._check(values)
+        if self._pending:
+            self.output.pop() # replaced when values are added
+        pending = self._pending
+        for value in values:
+            pending.append(value)
+            if len(pending) >= self.size:
+                self.output.append(self.summarize(pending))
+                del pending[:]
+                if self.max_buckets and len(self.output) > self.max_buckets:
+                    self._merge()
+        if pending:
+            self.output.append(self.summarize(pending))
+
+    def _merge(self):
+        merged = []
+        output = self.output
+        for i in range(0, len(output) - 1, 2):
+            first, second = output[i], output[i + 1]
+            count = first[0] + second[0]
+            merged.append(
+                [count, min(first[1], second[1]), max(first[2], second[2]),
+                 (first[3] * first[0] + second[3] * second[0]) / count] +
+                [(a + b) / 2.0 for a, b in zip(first[4:], second[4:])])
+        if len(output) % 2:
+            merged.append(output[-1])
+        output[:] = merged
+        self.size *= 2
@@ -0,0 +1,379 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Comparison of a run's results with a baseline run, to flag regressions
+before the results are even submitted:
+
+    comparison = compare_results(res, baseline)
+    attach_comparison(res, comparison)
+    for suite, test, figures in regressions(comparison):
+        print "%s/%s: %+.1f%%" % (suite, test, figures['delta_pct'])
+
+Each test present in both runs is compared with Welch's t-test and the
+Mann-Whitney U test. With NumPy installed all tests are compared at once,
+in array operations over every suite; otherwise in pure Python, with the
+same figures. The comparison of a test is a dict of:
+
+- count, baseline_count : numbers of replicates
+- mean, baseline_mean : their means
+- delta : mean - baseline_mean, and delta_pct, as a percentage of the
+  baseline mean (None if that is 0)
+- ci_low, ci_high : the Welch confidence interval of delta
+- t, df, t_pvalue : Welch's t statistic (None if neither run varies),
+  its degrees of freedom and two-sided p-value
+- u, u_pvalue : the Mann-Whitney U statistic of the run and its two-sided
+  p-value, by the normal approximation with tie and continuity corrections
+- verdict : 'regression', 'improvement', 'unchanged', or 'insufficient'
+  if either run has fewer than two replicates (the statistics are then
+  None)
+"""
+
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERDICTS = ('regression', 'improvement', 'unchanged', 'insufficient')
+METHODS = ('welch', 'mannwhitney')
+
+_LANCZOS = (76.18009172947146, -86.50532032941677, 24.01409824083091,
+            -1.231739572450155, 0.1208650973866179e-2, -0.5395239384953e-5)
+_ERFC = (-1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+         0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277)
+_NAN = float('nan')
+_TINY = 1e-300
+_EPSILON = 1e-13
+
+
+# The special functions below take either floats, with _ScalarMath as `m`,
+# or NumPy arrays, with numpy as `m`, so both paths share one definition.
+
+class _ScalarMath(object):
+    """The NumPy functions used by the special functions, for floats."""
+    log = staticmethod(math.log)
+    exp = staticmethod(math.exp)
+    sqrt = staticmethod(math.sqrt)
+    absolute = staticmethod(abs)
+    all = staticmethod(bool)
+
+    @staticmethod
+    def where(condition, x, y):
+        if condition:
+            return x
+        return y
+
+
+def _lgamma(x, m):
+    """Log of the gamma function of x > 0, by the Lanczos approximation."""
+    tmp = x + 5.5
+    tmp = tmp - (x + 0.5) * m.log(tmp)
+    series = 1.000000000190015
+    y = x
+    for coefficient in _LANCZOS:
+        y = y + 1
+        series = series + coefficient / y
+    return m.log(2.5066282746310005 * series / x) - tmp
+
+
+def _betacf(a, b, x, m):
+    """Continued fraction of the incomplete beta function (modified Lentz)."""
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    d = 1.0 / m.where(m.absolute(d) < _TINY, _TINY, d)
+    h = d
+    for i in range(1, 301):
+        i2 = 2 * i
+        for numerator in (i * (b - i) * x / ((qam + i2) * (a + i2)),
+                          -(a + i) * (qab + i) * x / ((a + i2) * (qap + i2))):
+            d = 1.0 + numerator * d
+            d = 1.0 / m.where(m.absolute(d) < _TINY, _TINY, d)
+            c = 1.0 + numerator / c
+            c = m.where(m.absolute(c) < _TINY, _TINY, c)
+            h = h * d * c
+        if m.all(m.absolute(d * c - 1.0) < _EPSILON):
+            break
+    return h
+
+
+def _betainc(a, b, x, m):
+    """The regularized incomplete beta function I_x(a, b)."""
+    inside = (x > 0) & (x < 1)
+    x_in = m.where(inside, x, 0.5)
+    front = m.exp(_lgamma(a + b, m) - _lgamma(a, m) - _lgamma(b, m) +
+                  a * m.log(x_in) + b * m.log(1.0 - x_in))
+    # the fraction converges quickly below (a + 1) / (a + b + 2)
+    flip = x_in >= (a + 1.0) / (a + b + 2.0)
+    fa = m.where(flip, b, a)
+    value = front * _betacf(fa, m.where(flip, a, b),
+                            m.where(flip, 1.0 - x_in, x_in), m) / fa
+    value = m.where(flip, 1.0 - value, value)
+    return m.where(inside, value, m.where(x <= 0, 0.0, 1.0))
+
+
+def _t_pvalue(t, df, m):
+    """Two-sided p-value of Student's t with df degrees of freedom."""
+    return _betainc(df / 2.0, 0.5, df / (df + t * t), m)
+
+
+def _t_critical(df, confidence, m):
+    """The t beyond which lies 1 - confidence of both tails, by bisection."""
+    alpha = 1.0 - confidence
+    low = df * 0.0
+    high = low + 1.0
+    for i in range(64):
+        beyond = _t_pvalue(high, df, m) <= alpha
+        if m.all(beyond):
+            break
+        high = m.where(beyond, high, high * 2)
+    for i in range(48):
+        middle = (low + high) / 2
+        above = _t_pvalue(middle, df, m) > alpha
+        low = m.where(above, middle, low)
+        high = m.where(above, high, middle)
+    return (low + high) / 2
+
+
+def _erfc(x, m):
+    """The complementary error function, to a relative error of 1.2e-7."""
+    z = m.absolute(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    polynomial = 0.0
+    for coefficient in reversed(_ERFC[1:]):
+        polynomial = t * (coefficient + polynomial)
+    value = t * m.exp(-z * z + _ERFC[0] + polynomial)
+    return m.where(x >= 0, value, 2.0 - value)
+
+
+def _statistics(n1, mean1, var1, n2, mean2, var2, u, ties, confidence, m):
+    """
+    Return (delta, half width of its interval, t, df, t p-value, U
+    p-value) from the counts, means and variances of the two runs, the
+    U statistic of the first and the tie term sum(t**3 - t) of the ranks.
+    """
+    delta = mean1 - mean2
+    se1, se2 = var1 / n1, var2 / n2
+    variance = se1 + se2
+    spread = variance > 0
+    safe = m.where(spread, variance, 1.0)
+    se = m.sqrt(safe)
+    df = m.where(spread, safe * safe / (
+        m.where(spread, se1 * se1 / (n1 - 1) + se2 * se2 / (n2 - 1), 1.0)),
+        n1 + n2 - 2.0)
+    df = m.where(df > 0, df, 1.0)
+    t = m.where(spread, delta / se, _NAN)
+    t_pvalue = m.where(spread, _t_pvalue(t, df, m),
+                       m.where(delta == 0, 1.0, 0.0))
+    half_width = m.where(spread, _t_critical(df, confidence, m) * se, 0.0)
+
+    n = n1 + n2
+    sigma2 = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    ranked = sigma2 > 0
+    z = (m.absolute(u - n1 * n2 / 2.0) - 0.5) / m.sqrt(
+        m.where(ranked, sigma2, 1.0))
+    z = m.where(z > 0, z, 0.0)
+    u_pvalue = m.where(ranked, _erfc(z / math.sqrt(2), m), 1.0)
+    u_pvalue = m.where(u_pvalue < 1, u_pvalue, 1.0)
+    return delta, half_width, t, df, t_pvalue, u_pvalue
+
+
+def _figures_python(pairs, confidence):
+    figures = []
+    for values, baseline in pairs:
+        values, baseline = list(values), list(baseline)
+        n1, n2 = len(values), len(baseline)
+        mean1, mean2 = math.fsum(values) / n1, math.fsum(baseline) / n2
+        var1 = math.fsum([(v - mean1) ** 2 for v in values]) / (n1 - 1)
+        var2 = math.fsum([(v - mean2) ** 2 for v in baseline]) / (n2 - 1)
+
+        ranked = sorted([(v, 1) for v in values] + [(v, 0) for v in baseline])
+        rank_sum = ties = 0.0
+        start = 0
+        while start < len(ranked):
+            end = start
+            while end < len(ranked) and ranked[end][0] == ranked[start][0]:
+                end += 1
+            count = end - start
+            rank = (start + end + 1) / 2.0 # mean of ranks start+1..end
+            rank_sum += rank * sum([first for v, first in ranked[start:end]])
+            ties += count ** 3 - count
+            start = end
+        u = rank_sum - n1 * (n1 + 1) / 2.0
+
+        figures.append((n1, mean1, n2, mean2, u) + _statistics(
+            float(n1), mean1, var1, float(n2), mean2, var2, u, ties,
+            confidence, _ScalarMath))
+    return figures
+
+
+def _as_array(values):
+    if isinstance(values, array) and values.typecode == 'd':
+        return numpy.frombuffer(values, dtype=numpy.float64)
+    return numpy.asarray(values, dtype=numpy.float64)
+
+
+def _figures_numpy(pairs, confidence):
+    if not pairs:
+        return []
+    arrays = [(_as_array(v), _as_array(b)) for v, b in pairs]
+    first = numpy.array([len(values) for values, baseline in arrays])
+    second = numpy.array([len(baseline) for values, baseline in arrays])
+
+    def moments(data, counts):
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        means = numpy.add.reduceat(data, starts) / counts
+        deviations = data - numpy.repeat(means, counts)
+        variances = numpy.add.reduceat(deviations * deviations,
+                                       starts) / (counts - 1)
+        return means, variances
+
+    mean1, var1 = moments(numpy.concatenate([v for v, b in arrays]), first)
+    mean2, var2 = moments(numpy.concatenate([b for v, b in arrays]), second)
+
+    # rank the pooled values of each test: sort each test's values (one
+    # sort per test being much faster than one sort by test and value),
+    # number them from 1 and average the ranks of runs of ties
+    sizes = first + second
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    pooled = numpy.concatenate([part for pair in arrays for part in pair])
+    is_first = numpy.repeat(numpy.tile([1.0, 0.0], len(arrays)),
+                            numpy.column_stack((first, second)).ravel())
+    order = numpy.concatenate([
+        start + numpy.argsort(pooled[start:start + size])
+        for start, size in zip(starts.tolist(), sizes.tolist())])
+    data, is_first = pooled[order], is_first[order]
+    group = numpy.repeat(numpy.arange(len(arrays)), sizes)
+    positions = numpy.arange(len(data)) - starts[group] + 1.0
+    new = numpy.ones(len(data), dtype=bool)
+    new[1:] = (data[1:] != data[:-1]) | (group[1:] != group[:-1])
+    run_starts = numpy.flatnonzero(new)
+    run_counts = numpy.diff(numpy.append(run_starts, len(data)))
+    run_ranks = positions[run_starts] + (run_counts - 1) / 2.0
+    ranks = numpy.repeat(run_ranks, run_counts)
+    rank_sums = numpy.bincount(group, weights=ranks * is_first,
+                               minlength=len(arrays))
+    ties = numpy.bincount(group[run_starts],
+                          weights=run_counts ** 3.0 - run_counts,
+                          minlength=len(arrays))
+    n1, n2 = first.astype(float), second.astype(float)
+    u = rank_sums - n1 * (n1 + 1) / 2
+
+    old = numpy.seterr(all='ignore')
+    try:
+        statistics = _statistics(n1, mean1, var1, n2, mean2, var2, u, ties,
+                                 confidence, numpy)
+    finally:
+        numpy.seterr(**old)
+    columns = [first, mean1, second, mean2, u] + list(statistics)
+    return zip(*[column.tolist() for column in columns])
+
+
+def compare_results(current, baseline, confidence=0.95, alpha=0.05,
+                    method='welch', min_change=0.0, lower_is_better=True):
+    """
+    Compare the tests of `current`, a DatazillaResult, with those of
+    `baseline`; returns {suite: {test: comparison}} for the tests in both.
+
+    - confidence : level of the confidence intervals of the deltas
+    - alpha : p-value below which a change is significant
+    - method : 'welch' or 'mannwhitney', the test giving the verdict
+    - min_change : smallest change, as a percentage of the baseline mean,
+      counted as a regression or improvement
+    - lower_is_better : whether lower values are better, as for times
+    """
+    if method not in METHODS:
+        raise AssertionError("Method '%s' not supported; please use one of %s"
+                             % (method, ', '.join(METHODS)))
+
+    keys = []
+    pairs = []
+    comparison = {}
+    for suite, tests in current.results.items():
+        baseline_tests = baseline.results.get(suite, {})
+        for test, values in tests.items():
+            if test not in baseline_tests:
+                continue
+            base = baseline_tests[test]
+            if len(values) < 2 or len(base) < 2:
+                comparison.setdefault(suite, {})[test] = _insufficient(
+                    values, base)
+                continue
+            keys.append((suite, test))
+            pairs.append((values, base))
+
+    if numpy is not None:
+        figures = _figures_numpy(pairs, confidence)
+    else:
+        figures = _figures_python(pairs, confidence)
+
+    for (suite, test), row in zip(keys, figures):
+        (count, mean, baseline_count, baseline_mean, u, delta, half_width,
+         t, df, t_pvalue, u_pvalue) = row
+        delta_pct = None
+        if baseline_mean:
+            delta_pct = 100.0 * delta / abs(baseline_mean)
+        pvalue = t_pvalue
+        if method == 'mannwhitney':
+            pvalue = u_pvalue
+        verdict = 'unchanged'
+        if (pvalue < alpha and delta and
+            (delta_pct is None or abs(delta_pct) >= min_change)):
+            if (delta > 0) == bool(lower_is_better):
+                verdict = 'regression'
+            else:
+                verdict = 'improvement'
+        if t != t:
+            t = None # neither run varies
+        comparison.setdefault(suite, {})[test] = {
+            'count': int(count), 'baseline_count': int(baseline_count),
+            'mean': mean, 'baseline_mean': baseline_mean,
+            'delta': delta, 'delta_pct': delta_pct,
+            'ci_low': delta - half_width, 'ci_high': delta + half_width,
+            't': t, 'df': df, 't_pvalue': t_pvalue,
+            'u': u, 'u_pvalue': u_pvalue,
+            'verdict': verdict}
+    return comparison
+
+
+def _insufficient(values, baseline):
+    def mean(values):
+        if not len(values):
+            return None
+        return math.fsum(values) / len(values)
+
+    figures = dict([(name, None) for name in
+                    ('delta', 'delta_pct', 'ci_low', 'ci_high', 't', 'df',
+                     't_pvalue', 'u', 'u_pvalue')])
+    figures.update({'count': len(values), 'baseline_count': len(baseline),
+                    'mean': mean(values), 'baseline_mean': mean(baseline),
+                    'verdict': 'insufficient'})
+    if len(values) and len(baseline):
+        figures['delta'] = figures['mean'] - figures['baseline_mean']
+    return figures
+
+
+def regressions(comparison, verdict='regression'):
+    """
+    Return the (suite, test, comparison) of the tests with a verdict,
+    largest relative changes first.
+    """
+    found = [(suite, test, figures)
+             for suite, tests in comparison.items()
+             for test, figures in tests.items()
+             if figures['verdict'] == verdict]
+    found.sort(key=lambda item: -abs(item[2]['delta_pct'] or 0))
+    return found
+
+
+def attach_comparison(result, comparison, key='baseline_comparison'):
+    """
+    Add the comparison of each suite to its options in `result`, a
+    DatazillaResult, so that it is submitted with the suite's dataset.
+    """
+    for suite, tests in comparison.items():
+        result.options.setdefault(suite, {})[key] = tests
@@ -0,0 +1,111 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+JSON encoders for datasets.
+
+An encoder has a `dumps(obj)` method serializing a JSON value, which
+FormBody calls on the pieces of a dataset (keys, scalars and lists of at
+most LIST_SLICE values) as it walks it, and an `encode(obj)` method
+returning the JSON text of a whole dataset. Encoders are selected by name
+with get_encoder():
+
+- 'json' : the json module (or simplejson); the default
+- 'ujson' : UltraJSON, when installed
+- 'floats' : the json module, but lists of floats are written with a
+  fixed number of significant digits, which is much faster and smaller
+  for float-heavy payloads
+"""
+
+from array import array
+
+from .encoding import dumps, iter_json
+
+
+class StandardEncoder(object):
+    """Encodes JSON with the json module, or simplejson."""
+
+    name = 'json'
+
+    def dumps(self, obj):
+        return dumps(obj)
+
+    def encode(self, obj):
+        return self.dumps(obj)
+
+
+class UltraJSONEncoder(StandardEncoder):
+    """
+    Encodes JSON with UltraJSON. Its output is compact (without spaces
+    after separators) and its floats have at most `double_precision`
+    decimal places.
+    """
+
+    name = 'ujson'
+
+    def __init__(self, double_precision=15):
+        import ujson # raises ImportError if not installed
+        self._dumps = ujson.dumps
+        self.double_precision = double_precision
+
+    def dumps(self, obj):
+        try:
+            return self._dumps(obj, double_precision=self.double_precision)
+        except (TypeError, OverflowError):
+            # arrays, nested in a value ujson cannot serialize
+            return StandardEncoder.dumps(self, obj)
+
+    def encode(self, obj):
+        return ''.join(iter_json(obj, self.dumps))
+
+
+class FloatListEncoder(StandardEncoder):
+    """
+    Encodes JSON with the json module, except for lists and arrays of
+    floats, whose values are written with `precision` significant digits
+    (as '%g' does). The default, 17, keeps every double exact; fewer
+    digits give smaller, lossy payloads, e.g. 123.456789 is written as
+    123.457 with 6. Lists holding anything but floats, and lists with
+    non-finite values, are left to the json module.
+    """
+
+    name = 'floats'
+    _float_type = set([float])
+
+    def __init__(self, precision=17):
+        self.precision = precision
+        self.format = '%%.%dg' % precision
+
+    def dumps(self, obj):
+        if (isinstance(obj, array) and obj.typecode in 'fd') or (
+                isinstance(obj, list) and obj and
+                set(map(type, obj)) == self._float_type):
+            text = ', '.join([self.format] * len(obj)) % tuple(obj)
+            if 'n' not in text: # as in nan and inf
+                return '[' + text + ']'
+        return StandardEncoder.dumps(self, obj)
+
+    def encode(self, obj):
+        return ''.join(iter_json(obj, self.dumps))
+
+
+ENCODERS = {'json': StandardEncoder,
+            'ujson': UltraJSONEncoder,
+            'floats': FloatListEncoder}
+
+
+def get_encoder(encoder=None):
+    """
+    Return an encoder given one, or its name in ENCODERS; None gives the
+    default, StandardEncoder. Raises ImportError if the encoder's module
+    is not installed.
+    """
+    if encoder is None:
+        return StandardEncoder()
+    if isinstance(encoder, basestring):
+        if encoder not in ENCODERS:
+            raise AssertionError("JSON encoder '%s' not supported; please use one of %s" %
+                                 (encoder, ', '.join(sorted(ENCODERS))))
+        return ENCODERS[encoder]()
+    return encoder
@@ -0,0 +1,280 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import re
+import urllib
+import urlparse
+import zlib
+from array import array
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+CHUNK_SIZE = 1 << 16 # bytes of JSON encoded at a time
+BUFFER_LIMIT = 1 << 20 # bodies up to this size are built in memory
+LIST_SLICE = 1024 # values of a long list serialized at a time
+
+
+def json_default(obj):
+    """`default` hook letting json serialize arrays of values as lists."""
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def dumps(obj):
+    """Serialize obj to JSON, with arrays as lists."""
+    return json.dumps(obj, default=json_default)
+
+
+def iter_json(obj, dumps=dumps):
+    """
+    Serialize obj to JSON in pieces, yielding the same text as dumps(obj).
+
+    Dicts, and lists of dicts such as batches of datasets, are walked so
+    that no piece is larger than a slice of LIST_SLICE values of a single
+    list. Arrays are serialized as lists.
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        first = True
+        for key, value in obj.items():
+            if first:
+                first = False
+            else:
+                yield ', '
+            if not isinstance(key, basestring):
+                key = dumps(key) # as json does for non-string keys
+            yield dumps(key) + ': '
+            for piece in iter_json(value, dumps):
+                yield piece
+        yield '}'
+    elif isinstance(obj, (list, tuple)) and obj and isinstance(obj[0], dict):
+        yield '['
+        for i, value in enumerate(obj):
+            if i:
+                yield ', '
+            for piece in iter_json(value, dumps):
+                yield piece
+        yield ']'
+    elif isinstance(obj, (list, tuple, array)) and len(obj) > LIST_SLICE:
+        yield '['
+        for start in range(0, len(obj), LIST_SLICE):
+            if start:
+                yield ', '
+            values = obj[start:start + LIST_SLICE]
+            if isinstance(values, array):
+                values = values.tolist()
+            yield dumps(values)[1:-1]
+        yield ']'
+    elif isinstance(obj, array):
+        yield dumps(obj.tolist())
+    else:
+        yield dumps(obj)
+
+
+def iter_chunks(pieces, size=CHUNK_SIZE):
+    """Join an iterable of strings into chunks of roughly `size` bytes."""
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def compress(pieces, encoding, level=6):
+    """
+    Compress an iterable of strings, such as a FormBody, for the given
+    HTTP Content-Encoding ('gzip' or 'deflate') and return the result.
+    """
+    wbits = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}[encoding]
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    compressed = [compressor.compress(piece) for piece in pieces]
+    compressed.append(compressor.flush())
+    return ''.join(compressed)
+
+
+def escape(s):
+    """Escape a string as in the OAuth signature base string."""
+    return urllib.quote(s, safe='~')
+
+
+def normalize_url(url):
+    """Return url as used in the OAuth signature, without a default port."""
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    if scheme == 'http' and netloc.endswith(':80'):
+        netloc = netloc[:-3]
+    elif scheme == 'https' and netloc.endswith(':443'):
+        netloc = netloc[:-4]
+    return urlparse.urlunsplit((scheme, netloc, path, None, None))
+
+
+def form_quote(s):
+    """Quote a form value as urllib.urlencode does, with spaces as %20."""
+    return urllib.quote(str(s), safe='')
+
+
+# The `data` parameter is JSON quoted once by the client and again by form
+# encoding; both quotings are applied in one pass through this table.
+_DATA_QUOTES = dict([(chr(i), form_quote(urllib.quote(chr(i))))
+                     for i in range(256)])
+_DATA_UNSAFE = re.compile('[^A-Za-z0-9_.-]')
+
+
+def data_quote(s):
+    """Return form_quote(urllib.quote(s))."""
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return _DATA_UNSAFE.sub(lambda m: _DATA_QUOTES[m.group()], s)
+
+
+def signature_escape(piece):
+    """
+    Return escape() of a form-encoded piece of the body, as it appears in
+    the signature base string (where '~' is left unescaped).
+    """
+    # a form-encoded string only has '%', '=' and '&' left to escape
+    return piece.replace('%7E', '~').replace('%', '%25').replace(
+        '=', '%3D').replace('&', '%26')
+
+
+class FormBody(object):
+    """
+    An application/x-www-form-urlencoded request body whose `data`
+    parameter is a percent-encoded JSON document, as expected by the
+    datazilla load_test API.
+
+    The JSON is serialized and encoded incrementally: a first pass
+    computes the length (and OAuth signature), and bodies larger than
+    `buffer_limit` are then produced again, chunk by chunk, as they are
+    read, so the full payload is never held in memory.
+
+    The body is equivalent to the one the oauth2 library produces for the
+    same parameters, with the parameters in sorted order.
+    """
+
+    def __init__(self, data, params=None, signer=None, url=None,
+                 method="POST", dumps=dumps, buffer_limit=BUFFER_LIMIT):
+        """
+        - data : JSON serializable object to send as the `data` parameter
+        - params : dict of further form parameters, including the OAuth
+          parameters from signer.parameters() if the body is signed
+        - signer : optional OAuthSigner with which to sign the body, adding
+          an oauth_signature parameter
+        - url, method : the request the body is signed for
+        - dumps : function serializing JSON values, such as the dumps
+          method of an encoder from dzclient.encoders
+        - buffer_limit : largest body kept in memory rather than streamed
+        """
+        self.data = data
+        self.params = dict(params or {})
+        self.dumps = dumps
+        self.buffer_limit = buffer_limit
+
+        digest = None
+        if signer:
+            digest = signer.digest(method, url)
+        self.length, self._buffer = self._scan(digest)
+        if signer:
+            signature = signer.signature(digest)
+            self.params['oauth_signature'] = signature
+            self.length += len('&oauth_signature=') + len(form_quote(signature))
+            if self._buffer is not None:
+                self._buffer = ''.join(self._iter_body())
+
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        if self._buffer is not None:
+            return iter([self._buffer])
+        return self._iter_body()
+
+    def getvalue(self):
+        """Return the whole body as a string."""
+        if self._buffer is not None:
+            return self._buffer
+        return ''.join(self._iter_body())
+
+    def content(self):
+        """Return the body for httplib: a string if buffered, else self."""
+        if self._buffer is not None:
+            return self._buffer
+        return self
+
+    def read(self, size=-1):
+        """Read up to `size` bytes of the body (all if negative)."""
+        if size < 0:
+            result = self._pending[self._offset:] + ''.join(self._reader)
+            self._pending, self._offset = '', 0
+            return result
+        while len(self._pending) - self._offset < size:
+            try:
+                piece = self._reader.next()
+            except StopIteration:
+                break
+            self._pending = self._pending[self._offset:] + piece
+            self._offset = 0
+        result = self._pending[self._offset:self._offset + size]
+        self._offset += len(result)
+        return result
+
+    def seek(self, offset, whence=0):
+        """Rewind the body; only seeking to the start is supported."""
+        if offset or whence:
+            raise IOError("FormBody can only seek to the start")
+        self._reader = iter(self)
+        self._pending = ''
+        self._offset = 0
+
+    def _iter_data(self):
+        """Generate the form-encoded `data` value."""
+        for chunk in iter_chunks(iter_json(self.data, self.dumps)):
+            yield data_quote(chunk)
+
+    def _iter_body(self):
+        first = True
+        for key in sorted(self.params.keys() + ['data']):
+            if first:
+                first = False
+            else:
+                yield '&'
+            yield form_quote(key) + '='
+            if key == 'data':
+                for piece in self._iter_data():
+                    yield piece
+            else:
+                yield form_quote(self.params[key])
+
+    def _scan(self, digest):
+        """
+        Compute the body length, updating `digest` (if given) with the body
+        as it appears in the signature base string, and buffer the body if
+        it is within buffer_limit. Returns (length, buffer or None).
+        """
+        length = 0
+        buffered = []
+        for piece in self._iter_body():
+            length += len(piece)
+            if digest:
+                digest.update(signature_escape(piece))
+            if buffered is not None:
+                buffered.append(piece)
+                if length > self.buffer_limit:
+                    buffered = None
+
+        if buffered is not None:
+            buffered = ''.join(buffered)
+        return length, buffered
@@ -0,0 +1,226 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import time
+
+from .client import DatazillaResult, DatazillaSubmitError
+
+# estimated bytes held per value, in compact and list-backed storage
+# (a list slot and a float object)
+VALUE_BYTES = {True: 8, False: 32}
+
+
+def move_suites(source, target, suites):
+    """Move the given suites from one DatazillaResult to another."""
+    for name in ('results', 'results_aux', 'results_xperf', 'talos_aux',
+                 'options'):
+        source_block = getattr(source, name)
+        target_block = getattr(target, name)
+        for suite in suites:
+            if suite in source_block:
+                target_block[suite] = source_block.pop(suite)
+
+
+def result_suites(result):
+    """Return the names of the suites a DatazillaResult holds anything of."""
+    suites = set()
+    for name in ('results', 'results_aux', 'results_xperf', 'talos_aux',
+                 'options'):
+        suites.update(getattr(result, name).keys())
+    return suites
+
+
+def failed_suites(error):
+    """Return the suites of the payloads a DatazillaSubmitError lists."""
+    suites = set()
+    for index in error.errors:
+        payload = error.payloads[index]
+        if not isinstance(payload, list):
+            payload = [payload]
+        suites.update([dataset['testrun']['suite'] for dataset in payload])
+    return suites
+
+
+class AutoFlushingResult(DatazillaResult):
+    """
+    A DatazillaResult for long-running harnesses that submits its suites
+    through a DatazillaRequest as it goes, rather than holding every value
+    until the end.
+
+    Results are added as to a DatazillaResult. Once a suite is complete,
+    marked so with `finish_suite()` (or, if `sequential`, by adding results
+    to another suite), it is submitted and released as soon as the values
+    held reach `max_values`, their estimated size reaches `max_bytes`, or
+    `max_age` seconds have passed since the last flush; thresholds are
+    checked as results are added. Suites still being collected are never
+    split, so they are held whatever the thresholds.
+
+    The request sends the flushed suites with its own settings, so with a
+    spool they are written to disk if the upload fails. `close()`, or
+    leaving a `with` block, flushes all the suites left; after an
+    exception, only those completed.
+    """
+
+    def __init__(self, request, max_values=None, max_bytes=None,
+                 max_age=None, sequential=False, compaction=None):
+        """
+        - request : DatazillaRequest to submit the suites through; results
+          already in it are sent with the first flush
+        - max_values, max_bytes, max_age : flush thresholds
+        - sequential : whether adding results to a suite completes all
+          the others, as when a harness runs suites one after another
+        - compaction : compactors of counter series; see DatazillaResult
+        """
+        DatazillaResult.__init__(self, compact=request.compact,
+                                 compaction=compaction)
+        self.request = request
+        self.max_values = max_values
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sequential = sequential
+        self.finished = set()
+        self.counts = {} # suite -> values held
+        self.responses = [] # of every flush, in order
+        self.last_flush = time.time()
+        self._joining = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(all=exc_type is None)
+
+    def values(self):
+        """Return the number of values held."""
+        return sum(self.counts.values())
+
+    def estimated_bytes(self):
+        """Return an estimate of the memory taken by the values held."""
+        return self.values() * VALUE_BYTES[self.compact]
+
+    def add_testsuite(self, suite_name, results=None, results_aux=None,
+                      results_xperf=None, talos_aux=None, options=None):
+        DatazillaResult.add_testsuite(self, suite_name, results, results_aux,
+                                      results_xperf, talos_aux, options)
+        self.counts[suite_name] = self._count(suite_name)
+        self._added(suite_name, 0)
+
+    def join_all(self, results, take=False):
+        results = list(results)
+        suites = set()
+        for res in results:
+            for block in (res.results, res.results_aux, res.results_xperf,
+                          res.talos_aux):
+                suites.update(block.keys())
+        self._joining = True
+        try:
+            DatazillaResult.join_all(self, results, take)
+        finally:
+            self._joining = False
+        for suite in suites:
+            self.counts[suite] = self._count(suite)
+            self._added(suite, 0)
+
+    def _count(self, suite):
+        count = 0
+        for block in (self.results, self.results_aux, self.results_xperf,
+                      self.talos_aux):
+            for values in block.get(suite, {}).values():
+                count += len(values)
+        return count
+
+    def _extend(self, data, suite, name, values):
+        # count what is held, which compacted series keep below the values
+        held = len(data.get(suite, {}).get(name, ()))
+        DatazillaResult._extend(self, data, suite, name, values)
+        if not self._joining:
+            self._added(suite, len(data[suite][name]) - held)
+
+    def _added(self, suite, count):
+        if self.sequential:
+            self.finished.update([other for other in self.counts
+                                  if other != suite])
+        self.counts[suite] = self.counts.get(suite, 0) + count
+        self.maybe_flush()
+
+    def finish_suite(self, suite_name):
+        """Mark a suite complete, so that it may be flushed."""
+        self.finished.add(suite_name)
+        self.maybe_flush()
+
+    def due(self):
+        """Return whether a threshold has been crossed."""
+        return bool(
+            (self.max_values and self.values() >= self.max_values) or
+            (self.max_bytes and self.estimated_bytes() >= self.max_bytes) or
+            (self.max_age and time.time() - self.last_flush >= self.max_age))
+
+    def maybe_flush(self):
+        """Flush the completed suites if a threshold has been crossed."""
+        if self.finished and self.due():
+            self.flush()
+
+    def flush(self, suites=None):
+        """
+        Submit the given suites, by default the completed ones, through the
+        request and release them; returns the responses. If the
+        submission raises, the suites that were not sent are kept for the
+        next flush: with concurrent sends, those whose payloads failed
+        (see DatazillaSubmitError), otherwise all of them. The request's
+        own results are likewise kept until they are sent.
+        """
+        if suites is None:
+            suites = self.finished
+        suites = [suite for suite in suites if suite in self.counts]
+        self.last_flush = time.time()
+        if not suites:
+            return []
+
+        for suite in suites:
+            del self.counts[suite]
+        self.finished.difference_update(suites)
+        flushed = DatazillaResult(compact=self.compact)
+        move_suites(self, flushed, suites)
+        # the request's own results are copied, so that they can be
+        # restored as they were if they are not sent
+        own = self.request.results
+        self.request.results = DatazillaResult(compact=self.compact)
+        self.request.add_datazilla_result(own)
+        self.request.add_datazilla_result(flushed, take=True)
+
+        failed = result_suites(self.request.results)
+        try:
+            responses = self.request.submit()
+            failed = set()
+        except DatazillaSubmitError, e:
+            failed = failed_suites(e)
+            raise
+        finally:
+            submitted = self.request.results
+            self.request.results = own
+            # suites sent are released; failed suites flushed from here,
+            # with any of the request's own results for them, come back
+            move_suites(own, DatazillaResult(),
+                        [suite for suite in result_suites(own)
+                         if suite not in failed or suite in suites])
+            kept = [suite for suite in suites if suite in failed]
+            move_suites(submitted, self, kept)
+            for suite in kept:
+                self.counts[suite] = self._count(suite)
+            self.finished.update(kept)
+        self.responses.extend(responses)
+        return responses
+
+    def close(self, all=True):
+        """
+        Flush the suites left, or only those completed if `all` is false,
+        and close the request.
+        """
+        try:
+            if all:
+                self.flush(self.counts.keys())
+            else:
+                self.flush()
+        finally:
+            self.request.close()
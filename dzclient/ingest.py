@@ -0,0 +1,122 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Incremental ingestion of result files into a DatazillaResult.
+
+Files are read line by line through memory maps and turned into records
+of (kind, suite, name, values), which ingest() adds to a DatazillaResult
+in bounded batches, so memory use does not grow with the file size:
+
+    res = DatazillaResult(compact=True)
+    ingest_file(res, 'tp5.jsonl')
+
+A JSON lines file holds one object per line, of the form
+{"suite": "tp5", "test": "google.com", "values": [1, 2]} (or a single
+"value"), with an optional "kind" of "results" (the default), "aux",
+"xperf" or "talos_aux".
+
+A CSV file has a header row naming its columns; "suite", "test" and
+"value" are required and "kind" is optional.
+"""
+
+import csv
+import mmap
+import os
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+BATCH_SIZE = 10000 # values buffered before being added to the result
+
+KINDS = {'results': 'add_test_results',
+         'aux': 'add_auxiliary_results',
+         'xperf': 'add_xperf_results',
+         'talos_aux': 'add_talos_auxiliary'}
+
+
+def iter_lines(path):
+    """Generate the lines of a file, read through a memory map."""
+    f = open(path, 'rb')
+    try:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(mapped.readline, ''):
+                yield line
+        finally:
+            mapped.close()
+    finally:
+        f.close()
+
+
+def read_json_lines(lines):
+    """Generate (kind, suite, name, values) records from JSON lines."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'values' in record:
+            values = record['values']
+        else:
+            values = [record['value']]
+        yield (record.get('kind', 'results'), record['suite'],
+               record['test'], values)
+
+
+def read_csv(lines):
+    """Generate (kind, suite, name, values) records from CSV lines."""
+    for row in csv.DictReader(lines):
+        yield (row.get('kind') or 'results', row['suite'], row['test'],
+               [float(row['value'])])
+
+
+def ingest(result, records, batch_size=BATCH_SIZE):
+    """
+    Add (kind, suite, name, values) records to a DatazillaResult, buffering
+    at most about `batch_size` values between additions. Returns the number
+    of values added.
+    """
+    pending = {}
+    buffered = 0
+    total = 0
+    for kind, suite, name, values in records:
+        if kind not in KINDS:
+            raise ValueError("Unknown result kind '%s'; please use one of %s" %
+                             (kind, ', '.join(KINDS.keys())))
+        pending.setdefault((kind, suite, name), []).extend(values)
+        buffered += len(values)
+        if buffered >= batch_size:
+            total += _flush(result, pending)
+            pending = {}
+            buffered = 0
+    return total + _flush(result, pending)
+
+
+def ingest_file(result, path, format=None, batch_size=BATCH_SIZE):
+    """
+    Ingest a result file into a DatazillaResult. The format, 'jsonl' or
+    'csv', is taken from the file extension if not given. Returns the
+    number of values added.
+    """
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+        if format == 'json':
+            format = 'jsonl'
+    readers = {'jsonl': read_json_lines, 'csv': read_csv}
+    if format not in readers:
+        raise ValueError("Unknown result file format '%s'" % format)
+    return ingest(result, readers[format](iter_lines(path)), batch_size)
+
+
+def _flush(result, pending):
+    count = 0
+    for (kind, suite, name), values in pending.items():
+        getattr(result, KINDS[kind])(suite, name, values)
+        count += len(values)
+    return count
@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import threading
+from collections import deque
+
+# phases of a send(), in order, as recorded in seconds under '<phase>_time'
+PHASES = ('encode', 'compress', 'connect', 'request', 'response')
+
+
+class SubmissionMetrics(object):
+    """
+    Collects instrumentation records from DatazillaRequest.
+
+    A request passes each record to `record()`: one per send(), with
+    'event': 'send', the time of each of PHASES (encoding covers JSON
+    serialization, percent-encoding and OAuth signing, which happen
+    together), 'body_bytes' and 'sent_bytes', 'datasets', 'retries',
+    'status' and, if it failed, 'error'; and one per submit(), with
+    'event': 'submit', 'datasets_time' (building the datasets or batches),
+    'payloads', 'skipped' (datasets already sent, see SentCache) and
+    'total_time'.
+
+    Records are totalled as they arrive, so that long-running uploaders
+    take constant memory; only the latest `keep` records themselves are
+    kept, in `records` (None keeps them all).
+
+    Any object with a record() method can be used instead, e.g. to forward
+    records to a fleet-wide metrics service.
+    """
+
+    def __init__(self, keep=0):
+        self.keep = keep
+        self.records = deque()
+        self._totals = {'sends': 0, 'submits': 0, 'errors': 0, 'retries': 0,
+                        'body_bytes': 0, 'sent_bytes': 0, 'skipped': 0}
+        self._phases = {} # phase: [count, total, max]
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        self._lock.acquire()
+        try:
+            if self.keep is None or self.keep > 0:
+                self.records.append(record)
+                # bounded by hand, as deque's maxlen needs Python 2.6
+                if self.keep is not None and len(self.records) > self.keep:
+                    self.records.popleft()
+            totals = self._totals
+            if record.get('event') == 'send':
+                totals['sends'] += 1
+                if record.get('error'):
+                    totals['errors'] += 1
+                for name in ('retries', 'body_bytes', 'sent_bytes'):
+                    totals[name] += record.get(name, 0)
+                phases = PHASES
+            elif record.get('event') == 'submit':
+                totals['submits'] += 1
+                totals['skipped'] += record.get('skipped', 0)
+                phases = ('datasets',)
+            else:
+                return
+            for phase in phases:
+                seconds = record.get(phase + '_time')
+                if seconds is None:
+                    continue
+                times = self._phases.setdefault(phase, [0, 0, seconds])
+                times[0] += 1
+                times[1] += seconds
+                times[2] = max(times[2], seconds)
+        finally:
+            self._lock.release()
+
+    def summary(self):
+        """
+        Return totals over the records: sends, errors, retries, bytes,
+        datasets skipped, and the total, mean and max seconds of each
+        phase.
+        """
+        self._lock.acquire()
+        try:
+            summary = dict(self._totals)
+            summary['phases'] = {}
+            for phase, (count, total, longest) in self._phases.items():
+                summary['phases'][phase] = {'total': total,
+                                            'mean': total / count,
+                                            'max': longest}
+        finally:
+            self._lock.release()
+        return summary
+
+    def dump(self, stream=None):
+        """Write a readable summary to `stream` (stdout by default)."""
+        stream = stream or sys.stdout
+        summary = self.summary()
+        stream.write("%(sends)d sends in %(submits)d submits, %(errors)d "
+                     "errors, %(retries)d retries\n" % summary)
+        stream.write("%(body_bytes)d body bytes, %(sent_bytes)d sent, "
+                     "%(skipped)d datasets skipped\n" % summary)
+        for phase in ('datasets',) + PHASES:
+            if phase in summary['phases']:
+                times = summary['phases'][phase]
+                stream.write("%-9s total %9.3fs  mean %9.3fs  max %9.3fs\n" %
+                             (phase, times['total'], times['mean'],
+                              times['max']))
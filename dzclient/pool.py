@@ -0,0 +1,210 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import httplib
+import socket
+import threading
+import time
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of keep-alive HTTP(S) connections, keyed by
+    (protocol, host).
+
+    A connection is only handed out again once the response it last
+    produced has been fully read (and so closed); connections whose
+    responses are still pending are never reused or closed by the pool.
+    Connections left idle for longer than `idle_timeout` seconds are
+    evicted.
+
+    The pool may be shared between several DatazillaRequest instances and
+    threads, and can be used as a context manager.
+    """
+
+    connection_classes = {'http': 'HTTPConnection',
+                          'https': 'HTTPSConnection'}
+
+    def __init__(self, maxsize=4, idle_timeout=60, timeout=None):
+        """
+        - maxsize : maximum number of connections kept per (protocol, host)
+        - idle_timeout : seconds after which an unused connection is closed
+        - timeout : socket timeout in seconds for new connections
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._connections = {} # (protocol, host) -> [[conn, response, last_used]]
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def new_connection(self, protocol, host):
+        """Return a new, unpooled connection to host."""
+        if protocol not in self.connection_classes:
+            raise AssertionError("Protocol '%s' not supported" % protocol)
+        # looked up at call time so httplib can be patched in tests
+        connection_class = getattr(httplib, self.connection_classes[protocol])
+        if self.timeout is None:
+            conn = connection_class(host)
+        else:
+            conn = connection_class(host, timeout=self.timeout)
+        # kept, so that a request's `timeouts` can be undone on reuse
+        conn._pool_timeout = getattr(conn, 'timeout', None)
+        return conn
+
+    def get(self, protocol, host):
+        """
+        Return a (connection, reused) pair for host; `reused` is True if
+        the connection was taken from the pool rather than newly opened.
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            entries = self._connections.get((protocol, host), [])
+            for entry in entries[:]:
+                conn, response, last_used = entry
+                if not self._is_finished(response):
+                    continue
+                entries.remove(entry)
+                if now - last_used > self.idle_timeout:
+                    conn.close()
+                    continue
+                self._reset_timeouts(conn)
+                return conn, True
+        finally:
+            self._lock.release()
+
+        return self.new_connection(protocol, host), False
+
+    def put(self, protocol, host, conn, response=None):
+        """
+        Return a connection to the pool. `response` is the last response
+        obtained on it; the connection becomes reusable once it is read.
+        """
+        self._lock.acquire()
+        try:
+            entries = self._connections.setdefault((protocol, host), [])
+            entries.append([conn, response, time.time()])
+            while len(entries) > self.maxsize:
+                # drop the oldest connection; if its response is still
+                # being read it is left to the caller and garbage collection
+                old_conn, old_response, _ = entries.pop(0)
+                if self._is_finished(old_response):
+                    old_conn.close()
+        finally:
+            self._lock.release()
+
+    def request(self, protocol, host, method, path, body=None, headers=None,
+                timings=None, timeouts=None):
+        """
+        Issue a request on a pooled connection and return the response.
+
+        A request that fails on a reused connection because the server
+        closed it while idle is retried once on a fresh one: if sending
+        the request failed, or the connection was closed without a byte
+        of response. A failure once the request may have been handled,
+        such as a reset while waiting for the response, is raised rather
+        than risk sending a POST twice; see RetryPolicy for retrying it.
+
+        If a `timings` dict is given, the seconds spent connecting, sending
+        the request and waiting for the response headers are added to its
+        'connect_time', 'request_time' and 'response_time', and retries
+        counted in 'retries'.
+
+        `timeouts` is an optional (connect, read) pair of socket timeouts
+        for this request, either of which may be None to use the pool's.
+        """
+        headers = headers or {}
+        if timings is None:
+            timings = {}
+        for key in ('connect_time', 'request_time', 'response_time', 'retries'):
+            timings.setdefault(key, 0)
+
+        conn, reused = self.get(protocol, host)
+        sent = [] # holds True once the request is written
+        try:
+            response = self._request(conn, method, path, body, headers,
+                                     timings, timeouts, sent)
+        except (httplib.HTTPException, socket.error), e:
+            conn.close()
+            if not reused or (sent and not self._unanswered(e)):
+                raise
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            timings['retries'] += 1
+            conn = self.new_connection(protocol, host)
+            response = self._request(conn, method, path, body, headers,
+                                     timings, timeouts)
+
+        self.put(protocol, host, conn, response)
+        return response
+
+    def _request(self, conn, method, path, body, headers, timings,
+                 timeouts=None, sent=None):
+        connect_timeout, read_timeout = timeouts or (None, None)
+        start = time.time()
+        if getattr(conn, 'sock', True) is None:
+            if connect_timeout is not None:
+                conn.timeout = connect_timeout
+            conn.connect()
+        connected = time.time()
+        if timeouts is not None:
+            if read_timeout is None:
+                read_timeout = self.timeout
+                if read_timeout is None:
+                    read_timeout = socket.getdefaulttimeout()
+            conn.sock.settimeout(read_timeout)
+        conn.request(method, path, body, headers)
+        if sent is not None:
+            sent.append(True)
+        written = time.time()
+        response = conn.getresponse()
+        timings['connect_time'] += connected - start
+        timings['request_time'] += written - connected
+        timings['response_time'] += time.time() - written
+        return response
+
+    def _reset_timeouts(self, conn):
+        """
+        Restore the pool's timeouts on a connection that a request's
+        `timeouts` may have shortened. This is done when the connection
+        is reused rather than when it is put back, as its last response
+        may still be being read then, under the request's timeouts.
+        """
+        if getattr(conn, '_pool_timeout', None) is not None:
+            conn.timeout = conn._pool_timeout
+        read_timeout = self.timeout
+        if read_timeout is None:
+            read_timeout = socket.getdefaulttimeout()
+        if getattr(conn, 'sock', None) is not None:
+            conn.sock.settimeout(read_timeout)
+
+    def _unanswered(self, error):
+        """
+        Whether a failure to read a response means the connection was
+        closed before the server read the request: no status line at all.
+        """
+        return (isinstance(error, httplib.BadStatusLine) and
+                error.line in ('', "''"))
+
+    def close(self):
+        """Close all idle connections held by the pool."""
+        self._lock.acquire()
+        try:
+            connections, self._connections = self._connections, {}
+        finally:
+            self._lock.release()
+
+        for entries in connections.values():
+            for conn, response, _ in entries:
+                if self._is_finished(response):
+                    conn.close()
+
+    def _is_finished(self, response):
+        return response is None or response.isclosed()
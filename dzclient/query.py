@@ -0,0 +1,342 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Reading results back from datazilla.
+
+A DatazillaQuery fetches test runs, as the datasets they were submitted
+as, page by page through a connection pool:
+
+    query = DatazillaQuery('https', 'datazilla.mozilla.org', 'talos',
+                           cache=ResponseCache('/var/cache/datazilla'))
+    for dataset in query.test_runs('Mozilla-Inbound', '785345035a3b',
+                                   suite='tp5'):
+        ...
+
+Responses are kept in a ResponseCache, in memory and optionally on disk.
+Within its `ttl` a cached response is used without asking the server;
+after that it is revalidated with a conditional request, so an unchanged
+response is not downloaded again.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import zlib
+from hashlib import sha1
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from .encoding import escape, form_quote
+from .pool import ConnectionPool
+from .retry import RetryPolicy
+from .signing import OAuthSigner
+
+
+class DatazillaQueryError(Exception):
+    """Raised when the server answers a query with an error status."""
+
+    def __init__(self, status, url):
+        Exception.__init__(self, "%s: status %d" % (url, status))
+        self.status = status
+        self.url = url
+
+
+def _text(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def query_string(params):
+    """Return the query string of a dict of parameters, sorted by name."""
+    return '&'.join(['%s=%s' % (form_quote(_text(name)),
+                                form_quote(_text(value)))
+                     for name, value in sorted(params.items())])
+
+
+class ResponseCache(object):
+    """
+    Cached query responses, by URL: the `memory_entries` most recently
+    used in memory and, if a `directory` is given, up to `disk_entries` on
+    disk, one file each, evicting those fetched or revalidated longest
+    ago. A response is fresh for `ttl` seconds after it was fetched or
+    last revalidated.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, directory=None, ttl=300, memory_entries=256,
+                 disk_entries=1000):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = {} # url: [entry, last use]
+        self._clock = 0
+        self._disk_count = 0 # files on disk, as far as this cache knows
+        self._lock = threading.Lock()
+        if directory:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._prune()
+
+    def fresh(self, entry, now=None):
+        """Whether a cached entry can be used without revalidation."""
+        if now is None:
+            now = time.time()
+        return now - entry['fetched'] < self.ttl
+
+    def get(self, url):
+        """
+        Return the cached entry of a URL, a dict of 'body', 'fetched' (a
+        time.time() value) and the response's 'etag' and 'last_modified'
+        validators, or None.
+        """
+        self._lock.acquire()
+        try:
+            self._clock += 1
+            cached = self._memory.get(url)
+            if cached is not None:
+                cached[1] = self._clock
+                return cached[0]
+        finally:
+            self._lock.release()
+
+        if not self.directory:
+            return None
+        try:
+            f = open(self._path(url))
+            try:
+                entry = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        self._remember(url, entry)
+        return entry
+
+    def put(self, url, entry):
+        """Cache an entry (see get()) for a URL."""
+        entry = dict(entry, url=url)
+        self._remember(url, entry)
+        if self.directory:
+            path = self._path(url)
+            new = not os.path.exists(path)
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            f = os.fdopen(fd, 'w')
+            try:
+                json.dump(entry, f)
+            finally:
+                f.close()
+            os.rename(temp, path)
+            if new:
+                self._disk_count += 1
+                # evict in bulk, so that caching stays cheap
+                if self._disk_count > self.disk_entries * 2:
+                    self._prune()
+
+    def clear(self):
+        """Remove all cached entries."""
+        self._lock.acquire()
+        try:
+            self._memory = {}
+        finally:
+            self._lock.release()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.suffix):
+                    os.remove(os.path.join(self.directory, name))
+            self._disk_count = 0
+
+    def _prune(self):
+        """Remove the oldest files past `disk_entries`."""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass # removed meanwhile
+        files.sort()
+        for mtime, path in files[:max(0, len(files) - self.disk_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_count = min(len(files), self.disk_entries)
+
+    def _remember(self, url, entry):
+        self._lock.acquire()
+        try:
+            self._clock += 1
+            self._memory[url] = [entry, self._clock]
+            if len(self._memory) > self.memory_entries:
+                oldest = min(self._memory, key=lambda u: self._memory[u][1])
+                del self._memory[oldest]
+        finally:
+            self._lock.release()
+
+    def _path(self, url):
+        return os.path.join(self.directory,
+                            sha1(_text(url)).hexdigest() + self.suffix)
+
+
+class DatazillaQuery(object):
+    """
+    Fetches results from a datazilla project, configured as a
+    DatazillaRequest is.
+
+    Paged queries ask for `page_size` items at a time, with 'offset' and
+    'limit' parameters, until a page comes back short. A server ignoring
+    those parameters is detected by a page longer than asked for, or the
+    same as the previous one.
+    """
+
+    def __init__(self, protocol, host, project, oauth_key=None,
+                 oauth_secret=None, pool=None, cache=None, page_size=100,
+                 retry_policy=None):
+        """
+        - host, project, oauth_key, oauth_secret : as for DatazillaRequest;
+          queries are signed if credentials are given
+        - pool : ConnectionPool to fetch through; may be shared with
+          requests. A private pool is created if not given.
+        - cache : ResponseCache for the responses; a memory-only cache
+          with the default ttl is created if not given
+        - page_size : number of items fetched per page by pages()
+        - retry_policy : RetryPolicy for each GET; by default a GET is
+          tried once
+        """
+        if protocol not in ConnectionPool.connection_classes:
+            raise AssertionError("Protocol '%s' not supported" % protocol)
+        self.protocol = protocol
+        self.host = host
+        self.project = project
+        self.signer = None
+        if oauth_key and oauth_secret:
+            self.signer = OAuthSigner(oauth_key, oauth_secret)
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+        if cache is None:
+            cache = ResponseCache()
+        self.cache = cache
+        self.page_size = page_size
+        if retry_policy is None:
+            retry_policy = RetryPolicy(retries=0)
+        self.retry_policy = retry_policy
+        # responses served from the cache, revalidated, and downloaded
+        self.stats = {'hits': 0, 'revalidated': 0, 'fetched': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the idle connections of this query's pool."""
+        self.pool.close()
+
+    def get(self, path, params=None):
+        """
+        Return the decoded JSON of a GET of `path`, relative to the
+        project, with the query `params`.
+        """
+        path = '/%s/%s' % (self.project, path.lstrip('/'))
+        url = '%s://%s%s' % (self.protocol, self.host, path)
+        if params:
+            url = '%s?%s' % (url, query_string(params))
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.fresh(entry):
+            self.stats['hits'] += 1
+            return json.loads(entry['body'])
+
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        fetched = time.time()
+        response = self.retry_policy.run(
+            lambda timeouts: self._request(path, params, headers, timeouts),
+            self.retry_policy.end())
+        body = response.read()
+
+        if response.status == 304 and entry is not None:
+            self.stats['revalidated'] += 1
+            entry['fetched'] = fetched
+            self.cache.put(url, entry)
+            return json.loads(entry['body'])
+        if response.status != 200:
+            raise DatazillaQueryError(response.status, url)
+
+        self.stats['fetched'] += 1
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        self.cache.put(url, {'body': body,
+                             'fetched': fetched,
+                             'etag': response.getheader('ETag'),
+                             'last_modified':
+                                 response.getheader('Last-Modified')})
+        return json.loads(body)
+
+    def _request(self, path, params, headers, timeouts):
+        # each attempt is signed afresh, with a new nonce and timestamp
+        params = dict(params or {})
+        if self.signer is not None:
+            params.update(self.signer.parameters())
+            uri = "%s://%s%s" % (self.protocol, self.host, path)
+            digest = self.signer.digest('GET', uri)
+            digest.update(escape('&'.join(
+                ['%s=%s' % (escape(_text(name)), escape(_text(value)))
+                 for name, value in sorted(params.items())])))
+            params['oauth_signature'] = self.signer.signature(digest)
+        if params:
+            path = '%s?%s' % (path, query_string(params))
+        return self.pool.request(self.protocol, self.host, 'GET', path,
+                                 None, headers, None, timeouts)
+
+    def pages(self, path, params=None):
+        """
+        Generate the pages, lists of items, of a paged query, fetching each
+        only when the previous one has been consumed.
+        """
+        offset = 0
+        previous = None
+        while True:
+            page_params = dict(params or {})
+            page_params.update({'offset': offset, 'limit': self.page_size})
+            page = self.get(path, page_params)
+            if page == previous:
+                break # paging ignored; the whole list came before
+            if page:
+                yield page
+            if len(page) != self.page_size:
+                break # the last page, or all of them if paging is ignored
+            offset += len(page)
+            previous = page
+
+    def test_runs(self, branch, revision, suite=None, **params):
+        """
+        Generate the datasets of the test runs of a revision on a branch,
+        optionally only of one suite; further `params` (e.g. os_name,
+        page_name) narrow the query.
+        """
+        if suite is not None:
+            params['test_name'] = suite
+        for page in self.pages('testdata/raw/%s/%s/' % (branch, revision),
+                               params):
+            for dataset in page:
+                yield dataset
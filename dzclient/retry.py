@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import httplib
+import random
+import socket
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an upload's deadline passes before it could be made."""
+
+
+class RetryPolicy(object):
+    """
+    How DatazillaRequest sends each POST: the timeouts of each attempt,
+    which failures are retried and how long to wait in between.
+
+    Connection errors (including timeouts), server errors (5xx) and 429
+    Too Many Requests responses are retried up to `retries` times, after
+    a jittered exponential backoff from `base_delay` seconds doubling up
+    to `max_delay`, or as long as a 429 or 503 response's Retry-After
+    asks, if longer. Once `deadline` seconds have passed no further
+    attempt is started, and socket timeouts are shortened so that none
+    runs past it.
+
+    If the last attempt got a response, even an error, it is returned;
+    if it failed, its exception is raised.
+    """
+
+    retry_statuses = set([429, 500, 502, 503, 504])
+
+    def __init__(self, retries=3, base_delay=0.5, max_delay=30,
+                 connect_timeout=None, read_timeout=None, deadline=None):
+        """
+        - retries : attempts made after the first one fails
+        - base_delay, max_delay : bounds, in seconds, of the backoff
+        - connect_timeout : seconds allowed to open a connection
+        - read_timeout : seconds allowed for each socket read or write
+          once connected
+        - deadline : seconds after which no attempt is started
+        A timeout of None leaves the connection pool's.
+        """
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.sleep = time.sleep # replaced in tests
+
+    def end(self):
+        """Return the time after which no attempt starts, or None."""
+        if self.deadline is None:
+            return None
+        return time.time() + self.deadline
+
+    def timeouts(self, end=None):
+        """
+        Return the (connect, read) timeouts of an attempt starting now,
+        shortened to end by `end`. Raises DeadlineExceeded if `end` has
+        passed.
+        """
+        if end is None:
+            return self.connect_timeout, self.read_timeout
+        remaining = end - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded("deadline passed %.1fs ago" % -remaining)
+        return (min(self.connect_timeout or remaining, remaining),
+                min(self.read_timeout or remaining, remaining))
+
+    def should_retry(self, attempt, response=None, error=None):
+        """Return whether to retry after the given attempt's outcome."""
+        if attempt > self.retries:
+            return False
+        if error is not None:
+            return isinstance(error, (httplib.HTTPException, socket.error))
+        return response.status in self.retry_statuses
+
+    def delay(self, attempt, response=None):
+        """Return the seconds to wait before retrying the given attempt."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1)
+        if response is not None and response.status in (429, 503):
+            retry_after = response.getheader('Retry-After', '')
+            if retry_after.strip().isdigit():
+                delay = max(delay, int(retry_after))
+        return delay
+
+    def run(self, attempt, end=None, timings=None):
+        """
+        Call attempt(timeouts) until it succeeds, fails in a way that is
+        not retried, or retries run out, returning its response.
+        `timeouts` is the (connect, read) pair for the attempt. Retries
+        and the seconds spent backing off are added to 'retries' and
+        'backoff_time' in `timings`, if given.
+        """
+        if timings is None:
+            timings = {}
+        timings.setdefault('retries', 0)
+        timings.setdefault('backoff_time', 0)
+
+        count = 0
+        while True:
+            count += 1
+            timeouts = self.timeouts(end)
+            response = error = None
+            try:
+                response = attempt(timeouts)
+            except (httplib.HTTPException, socket.error), e:
+                error = e
+
+            if not self.should_retry(count, response, error):
+                break
+            delay = self.delay(count, response)
+            if end is not None and time.time() + delay >= end:
+                break
+            if response is not None:
+                response.read() # frees the connection for reuse
+            self.sleep(delay)
+            timings['retries'] += 1
+            timings['backoff_time'] += delay
+
+        if error is not None:
+            raise error
+        return response
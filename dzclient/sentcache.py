@@ -0,0 +1,143 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A persistent record of the datasets a server has accepted, so that a
+submission re-run for the same build skips what was already uploaded:
+
+    cache = SentCache('/var/cache/talos/datazilla-sent')
+    req = DatazillaRequest(..., sent_cache=cache)
+    req.submit()
+    print "skipped", [d['testrun']['suite'] for d in req.skipped]
+"""
+
+import os
+import tempfile
+import threading
+from hashlib import sha1
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from .encoding import json_default
+
+
+def dataset_key(dataset, destination=''):
+    """
+    Return a stable hash of a dataset (its machine, build, suite, options
+    and values) and its `destination`, e.g. the host and project it is
+    sent to. The date of the test run is left out, as a re-run of a job
+    submits the same results with a new date. Compactly stored values
+    hash as the lists they are sent as.
+    """
+    if 'date' in dataset.get('testrun', {}):
+        dataset = dict(dataset)
+        dataset['testrun'] = dict(dataset['testrun'])
+        del dataset['testrun']['date']
+    text = json.dumps(dataset, sort_keys=True, separators=(',', ':'),
+                      default=json_default)
+    if isinstance(destination, unicode):
+        destination = destination.encode('utf-8')
+    return sha1(destination + '\n' + text).hexdigest()
+
+
+class SentCache(object):
+    """
+    The keys of the datasets accepted by a server, kept in a file at
+    `path` and bounded to the `max_entries` most recently used.
+
+    The file, one key per line from least to most recently used, is read
+    when the cache is made and replaced atomically by save(). Processes
+    sharing a file each save their own view, the last one winning; at
+    worst a dataset is sent again.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = {} # key: last use
+        self._clock = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            f = open(path)
+            try:
+                for line in f:
+                    key = line.strip()
+                    if key:
+                        self._clock += 1
+                        self._entries[key] = self._clock
+            finally:
+                f.close()
+            self._trim()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Whether a key is cached; looking it up marks it as used."""
+        self._lock.acquire()
+        try:
+            if key not in self._entries:
+                return False
+            self._clock += 1
+            self._entries[key] = self._clock
+            self._dirty = True
+            return True
+        finally:
+            self._lock.release()
+
+    def add(self, key):
+        """Record a key, evicting the least recently used past the bound."""
+        self._lock.acquire()
+        try:
+            self._clock += 1
+            self._entries[key] = self._clock
+            self._dirty = True
+            # evict in bulk, so that adding stays cheap
+            if len(self._entries) > self.max_entries * 2:
+                self._trim()
+        finally:
+            self._lock.release()
+
+    def _trim(self):
+        if len(self._entries) > self.max_entries:
+            keys = sorted(self._entries, key=self._entries.get)
+            for key in keys[:len(keys) - self.max_entries]:
+                del self._entries[key]
+
+    def save(self):
+        """Write the cache to its file if it changed."""
+        self._lock.acquire()
+        try:
+            if not self._dirty:
+                return
+            self._trim()
+            keys = sorted(self._entries, key=self._entries.get)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            f = os.fdopen(fd, 'w')
+            try:
+                f.write(''.join([key + '\n' for key in keys]))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+            os.rename(temp, self.path)
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Forget all keys."""
+        self._lock.acquire()
+        try:
+            self._entries = {}
+            self._dirty = True
+        finally:
+            self._lock.release()
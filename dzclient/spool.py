@@ -0,0 +1,332 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A durable on-disk spool of datasets waiting to be uploaded.
+
+Datasets that could not be sent, or that are deferred on purpose, are
+written to a spool directory, one file per dataset. A DatazillaSpool can
+later be drained through a DatazillaRequest, either directly, by a
+SpoolUploader thread, or from the command line:
+
+    python -m dzclient.spool --host datazilla.mozilla.org --project talos \\
+        --key KEY --secret SECRET /path/to/spool
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from hashlib import sha1
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from .client import DatazillaRequest
+from .encoding import json_default
+
+
+class DatazillaSpool(object):
+    """
+    A directory of datasets waiting to be uploaded.
+
+    Each dataset is kept in its own file, named after its build id,
+    machine and suite and the time it was enqueued, so enqueueing the
+    same suite of a build again supersedes the earlier copy. Files are
+    written atomically and only removed once the server has accepted the
+    dataset (a 2xx response), so a crash at any point loses nothing; at
+    worst a dataset is sent twice. A file's first line is a small JSON
+    header of its key and schedule, followed by the dataset's JSON, which
+    is only read when the dataset is sent.
+
+    Uploads that fail, or get a 429 or server error (5xx) response, are
+    retried with jittered exponential backoff, from `base_delay` seconds
+    doubling up to `max_delay`, or as long as a Retry-After header asks;
+    after `max_attempts` failures (if given) a dataset is moved aside to a
+    `failed` subdirectory. Datasets refused with any other status, such as
+    401 or 413, are moved there at once.
+    """
+
+    suffix = '.json'
+    retry_statuses = set([429, 500, 502, 503, 504])
+    temp_age = 3600 # seconds after which a crash's partial write is removed
+
+    def __init__(self, directory, base_delay=5, max_delay=3600,
+                 max_attempts=None):
+        self.directory = directory
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def key(cls, dataset):
+        """Return the deduplication key of a dataset."""
+        return '%s/%s/%s' % (dataset.get('test_build', {}).get('id', ''),
+                             dataset.get('test_machine', {}).get('name', ''),
+                             dataset.get('testrun', {}).get('suite', ''))
+
+    def enqueue(self, dataset):
+        """Add a dataset to the spool, replacing any with the same key."""
+        key = self.key(dataset)
+        if isinstance(key, unicode):
+            prefix = sha1(key.encode('utf-8')).hexdigest()
+        else:
+            prefix = sha1(key).hexdigest()
+        # names sort by the time enqueued, and are unique, so that a drain
+        # sending an earlier copy never removes or overwrites this one
+        name = '%s-%020.6f-%s%s' % (prefix, time.time(), uuid.uuid4().hex,
+                                    self.suffix)
+        self._write({'key': key, 'attempts': 0, 'next_attempt': 0},
+                    json.dumps(dataset, default=json_default),
+                    os.path.join(self.directory, name))
+        for other in os.listdir(self.directory):
+            if (other.startswith(prefix) and other.endswith(self.suffix) and
+                self._stamp(other) < self._stamp(name)):
+                self._unlink(os.path.join(self.directory, other))
+
+    def entries(self):
+        """
+        Return the spooled entries, oldest first, without their datasets
+        (see dataset()). Copies superseded by a later one with the same
+        key, and files left partly written by a crash, are removed.
+        """
+        latest = {}
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                try:
+                    if now - os.path.getmtime(path) > self.temp_age:
+                        self._unlink(path)
+                except OSError:
+                    pass # renamed or removed while listing
+                continue
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                entry = self._read(path, header_only=True)[0]
+                entry['mtime'] = os.path.getmtime(path)
+            except (IOError, OSError, ValueError):
+                continue # removed while listing
+            entry['path'] = path
+            previous = latest.get(entry['key'])
+            if previous is not None:
+                if self._stamp(name) < self._stamp(previous['path']):
+                    previous, entry = entry, previous
+                self._unlink(previous['path'])
+            latest[entry['key']] = entry
+        entries = latest.values()
+        entries.sort(key=lambda entry: entry['mtime'])
+        return entries
+
+    def dataset(self, entry):
+        """Return the dataset of an entry."""
+        return json.loads(self._read(entry['path'])[1])
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.directory)
+                    if name.endswith(self.suffix)])
+
+    def drain(self, request, now=None):
+        """
+        Send the entries that are due through `request` (a
+        DatazillaRequest), removing those the server accepts, rescheduling
+        those to be retried and moving aside those refused. Returns
+        (sent, failed) counts.
+        """
+        sent = failed = 0
+        for entry in self.entries():
+            if now is None:
+                current = time.time()
+            else:
+                current = now
+            if entry['next_attempt'] > current:
+                continue
+            try:
+                text = self._read(entry['path'])[1]
+                dataset = json.loads(text)
+            except (IOError, OSError, ValueError):
+                continue # removed since listed
+            response = None
+            try:
+                response = request.send(dataset)
+                response.read()
+            except Exception:
+                pass
+
+            if response is not None and 200 <= response.status < 300:
+                self._unlink(entry['path'])
+                sent += 1
+            elif response is None or response.status in self.retry_statuses:
+                self._reschedule(entry, text, current, response)
+                failed += 1
+            else:
+                self._fail(entry)
+                failed += 1
+        return sent, failed
+
+    @staticmethod
+    def _stamp(path):
+        """Return the part of an entry's file name ordering its copies."""
+        name = os.path.basename(path)
+        if name[40:41] == '-':
+            return name[41:]
+        return '' # named by key alone, by an earlier version
+
+    def _read(self, path, header_only=False):
+        """
+        Return the header of an entry's file and, unless `header_only`,
+        the JSON of its dataset.
+        """
+        f = open(path)
+        try:
+            header = json.loads(f.readline())
+            # files of an earlier version are a single JSON object
+            dataset = header.pop('dataset', None)
+            if header_only:
+                return header, None
+            if dataset is not None:
+                return header, json.dumps(dataset, default=json_default)
+            return header, f.read()
+        finally:
+            f.close()
+
+    def _write(self, entry, text, path):
+        """Atomically write an entry's header and dataset JSON `text`."""
+        header = {'key': entry['key'],
+                  'attempts': entry['attempts'],
+                  'next_attempt': entry['next_attempt']}
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write(json.dumps(header) + '\n')
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(temp, path)
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _fail(self, entry):
+        """Move an entry aside to the `failed` subdirectory."""
+        failed = os.path.join(self.directory, 'failed')
+        if not os.path.isdir(failed):
+            os.makedirs(failed)
+        try:
+            os.rename(entry['path'],
+                      os.path.join(failed, os.path.basename(entry['path'])))
+        except OSError:
+            pass # superseded meanwhile
+
+    def _reschedule(self, entry, text, now, response=None):
+        entry['attempts'] += 1
+        if self.max_attempts and entry['attempts'] >= self.max_attempts:
+            self._fail(entry)
+            return
+        delay = min(self.max_delay,
+                    self.base_delay * 2 ** (entry['attempts'] - 1))
+        delay *= random.uniform(0.5, 1)
+        if response is not None:
+            retry_after = response.getheader('Retry-After') or ''
+            if retry_after.strip().isdigit():
+                delay = max(delay, int(retry_after))
+        entry['next_attempt'] = now + delay
+        # leave it removed if a later copy superseded it meanwhile
+        if os.path.exists(entry['path']):
+            self._write(entry, text, entry['path'])
+
+
+class SpoolUploader(threading.Thread):
+    """
+    A daemon thread draining a DatazillaSpool through a DatazillaRequest
+    every `interval` seconds until stopped.
+    """
+
+    def __init__(self, spool, request, interval=30):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.spool = spool
+        self.request = request
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while True:
+            self.spool.drain(self.request)
+            self._stopped.wait(self.interval)
+            if self._stopped.isSet():
+                break
+
+    def stop(self):
+        """Stop after the drain in progress, or a last one, and wait."""
+        self._stopped.set()
+        self.join()
+
+
+def uploader_request(protocol, host, project, oauth_key, oauth_secret,
+                     **kw):
+    """
+    Return a DatazillaRequest for uploading ready-made datasets, made with
+    the further arguments `kw`. Such a request holds no results of its
+    own, so its branch is only a placeholder for the constructor's check.
+    """
+    return DatazillaRequest(protocol, host, project, oauth_key, oauth_secret,
+                            branch='(uploader)', **kw)
+
+
+def main(args=None, out=None):
+    """
+    Drain a spool directory from the command line, reporting progress to
+    `out` (stdout by default).
+    """
+    if args is None:
+        args = sys.argv[1:]
+    out = out or sys.stdout
+    parser = OptionParser(usage="%prog [options] SPOOL_DIRECTORY")
+    parser.add_option('--protocol', default='https')
+    parser.add_option('--host', default='datazilla.mozilla.org')
+    parser.add_option('--project')
+    parser.add_option('--key', default=os.environ.get('DATAZILLA_OAUTH_KEY'),
+                      help="OAuth key; defaults to $DATAZILLA_OAUTH_KEY")
+    parser.add_option('--secret',
+                      default=os.environ.get('DATAZILLA_OAUTH_SECRET'),
+                      help="OAuth secret; defaults to $DATAZILLA_OAUTH_SECRET")
+    parser.add_option('--interval', type='float', default=30,
+                      help="seconds between drains")
+    parser.add_option('--once', action='store_true',
+                      help="drain once and exit, rather than until empty")
+    options, args = parser.parse_args(args)
+    if len(args) != 1 or not options.project:
+        parser.error("a project and a spool directory are required")
+
+    spool = DatazillaSpool(args[0])
+    request = uploader_request(options.protocol, options.host,
+                               options.project, options.key, options.secret)
+    try:
+        while True:
+            sent, failed = spool.drain(request)
+            print >> out, "sent %d, failed %d, %d left" % (sent, failed, len(spool))
+            if options.once or not len(spool):
+                break
+            time.sleep(options.interval)
+    finally:
+        request.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Summary statistics of test results, computed with NumPy when it is
+installed and in pure Python otherwise; both give the same figures.
+
+A summary of a series of values is a dict of
+{"count", "mean", "median", "stddev", "min", "max", "geomean",
+ "filtered_mean"}, where stddev is the sample standard deviation, geomean
+is None unless all values are positive, and filtered_mean is the mean of
+the values within Tukey's fences (1.5 interquartile ranges beyond the
+quartiles).
+"""
+
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+OUTLIER_IQR = 1.5
+
+
+def percentile(ordered, fraction):
+    """Percentile of sorted values, interpolated as numpy does by default."""
+    position = (len(ordered) - 1) * fraction
+    low = int(math.floor(position))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _summarize_python(values):
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = math.fsum(ordered) / count
+    if count > 1:
+        variance = math.fsum([(v - mean) ** 2 for v in ordered]) / (count - 1)
+    else:
+        variance = 0.0
+    geomean = None
+    if ordered[0] > 0:
+        geomean = math.exp(math.fsum([math.log(v) for v in ordered]) / count)
+
+    q1, q3 = percentile(ordered, 0.25), percentile(ordered, 0.75)
+    low, high = (q1 - OUTLIER_IQR * (q3 - q1), q3 + OUTLIER_IQR * (q3 - q1))
+    kept = [v for v in ordered if low <= v <= high]
+
+    return {'count': count,
+            'mean': mean,
+            'median': percentile(ordered, 0.5),
+            'stddev': math.sqrt(variance),
+            'min': ordered[0],
+            'max': ordered[-1],
+            'geomean': geomean,
+            'filtered_mean': math.fsum(kept) / len(kept)}
+
+
+def _summarize_numpy(values):
+    if isinstance(values, array) and values.typecode == 'd':
+        ordered = numpy.frombuffer(values, dtype=numpy.float64)
+    else:
+        ordered = numpy.asarray(values, dtype=numpy.float64)
+    ordered = numpy.sort(ordered)
+    count = len(ordered)
+    mean = ordered.mean()
+    stddev = 0.0
+    if count > 1:
+        stddev = ordered.std(ddof=1)
+    geomean = None
+    if ordered[0] > 0:
+        geomean = float(numpy.exp(numpy.log(ordered).mean()))
+
+    q1, median, q3 = numpy.percentile(ordered, [25, 50, 75])
+    low, high = (q1 - OUTLIER_IQR * (q3 - q1), q3 + OUTLIER_IQR * (q3 - q1))
+    kept = ordered[(ordered >= low) & (ordered <= high)]
+
+    return {'count': count,
+            'mean': float(mean),
+            'median': float(median),
+            'stddev': float(stddev),
+            'min': float(ordered[0]),
+            'max': float(ordered[-1]),
+            'geomean': geomean,
+            'filtered_mean': float(kept.mean())}
+
+
+def summarize(values):
+    """Return the summary of a non-empty series of numbers."""
+    if numpy is not None:
+        return _summarize_numpy(values)
+    return _summarize_python(values)
+
+
+def suite_summary(summaries):
+    """
+    Summarize a suite from its tests' summaries: the number of tests and
+    replicates, and the geometric mean of the test means and medians
+    (None unless all are positive).
+    """
+    def geomean(values):
+        if not values or min(values) <= 0:
+            return None
+        return math.exp(math.fsum([math.log(v) for v in values]) / len(values))
+
+    summaries = summaries.values()
+    return {'tests': len(summaries),
+            'count': sum([s['count'] for s in summaries]),
+            'geomean_mean': geomean([s['mean'] for s in summaries]),
+            'geomean_median': geomean([s['median'] for s in summaries])}
+
+
+def summarize_suites(results):
+    """
+    Summarize a DatazillaResult.results dictionary, returning
+    {suite: {"tests": {test: summary}, "suite": suite summary}}.
+    Tests without values are left out.
+    """
+    summaries = {}
+    for suite, tests in results.items():
+        test_summaries = dict([(test, summarize(values))
+                               for test, values in tests.items() if len(values)])
+        summaries[suite] = {'tests': test_summaries,
+                            'suite': suite_summary(test_summaries)}
+    return summaries
@@ -0,0 +1,146 @@
+"""A local stand-in for the datazilla server, used by the tests."""
+
+import cgi
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+from hashlib import sha1
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        server.requests.append((self.path, dict(self.headers), body))
+
+        status = 200
+        if server.responses:
+            status = server.responses.pop(0)
+        if not status:
+            self.close_connection = 1 # dropped without a response
+            return
+        if status == 200:
+            params = cgi.parse_qs(body, keep_blank_values=True)
+            data = json.loads(urllib.unquote(params['data'][0]))
+            if isinstance(data, list):
+                server.datasets.extend(data)
+            else:
+                server.datasets.append(data)
+
+        response = '{"status": "%d"}' % status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition('?')
+        params = dict(urlparse.parse_qsl(query, keep_blank_values=True))
+        server.queries.append((path, params, dict(self.headers)))
+
+        status = 200
+        if server.responses:
+            status = server.responses.pop(0)
+        if not status:
+            self.close_connection = 1
+            return
+        data = server.documents.get(path)
+        if data is None and status == 200:
+            status = 404
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if 'limit' in params and server.paging:
+            offset = int(params.get('offset', 0))
+            data = data[offset:offset + int(params['limit'])]
+        response = json.dumps(data)
+        etag = '"%s"' % sha1(response).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            response = compressor.compress(response) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Accepts load_test POSTs on a local port, recording the raw requests and
+    the decoded datasets. Compressed bodies are decompressed before being
+    recorded. A `data` parameter holding a JSON list is treated
+    as a batch of datasets.
+
+    `responses` is a list of status codes to answer with, in order, before
+    falling back to 200; a status of 0 closes the connection without
+    answering. `delay` is a number of seconds to wait before handling each
+    request.
+
+    GET requests are answered with the JSON of `documents[path]`, sliced
+    by 'offset' and 'limit' parameters if given (unless `paging` is false), with an ETag honoured in
+    If-None-Match and gzipped if accepted, and recorded in `queries` as
+    (path, params, headers).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.datasets = []
+        self.responses = []
+        self.delay = 0
+        self.documents = {}
+        self.queries = []
+        self.paging = True
+        self.host = '127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        thread.setDaemon(True)
+        thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        pass # clients closing keep-alive connections
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import DatazillaRequest, DatazillaResult, DatazillaResultsCollection
+from dzclient.archive import Archive, ArchiveError, dump, from_datasets, load
+
+
+def collection(compact=False):
+    coll = DatazillaResultsCollection(
+        machine_name='qm-pxp01', os='linux', os_version='Ubuntu 11.10',
+        platform='x86_64', build_name='Firefox', version='14.0a2',
+        revision='785345035a3b', branch='Mozilla-Aurora',
+        id='20120228122102', test_date=1342229050, compact=compact)
+    coll.add_datazilla_result(DatazillaResult(
+        results={'tp5': {'a': [1.5, 2.25, 3.0], 'b': [4, 5]},
+                 'ts': {'c': [], u'd\xe9': [7.0]}},
+        results_aux={'tp5': {'main_rss': [10, 20]}},
+        results_xperf={'tp5': {'io': [[1, 'file'], [2, 'other']]}},
+        talos_aux={'ts': {'memory': [1e9, 2e9]}},
+        options={'tp5': {'tpcycles': 10}}))
+    return coll
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.dzc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """A loaded archive has the same datasets as the collection."""
+        original = collection()
+        original.results.add_testsuite('empty')
+        dump(original, self.path)
+
+        loaded = load(self.path)
+
+        self.assertEqual(sorted(loaded.datasets()), sorted(original.datasets()))
+        self.assertEqual(loaded.results.results['tp5']['b'], [4, 5])
+        self.assertEqual(type(loaded.results.results['tp5']['b'][0]), int)
+
+
+    def test_compact(self):
+        """Compact collections are archived and loaded as arrays."""
+        original = collection(compact=True)
+        dump(original, self.path)
+
+        loaded = load(self.path, compact=True)
+
+        values = loaded.results.results['tp5']['a']
+        self.assertTrue(isinstance(values, array))
+        self.assertEqual(values.tolist(), [1.5, 2.25, 3.0])
+        self.assertEqual(json.loads(json.dumps(sorted(loaded.datasets()))),
+                         json.loads(json.dumps(sorted(original.datasets()))))
+
+
+    def test_load_request(self):
+        """An archive can be loaded as a request, to be submitted again."""
+        dump(collection(), self.path)
+
+        req = load(self.path, DatazillaRequest, protocol='http',
+                   host='host', project='project', oauth_key='key',
+                   oauth_secret='secret')
+
+        self.assertEqual(req.branch, 'Mozilla-Aurora')
+        self.assertEqual(req.host, 'host')
+        self.assertEqual(len(req.datasets()), 2)
+
+
+    def test_columns(self):
+        """Numeric series are packed columns, readable in place."""
+        original = collection()
+        original.results.add_auxiliary_results('tp5', 'flags', [True, False])
+        dump(original, self.path)
+        flags = load(self.path).results.results_aux['tp5']['flags']
+        self.assertEqual(map(type, flags), [bool, bool])
+
+        archive = Archive(self.path)
+        try:
+            columns = dict([((c['block'], c['suite'], c['name']), c)
+                            for c in archive.columns])
+            column = columns[('results', 'tp5', 'a')]
+            self.assertEqual(len(archive.buffer(column)), 24)
+            self.assertEqual(archive.values(column, compact=True),
+                             array('d', [1.5, 2.25, 3.0]))
+            self.assertFalse(('results_xperf', 'tp5', 'io') in columns)
+            self.assertFalse(('results_aux', 'tp5', 'flags') in columns)
+            self.assertEqual(archive.other['results_xperf']['tp5']['io'],
+                             [[1, 'file'], [2, 'other']])
+        finally:
+            archive.close()
+
+
+    def test_smaller_than_json(self):
+        """Float-heavy archives are smaller than their JSON."""
+        coll = collection()
+        coll.results.add_test_results('tp5', 'long',
+                                      [i / 7.0 for i in range(10000)])
+        dump(coll, self.path)
+
+        self.assertTrue(os.path.getsize(self.path) <
+                        len(json.dumps(coll.datasets())) / 2)
+
+
+    def test_not_an_archive(self):
+        """Other files are rejected."""
+        f = open(self.path, 'wb')
+        f.write('{"results": {}}' * 4)
+        f.close()
+
+        self.assertRaises(ArchiveError, Archive, self.path)
+
+
+    def test_from_datasets(self):
+        """A collection is rebuilt from its datasets."""
+        original = collection()
+
+        rebuilt = from_datasets(json.loads(json.dumps(original.datasets())))
+
+        self.assertEqual(sorted(rebuilt.datasets()), sorted(original.datasets()))
+        self.assertEqual(rebuilt.machine_name, 'qm-pxp01')
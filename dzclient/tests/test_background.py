@@ -0,0 +1,100 @@
+import socket
+import threading
+import time
+import unittest
+from dzclient import AsyncDatazillaRequest, DatazillaResult, PendingTimeout, Cancelled
+from dzclient.workers import BackgroundWorkers
+from dzclient.tests.stubserver import StubServer
+
+
+class AsyncDatazillaRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def request(self, **kw):
+        req = AsyncDatazillaRequest(
+            'http', self.server.host, 'project', 'key', 'secret',
+            branch='mozilla-try', **kw)
+        req.add_datazilla_result(DatazillaResult(
+            dict([('suite%d' % i, {'test': [i]}) for i in range(6)])))
+        return req
+
+    def test_submit_async(self):
+        """submit_async queues every dataset and returns their Pendings."""
+        req = self.request()
+        pendings = req.submit_async()
+        statuses = [p.result(timeout=5).status for p in pendings]
+        req.close()
+
+        self.assertEqual(statuses, [200] * 6)
+        self.assertEqual(
+            sorted([d['testrun']['suite'] for d in self.server.datasets]),
+            ['suite%d' % i for i in range(6)])
+
+
+    def test_timeout(self):
+        """An upload to an unresponsive server times out."""
+        self.server.delay = 0.5
+        req = self.request(timeout=0.1)
+        pending = req.send_async({'some': 'data'})
+
+        self.assertTrue(isinstance(pending.exception(timeout=5), socket.timeout))
+        self.assertRaises(PendingTimeout, req.send_async({}).result, 0.01)
+        req.close()
+
+
+    def test_close_cancels(self):
+        """Closing with cancel=True cancels uploads not yet started."""
+        self.server.delay = 0.2
+        req = self.request(max_workers=1)
+        pendings = req.submit_async()
+        cancelled = []
+        pendings[-1].add_done_callback(cancelled.append)
+        req.close(cancel=True)
+
+        self.assertTrue(pendings[-1].cancelled())
+        self.assertEqual(cancelled, [pendings[-1]])
+        self.assertRaises(Cancelled, pendings[-1].result)
+        self.assertRaises(Cancelled, pendings[-1].exception)
+        self.assertTrue(len(self.server.requests) < 6)
+
+
+class BackgroundWorkersTest(unittest.TestCase):
+    def test_bounded_concurrency(self):
+        """No more than max_workers calls run at once."""
+        workers = BackgroundWorkers(2)
+        lock = threading.Lock()
+        running = [0, 0] # current, most
+
+        def call(i):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running)
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return i
+
+        pendings = [workers.start(call, i) for i in range(8)]
+        self.assertEqual([p.result(5) for p in pendings], range(8))
+        workers.shutdown()
+        self.assertEqual(running[1], 2)
+
+
+    def test_exception(self):
+        """A failing call's exception is raised from result()."""
+        workers = BackgroundWorkers(1)
+        pending = workers.start(int, 'not a number')
+
+        self.assertRaises(ValueError, pending.result, 5)
+        self.assertTrue(pending.done())
+        workers.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
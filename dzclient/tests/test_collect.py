@@ -0,0 +1,96 @@
+import cPickle as pickle
+import unittest
+from array import array
+
+from dzclient import DatazillaRequest, DatazillaResult
+from dzclient.collect import PackedResult, ProcessCollector, join_packed
+
+
+def page_result(page):
+    """Results of one page, as a worker returns them."""
+    if page == 'bad':
+        raise ValueError("cannot load page")
+    res = DatazillaResult()
+    res.add_test_results('tp5', page, [1.5 * len(page), 2.0])
+    res.add_talos_auxiliary('tp5', 'main_rss', [len(page)])
+    res.add_xperf_results('tp5', 'io', [[1, page]])
+    res.options['tp5'] = {'tpcycles': 2}
+    return res
+
+
+class PackedResultTest(unittest.TestCase):
+    def test_round_trip(self):
+        """Unpacking restores the series, integers and non-numeric ones."""
+        res = page_result('a')
+        res.add_testsuite('empty')
+
+        unpacked = pickle.loads(pickle.dumps(PackedResult(res), 2)).unpack()
+
+        self.assertEqual(unpacked.results, res.results)
+        self.assertEqual(unpacked.talos_aux, {'tp5': {'main_rss': [1]}})
+        self.assertEqual(type(unpacked.talos_aux['tp5']['main_rss'][0]), int)
+        self.assertEqual(unpacked.results_xperf, {'tp5': {'io': [[1, 'a']]}})
+        self.assertEqual(unpacked.options, res.options)
+
+
+    def test_smaller_pickle(self):
+        """Packed results pickle as a block of doubles."""
+        res = DatazillaResult()
+        res.add_test_results('tp5', 'a', [i / 7.0 for i in range(1000)])
+
+        self.assertTrue(len(pickle.dumps(PackedResult(res), 2)) <
+                        len(pickle.dumps(res, 2)) * 0.9)
+
+
+    def test_join_packed(self):
+        """Packed results are joined in order, compactly if asked."""
+        packed = [PackedResult(page_result(page)) for page in ('a', 'bb')]
+        packed.append(PackedResult(DatazillaResult({'ts': {}})))
+
+        res = join_packed(packed, compact=True)
+
+        self.assertEqual(sorted(res.results.keys()), ['tp5', 'ts'])
+        self.assertEqual(res.results['tp5']['bb'], array('d', [3.0, 2.0]))
+        self.assertEqual(res.talos_aux['tp5']['main_rss'],
+                         array('d', [1, 2]))
+        self.assertEqual(res.results_xperf['tp5']['io'],
+                         [[1, 'a'], [1, 'bb']])
+
+
+class ProcessCollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.collector = ProcessCollector(processes=2)
+
+    def tearDown(self):
+        self.collector.terminate()
+
+    def test_map(self):
+        """Results of the workers are joined in order."""
+        res = self.collector.map(page_result, ['a', 'bb', 'ccc'])
+
+        self.assertEqual(res.results,
+                         {'tp5': {'a': [1.5, 2.0], 'bb': [3.0, 2.0],
+                                  'ccc': [4.5, 2.0]}})
+        self.assertEqual(res.talos_aux, {'tp5': {'main_rss': [1, 2, 3]}})
+        self.assertEqual(res.options, {'tp5': {'tpcycles': 2}})
+
+
+    def test_collect(self):
+        """Joined results are added to a collection."""
+        req = DatazillaRequest('http', 'host', 'project', 'key', 'secret',
+                               branch='mozilla-try', compact=True)
+        collector = ProcessCollector(processes=2, compact=True)
+        try:
+            collector.collect(req, page_result, ['a', 'bb'])
+        finally:
+            collector.close()
+
+        self.assertEqual(len(req.datasets()), 1)
+        self.assertEqual(req.results.results['tp5']['a'],
+                         array('d', [1.5, 2.0]))
+
+
+    def test_error(self):
+        """An exception in a worker is raised in the parent."""
+        self.assertRaises(ValueError, self.collector.map, page_result,
+                          ['a', 'bad'])
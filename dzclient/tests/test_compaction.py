@@ -0,0 +1,164 @@
+import math
+import unittest
+
+from dzclient import AutoFlushingResult, DatazillaRequest, DatazillaResult
+from dzclient.compaction import Buckets, Compactor, Downsample, RunLength, lttb
+
+class LTTBTest(unittest.TestCase):
+    def test_shape(self):
+        """The ends and peaks of a series are kept."""
+        ys = [math.sin(i / 10.0) for i in range(1000)]
+        ys[500] = 5
+        kept = lttb(range(1000), ys, 50)
+
+        self.assertEqual(len(kept), 50)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertTrue(500 in kept)
+        self.assertEqual(kept, sorted(kept))
+
+    def test_short(self):
+        """Series no longer than the points asked for are kept whole."""
+        self.assertEqual(lttb([1, 2, 3], [4, 5, 6], 5), [0, 1, 2])
+
+class CompactorsTest(unittest.TestCase):
+    def test_downsample(self):
+        """Downsampling bounds the series as values are added."""
+        down = Downsample(100, index=True)
+        for start in range(0, 10000, 7):
+            down.add([start == 7000 and 1000 or 1] * 7)
+
+        self.assertTrue(len(down.output) <= 200)
+        self.assertEqual(down.output[0], [0, 1])
+        self.assertTrue([7000, 1000] in down.output)
+        self.assertEqual(down.count, 10003)
+
+    def test_downsample_pairs(self):
+        """[x, y] items are downsampled by their coordinates, whole."""
+        down = Downsample(3)
+        down.add([[i * 10, i % 3, 'file%d' % i] for i in range(7)])
+
+        self.assertEqual(len(down.output), 3)
+        self.assertEqual(down.output[0], [0, 0, 'file0'])
+
+    def test_run_length(self):
+        """Runs of values, or of differences, are encoded losslessly."""
+        values = [5, 5, 5, 7, 7, 5]
+        rle = RunLength()
+        rle.add(values[:4])
+        rle.add(values[4:])
+        self.assertEqual(rle.output, [[5, 3], [7, 2], [5, 1]])
+        self.assertEqual(RunLength.decode(rle.output), values)
+
+        counter = range(1000, 2000, 4) + [3000]
+        delta = RunLength(delta=True)
+        delta.add(counter)
+        self.assertEqual(delta.output, [[1000, 1], [4, 249], [1004, 1]])
+        self.assertEqual(RunLength.decode(delta.output, delta=True), counter)
+
+    def test_buckets(self):
+        """Values are summarized per bucket, the last one as it fills."""
+        buckets = Buckets(4, percentiles=(50,))
+        buckets.add([4, 1, 3, 2, 10])
+        self.assertEqual(buckets.output, [[4, 1, 4, 2.5, 2.5],
+                                          [1, 10, 10, 10.0, 10]])
+        buckets.add([20, 30, 40])
+        self.assertEqual(buckets.output[1], [4, 10, 40, 25.0, 25.0])
+
+    def test_bucket_merging(self):
+        """Past max_buckets, buckets are merged and grow."""
+        buckets = Buckets(10, max_buckets=4)
+        buckets.add(range(100))
+
+        self.assertTrue(len(buckets.output) <= 5)
+        self.assertEqual(sum([b[0] for b in buckets.output]), 100)
+        self.assertEqual(buckets.output[0][:4], [40, 0, 39, 19.5])
+
+    def test_not_accepted(self):
+        """Values a compactor does not accept leave it unchanged."""
+        buckets = Buckets(2)
+        buckets.add([1])
+        self.assertRaises(TypeError, buckets.add, [2, ('a.dll', 10, 20)])
+        self.assertEqual(buckets.output, [[1, 1, 1, 1.0]])
+
+        delta = RunLength(delta=True)
+        self.assertFalse(delta.accepts([('a.dll', 10, 20)]))
+        self.assertTrue(RunLength().accepts([('a.dll', 10, 20)]))
+        self.assertFalse(Downsample().accepts([('a.dll', 10, 20)]))
+
+        identity = Compactor()
+        identity.add([('a.dll', 10, 20)])
+        self.assertEqual(identity.output, [('a.dll', 10, 20)])
+
+
+class CompactionTest(unittest.TestCase):
+    def test_result(self):
+        """Named and '*' counter series are compacted as they are added."""
+        res = DatazillaResult(compaction={'memory': Buckets(100),
+                                          '*': RunLength()})
+        res.add_test_results('tp5', 'memory', [1, 1])
+        for i in range(10):
+            res.add_talos_auxiliary('tp5', 'memory', range(100))
+            res.add_xperf_results('tp5', 'io', [0] * 100)
+
+        self.assertEqual(res.results['tp5']['memory'], [1, 1])
+        self.assertEqual(len(res.talos_aux['tp5']['memory']), 10)
+        self.assertEqual(res.results_xperf['tp5']['io'], [[0, 1000]])
+
+        req = DatazillaRequest('http', 'host', 'project', 'key', 'secret',
+                               branch='mozilla-try')
+        req.add_datazilla_result(res)
+        dataset = req.datasets()[0]
+        self.assertEqual(dataset['results_xperf'], {'io': [[0, 1000]]})
+
+    def test_xperf_tuples(self):
+        """Series the compactor does not accept are stored as they are."""
+        res = DatazillaResult(compaction={'*': Buckets(2)})
+        res.add_xperf_results('tp5', 'file_io', [('a.dll', 10, 20)])
+        res.add_xperf_results('tp5', 'file_io', [('b.dll', 1, 2)])
+        res.add_xperf_results('tp5', 'io', [1, 2, 3])
+
+        self.assertEqual(res.results_xperf['tp5'],
+                         {'file_io': [('a.dll', 10, 20), ('b.dll', 1, 2)],
+                          'io': [[2, 1, 2, 1.5], [1, 3, 3, 3.0]]})
+        self.assertRaises(TypeError, res.add_xperf_results, 'tp5', 'io',
+                          ['x'])
+        self.assertEqual(res.results_xperf['tp5']['io'][-1], [1, 3, 3, 3.0])
+
+        # a replaced series is checked afresh
+        res.add_testsuite('tp5')
+        res.add_xperf_results('tp5', 'file_io', [4, 5])
+        self.assertEqual(res.results_xperf['tp5']['file_io'],
+                         [[2, 4, 5, 4.5]])
+
+    def test_join(self):
+        """Joined values are compacted, never adopted."""
+        res = DatazillaResult(compaction={'*': RunLength()})
+        res.join_results(DatazillaResult(talos_aux={'ts': {'rss': [3, 3]}}),
+                         take=True)
+        res.join_results(DatazillaResult(talos_aux={'ts': {'rss': [3]}}))
+
+        self.assertEqual(res.talos_aux, {'ts': {'rss': [[3, 3]]}})
+
+    def test_replaced_series(self):
+        """A series removed or replaced is compacted afresh."""
+        res = DatazillaResult(compaction={'*': RunLength()})
+        res.add_talos_auxiliary('ts', 'rss', [1, 1])
+        del res.talos_aux['ts']
+        res.add_talos_auxiliary('ts', 'rss', [1])
+        self.assertEqual(res.talos_aux['ts']['rss'], [[1, 1]])
+
+        res.add_testsuite('ts', talos_aux={'rss': [2, 2]})
+        res.add_talos_auxiliary('ts', 'rss', [2])
+        self.assertEqual(res.talos_aux['ts']['rss'], [[2, 3]])
+
+    def test_flushing_counts(self):
+        """Auto-flushing results count the compacted values they hold."""
+        req = DatazillaRequest('http', 'host', 'project', 'key', 'secret',
+                               branch='mozilla-try')
+        res = AutoFlushingResult(req, max_values=1000,
+                                 compaction={'*': Downsample(10)})
+        for i in range(100):
+            res.add_talos_auxiliary('ts', 'rss', range(10))
+
+        self.assertTrue(res.counts['ts'] <= 20)
+        self.assertEqual(res.counts['ts'], len(res.talos_aux['ts']['rss']))
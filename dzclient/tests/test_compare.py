@@ -0,0 +1,156 @@
+import random
+import unittest
+from array import array
+
+from mock import patch
+
+from dzclient import DatazillaRequest, DatazillaResult
+from dzclient import compare
+from dzclient.compare import (attach_comparison, compare_results,
+                              regressions)
+
+
+def result(tests, compact=False):
+    res = DatazillaResult(compact=compact)
+    for test, values in tests.items():
+        res.add_test_results('tp5', test, values)
+    return res
+
+
+def runs(shift=0, count=25, seed=0):
+    rand = random.Random(seed)
+    return [rand.gauss(100 + shift, 5) for i in range(count)]
+
+
+class SpecialFunctionsTest(unittest.TestCase):
+    def check(self, m):
+        self.assertAlmostEqual(compare._t_pvalue(2.0, 10.0, m), 0.0733880, 6)
+        self.assertAlmostEqual(compare._t_critical(10.0, 0.95, m), 2.2281389, 6)
+        self.assertAlmostEqual(compare._t_critical(1.0, 0.95, m), 12.706205, 5)
+        self.assertAlmostEqual(compare._t_critical(4.0, 0.99, m), 4.604095, 5)
+        self.assertAlmostEqual(compare._erfc(1.0, m), 0.1572992, 6)
+        self.assertAlmostEqual(compare._erfc(-0.5, m), 1.5204999, 6)
+
+    def test_python(self):
+        """The distributions are computed exactly enough for floats."""
+        self.check(compare._ScalarMath)
+
+    def test_numpy(self):
+        """...and for arrays."""
+        if compare.numpy is None:
+            return
+        numpy = compare.numpy
+        self.assertTrue(numpy.allclose(
+            compare._t_pvalue(numpy.array([2.0, 1.0]),
+                              numpy.array([10.0, 3.0]), numpy),
+            [0.0733880, 0.3910022]))
+        self.check(numpy)
+
+
+class CompareTest(unittest.TestCase):
+    def test_verdicts(self):
+        """Significant changes are regressions or improvements."""
+        current = result({'slower': runs(10), 'faster': runs(-10),
+                          'same': runs(0, seed=1), 'small': runs(3, 200)})
+        baseline = result({'slower': runs(), 'faster': runs(), 'same': runs(),
+                           'small': runs(0, 200, seed=2), 'new': runs()})
+
+        comparison = compare_results(current, baseline)['tp5']
+
+        self.assertEqual(sorted(comparison.keys()),
+                         ['faster', 'same', 'slower', 'small'])
+        self.assertEqual(comparison['slower']['verdict'], 'regression')
+        self.assertEqual(comparison['faster']['verdict'], 'improvement')
+        self.assertEqual(comparison['same']['verdict'], 'unchanged')
+        self.assertEqual(comparison['small']['verdict'], 'regression')
+        slower = comparison['slower']
+        self.assertAlmostEqual(slower['delta'], 10, 0)
+        self.assertTrue(slower['ci_low'] < slower['delta'] < slower['ci_high'])
+        self.assertTrue(slower['t_pvalue'] < 0.001)
+        self.assertTrue(slower['u_pvalue'] < 0.001)
+
+        comparison = compare_results(current, baseline, min_change=5,
+                                     lower_is_better=False)['tp5']
+        self.assertEqual(comparison['slower']['verdict'], 'improvement')
+        self.assertEqual(comparison['small']['verdict'], 'unchanged')
+
+
+    def test_mann_whitney(self):
+        """U and its p-value are as by the normal approximation."""
+        current = result({'a': [1, 2, 3, 4, 5]})
+        baseline = result({'a': [6, 7, 8, 9, 10]})
+
+        figures = compare_results(current, baseline,
+                                  method='mannwhitney')['tp5']['a']
+
+        self.assertEqual(figures['u'], 0)
+        self.assertAlmostEqual(figures['u_pvalue'], 0.012186, 5)
+        self.assertEqual(figures['verdict'], 'improvement')
+
+
+    def test_ties(self):
+        """Tied values share their mean rank."""
+        current = result({'a': [1, 2, 2, 3]})
+        baseline = result({'a': [2, 2, 4, 4]})
+
+        figures = compare_results(current, baseline)['tp5']['a']
+
+        self.assertEqual(figures['u'], 4.0)
+        self.assertAlmostEqual(figures['u_pvalue'], 0.27845, 4)
+
+
+    def test_python_matches_numpy(self):
+        """Both implementations give the same figures."""
+        current = result({'a': runs(2), 'b': [1, 1, 1], 'c': runs(1, 7)})
+        baseline = result({'a': runs(), 'b': [1, 1, 2], 'c': runs(0, 40)})
+
+        fast = compare_results(current, baseline)
+        patcher = patch.object(compare, 'numpy', None)
+        patcher.start()
+        try:
+            slow = compare_results(current, baseline)
+        finally:
+            patcher.stop()
+
+        for test in fast['tp5']:
+            for name, value in fast['tp5'][test].items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(value, slow['tp5'][test][name], 9)
+                else:
+                    self.assertEqual(value, slow['tp5'][test][name])
+
+
+    def test_degenerate(self):
+        """Runs without variance or replicates are handled."""
+        current = result({'constant': [5, 5, 5], 'moved': [6, 6],
+                          'single': [1]}, compact=True)
+        baseline = result({'constant': [5, 5], 'moved': [5, 5],
+                           'single': [1, 2]})
+
+        comparison = compare_results(current, baseline)['tp5']
+
+        self.assertEqual(comparison['constant']['t'], None)
+        self.assertEqual(comparison['constant']['t_pvalue'], 1.0)
+        self.assertEqual(comparison['constant']['verdict'], 'unchanged')
+        self.assertEqual(comparison['moved']['t_pvalue'], 0.0)
+        self.assertEqual(comparison['moved']['verdict'], 'regression')
+        self.assertEqual(comparison['single']['verdict'], 'insufficient')
+        self.assertEqual(comparison['single']['delta'], -0.5)
+        self.assertEqual(comparison['single']['t_pvalue'], None)
+
+
+    def test_attach(self):
+        """Comparisons are submitted with their suite's options."""
+        current = result({'a': runs(10)})
+        comparison = current.compare(result({'a': runs()}))
+        attach_comparison(current, comparison)
+
+        req = DatazillaRequest('http', 'host', 'project', 'key', 'secret',
+                               branch='mozilla-try')
+        req.add_datazilla_result(current)
+        options = req.datasets()[0]['testrun']['options']
+
+        self.assertEqual(options['baseline_comparison']['a']['verdict'],
+                         'regression')
+        self.assertEqual([(s, t) for s, t, f in regressions(comparison)],
+                         [('tp5', 'a')])
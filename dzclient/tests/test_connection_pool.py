@@ -0,0 +1,175 @@
+import httplib
+import socket
+import unittest
+from mock import patch, Mock
+from dzclient import ConnectionPool, DatazillaRequest, DatazillaResult
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_reuses_connection_once_response_read(self, mock_HTTPConnection):
+        """A connection is reused after its response has been read."""
+        mock_HTTPConnection.return_value.getresponse.return_value.isclosed.return_value = True
+        pool = ConnectionPool()
+
+        pool.request('http', 'host', 'POST', '/path', 'body')
+        pool.request('http', 'host', 'POST', '/path', 'body')
+
+        self.assertEqual(mock_HTTPConnection.call_count, 1)
+        self.assertEqual(mock_HTTPConnection.return_value.request.call_count, 2)
+
+
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_pending_response_not_reused(self, mock_HTTPConnection):
+        """A connection whose response is unread is not handed out."""
+        mock_HTTPConnection.return_value.getresponse.return_value.isclosed.return_value = False
+        pool = ConnectionPool()
+
+        pool.request('http', 'host', 'POST', '/path', 'body')
+        pool.request('http', 'host', 'POST', '/path', 'body')
+
+        self.assertEqual(mock_HTTPConnection.call_count, 2)
+
+
+    @patch("dzclient.pool.httplib.HTTPSConnection")
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_keyed_by_protocol_and_host(self, mock_HTTP, mock_HTTPS):
+        """Connections are only shared for the same protocol and host."""
+        pool = ConnectionPool()
+
+        conn, reused = pool.get('http', 'host')
+        self.assertFalse(reused)
+        pool.put('http', 'host', conn)
+
+        self.assertEqual(pool.get('http', 'host'), (conn, True))
+        self.assertEqual(pool.get('http', 'other')[1], False)
+        self.assertEqual(pool.get('https', 'host')[1], False)
+        self.assertEqual(mock_HTTPS.call_count, 1)
+
+
+    def test_bounded_size(self):
+        """The pool closes the oldest idle connections beyond maxsize."""
+        pool = ConnectionPool(maxsize=2)
+        conns = [Mock() for i in range(3)]
+        for conn in conns:
+            pool.put('http', 'host', conn)
+
+        self.assertEqual(conns[0].close.call_count, 1)
+        self.assertEqual(conns[1].close.call_count, 0)
+        self.assertEqual(pool.get('http', 'host'), (conns[1], True))
+
+
+    @patch("dzclient.pool.time.time")
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_idle_eviction(self, mock_HTTPConnection, mock_time):
+        """Connections idle beyond idle_timeout are closed, not reused."""
+        pool = ConnectionPool(idle_timeout=10)
+        stale = Mock()
+        mock_time.return_value = 100
+        pool.put('http', 'host', stale)
+
+        mock_time.return_value = 111
+        conn, reused = pool.get('http', 'host')
+
+        self.assertFalse(reused)
+        self.assertEqual(stale.close.call_count, 1)
+        self.assertEqual(conn, mock_HTTPConnection.return_value)
+
+
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_retry_stale_connection(self, mock_HTTPConnection):
+        """A request failing on a reused connection is retried on a new one."""
+        stale = Mock()
+        stale.request.side_effect = socket.error("connection reset")
+        pool = ConnectionPool()
+        pool.put('http', 'host', stale)
+
+        response = pool.request('http', 'host', 'POST', '/path', 'body')
+
+        self.assertEqual(stale.close.call_count, 1)
+        self.assertEqual(
+            response, mock_HTTPConnection.return_value.getresponse.return_value)
+
+
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_retry_only_unsent(self, mock_HTTPConnection):
+        """A request the server may have handled is not sent again."""
+        pool = ConnectionPool()
+        stale = Mock()
+        stale.getresponse.side_effect = httplib.BadStatusLine('')
+        pool.put('http', 'host', stale)
+        pool.request('http', 'host', 'POST', '/path', 'body')
+        self.assertEqual(mock_HTTPConnection.return_value.request.call_count, 1)
+
+        pool = ConnectionPool()
+        reset = Mock()
+        reset.getresponse.side_effect = socket.error("connection reset")
+        pool.put('http', 'host', reset)
+        self.assertRaises(socket.error, pool.request, 'http', 'host', 'POST',
+                          '/path', 'body')
+        self.assertEqual(mock_HTTPConnection.return_value.request.call_count, 1)
+
+
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_timeouts_reset(self, mock_HTTPConnection):
+        """Timeouts set for one request do not stay on the connection."""
+        conn = mock_HTTPConnection.return_value
+        conn.timeout = 30 # as set by HTTPConnection(host, timeout=30)
+        conn.sock = None
+        def connect():
+            conn.sock = Mock()
+        conn.connect.side_effect = connect
+        conn.getresponse.return_value.isclosed.return_value = True
+        pool = ConnectionPool(timeout=30)
+
+        pool.request('http', 'host', 'POST', '/path', 'body',
+                     timeouts=(1, 2))
+        self.assertEqual(conn.timeout, 1)
+        conn.sock.settimeout.assert_called_with(2)
+
+        self.assertEqual(pool.get('http', 'host'), (conn, True))
+        self.assertEqual(conn.timeout, 30)
+        conn.sock.settimeout.assert_called_with(30)
+
+
+    def test_close(self):
+        """Closing the pool, directly or as a context manager, closes idle connections."""
+        conn = Mock()
+        pool = ConnectionPool()
+        pool.put('http', 'host', conn)
+        pool.__enter__()
+        pool.__exit__(None, None, None)
+
+        self.assertEqual(conn.close.call_count, 1)
+        self.assertEqual(pool.get('http', 'host')[1], False)
+
+
+    @patch("dzclient.pool.httplib.HTTPConnection")
+    def test_submit_shares_connection(self, mock_HTTPConnection):
+        """Sending several datasets reuses one pooled connection."""
+        mock_HTTPConnection.return_value.getresponse.return_value.isclosed.return_value = True
+        req = DatazillaRequest(
+            'http', 'host', 'project', None, None, branch='mozilla-try')
+        req.add_datazilla_result(DatazillaResult(
+            {'suite1': {'test1': [1]}, 'suite2': {'test2': [2]}}))
+
+        req.submit()
+
+        self.assertEqual(mock_HTTPConnection.call_count, 1)
+        self.assertEqual(mock_HTTPConnection.return_value.request.call_count, 2)
+
+
+    def test_shared_pool(self):
+        """Requests can share a pool, and closing a request closes it."""
+        pool = Mock()
+        req = DatazillaRequest(
+            'http', 'host', 'project', None, None, pool=pool,
+            branch='mozilla-try')
+
+        self.assertTrue(req.pool is pool)
+        req.close()
+        self.assertEqual(pool.close.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
+import time
 import unittest
 from mock import patch
-from dzclient import DatazillaRequest, DatazillaResult, DatazillaResultsCollection
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import DatazillaRequest, DatazillaResult, DatazillaResultsCollection, DatazillaSubmitError
+from dzclient.tests.stubserver import StubServer
 
 
 class DatazillaRequestTest(unittest.TestCase):
@@ -58,6 +66,19 @@ class DatazillaRequestTest(unittest.TestCase):
         self.assertEqual(req.oauth_key, 'key')
         self.assertEqual(req.oauth_secret, 'secret')
 
+    def test_create_taking_results(self):
+        """create() can move the collection's results into the request."""
+        collection = DatazillaResultsCollection(branch='mozilla-try')
+        values = [1, 2, 3]
+        collection.add_datazilla_result(
+            DatazillaResult({'suite': {'test': values}}), take=True)
+
+        req = DatazillaRequest.create(
+            'http', 'host', 'project', 'key', 'secret', collection, take=True)
+
+        self.assertTrue(req.results.results['suite']['test'] is values)
+        self.assertEqual(collection.results.results, {})
+
     def test_datasets(self):
         """Tests dataset creation for submission to datazilla"""
 
@@ -103,6 +124,29 @@ class DatazillaRequestTest(unittest.TestCase):
             self.assertTrue(suite in results)
             self.assertEqual(dataset['results'], results[suite])
 
+    def test_iter_datasets_shares_results(self):
+        """iter_datasets() yields the datasets without copying results."""
+        req = DatazillaRequest(
+            'http', 'host', 'project', 'key', 'secret', branch='mozilla-try')
+        res = DatazillaResult({'suite': {'test': [1]}})
+        res.add_xperf_results('suite', 'counter', [1, 2])
+        req.add_datazilla_result(res)
+
+        shared = list(req.iter_datasets())
+        copied = req.datasets()
+
+        self.assertEqual(shared, copied)
+        self.assertTrue(
+            shared[0]['results'] is req.results.results['suite'])
+        self.assertTrue(
+            shared[0]['results_xperf'] is req.results.results_xperf['suite'])
+        self.assertFalse(
+            copied[0]['results']['test'] is req.results.results['suite']['test'])
+
+        # header dicts are per dataset
+        shared[0]['testrun']['suite'] = 'changed'
+        self.assertEqual(list(req.iter_datasets())[0]['testrun']['suite'], 'suite')
+
     @patch.object(DatazillaRequest, 'send')
     def test_submit(self, mock_send):
         """Submits blob of JSON data for each test suite."""
@@ -171,6 +215,123 @@ class DatazillaRequestTest(unittest.TestCase):
         self.assertEqual(data1['testrun']['date'], req.test_date)
 
 
+    def test_submit_concurrently(self):
+        """Concurrent submission returns responses in dataset order."""
+        req = DatazillaRequest(
+            'http', 'host', 'project', 'key', 'secret',
+            branch='mozilla-try', max_workers=4)
+        results = dict([('suite%d' % i, {'test': [i]}) for i in range(10)])
+        req.add_datazilla_result(DatazillaResult(results))
+
+        def send(dataset):
+            # finish out of order
+            value = dataset['results']['test'][0]
+            time.sleep(0.001 * (10 - value))
+            return dataset['testrun']['suite']
+
+        req.send = send
+        responses = req.submit()
+
+        self.assertEqual(
+            responses, [d['testrun']['suite'] for d in req.datasets()])
+
+
+    def test_submit_concurrently_reports_failures(self):
+        """A failing dataset does not stop the others from being sent."""
+        req = DatazillaRequest(
+            'http', 'host', 'project', 'key', 'secret', branch='mozilla-try')
+        req.add_datazilla_result(DatazillaResult(
+            {'suite1': {'test1': [1]}, 'suite2': {'test2': [2]}}))
+        error = IOError("host unreachable")
+
+        def send(dataset):
+            if dataset['testrun']['suite'] == 'suite1':
+                raise error
+            return 'ok'
+
+        req.send = send
+        try:
+            req.submit(max_workers=2)
+        except DatazillaSubmitError, e:
+            suites = [d['testrun']['suite'] for d in req.datasets()]
+            failed = suites.index('suite1')
+            self.assertEqual(e.errors, {failed: error})
+            self.assertEqual(e.responses[failed], None)
+            self.assertEqual(e.responses[1 - failed], 'ok')
+        else:
+            self.fail("DatazillaSubmitError not raised")
+
+
+    def test_batches(self):
+        """Datasets are packed into batches bounded by count and size."""
+        req = DatazillaRequest(
+            'http', 'host', 'project', 'key', 'secret',
+            branch='mozilla-try', batch_max_datasets=2)
+        results = dict([('suite%d' % i, {'test': [i]}) for i in range(5)])
+        req.add_datazilla_result(DatazillaResult(results))
+
+        batches = req.batches()
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertEqual(sum(batches, []), req.datasets())
+
+        size = len(json.dumps(req.datasets()[0])) + 2
+        req.batch_max_datasets = None
+        req.batch_max_bytes = size * 3
+        self.assertEqual([len(b) for b in req.batches()], [3, 2])
+
+        # a dataset too large for any batch goes on its own
+        req.batch_max_bytes = 1
+        self.assertEqual([len(b) for b in req.batches()], [1] * 5)
+
+
+    def test_submit_batches_to_server(self):
+        """A batched submission posts a handful of requests to the server."""
+        server = StubServer().start()
+        req = DatazillaRequest(
+            'http', server.host, 'project', 'key', 'secret',
+            branch='mozilla-try', batch_max_datasets=4)
+        try:
+            results = dict([('suite%d' % i, {'test': [i]}) for i in range(10)])
+            req.add_datazilla_result(DatazillaResult(results))
+
+            responses = req.submit()
+
+            self.assertEqual([r.status for r in responses], [200] * 3)
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(
+                sorted([d['testrun']['suite'] for d in server.datasets]),
+                sorted(results.keys()))
+        finally:
+            req.close()
+            server.stop()
+
+
+    def test_submit_compact_batches(self):
+        """Batches of compactly stored datasets are sent, as floats."""
+        server = StubServer().start()
+        req = DatazillaRequest(
+            'http', server.host, 'project', 'key', 'secret',
+            branch='mozilla-try', batch_max_datasets=4, compact=True)
+        try:
+            results = DatazillaResult(compact=True)
+            for i in range(5):
+                results.add_test_results('suite%d' % i, 'test', [i, 1])
+                results.add_xperf_results('suite%d' % i, 'io', [('a.dll', i)])
+            req.add_datazilla_result(results)
+
+            responses = req.submit()
+
+            self.assertEqual([r.status for r in responses], [200] * 2)
+            datasets = sorted(server.datasets,
+                              key=lambda d: d['testrun']['suite'])
+            self.assertEqual(datasets[3]['results'], {'test': [3.0, 1.0]})
+            self.assertEqual(datasets[3]['results_xperf'],
+                             {'io': [['a.dll', 3]]})
+        finally:
+            req.close()
+            server.stop()
+
+
     @patch("dzclient.client.oauth.generate_nonce")
     @patch("dzclient.client.oauth.time.time")
     @patch("dzclient.client.httplib.HTTPConnection")
@@ -203,7 +364,7 @@ class DatazillaRequestTest(unittest.TestCase):
         method, path, data, header = mock_request.call_args[0]
         self.assertEqual(method, "POST")
         self.assertEqual(path, "/project/api/load_test")
-        self.assertEqual(data, 'oauth_body_hash=2jmj7l5rSw0yVb%2FvlWAYkK%2FYBwk%3D&oauth_nonce=46810593&oauth_timestamp=1342229050&oauth_consumer_key=oauth-key&oauth_signature_method=HMAC-SHA1&oauth_version=1.0&oauth_token=&user=project&oauth_signature=mKpovMfgWJqlcVKSdcTCbw4gfaM%3D&data=%257B%2522some%2522%253A%2520%2522data%2522%257D')
+        self.assertEqual(data, 'data=%257B%2522some%2522%253A%2520%2522data%2522%257D&oauth_body_hash=2jmj7l5rSw0yVb%2FvlWAYkK%2FYBwk%3D&oauth_consumer_key=oauth-key&oauth_nonce=46810593&oauth_signature=mKpovMfgWJqlcVKSdcTCbw4gfaM%3D&oauth_signature_method=HMAC-SHA1&oauth_timestamp=1342229050&oauth_token=&oauth_version=1.0&user=project')
 
         self.assertEqual(
             header['Content-type'],
@@ -1,5 +1,6 @@
 import unittest
-from dzclient import DatazillaResult
+from array import array
+from dzclient import DatazillaResult, DatazillaResultsCollection
 
 
 class DatazillaResultTest(unittest.TestCase):
@@ -74,5 +75,93 @@ class DatazillaResultTest(unittest.TestCase):
                 }
             )
 
+    def test_join_results_take(self):
+        """Joining with take=True moves the value lists, emptying the source."""
+        values = [1, 2]
+        other = DatazillaResult({"suite": {"test": values}})
+        other.add_talos_auxiliary("suite", "memory", [3])
+        res = DatazillaResult({"suite": {"existing": [0]}})
+
+        res.join_results(other, take=True)
+
+        self.assertTrue(res.results["suite"]["test"] is values)
+        self.assertEqual(res.results, {"suite": {"existing": [0], "test": [1, 2]}})
+        self.assertEqual(res.talos_aux, {"suite": {"memory": [3]}})
+        self.assertEqual(other.results, {})
+        self.assertEqual(other.talos_aux, {})
+
+
+    def test_join_all(self):
+        """Many results are merged at once, in order."""
+        parts = [DatazillaResult({"suite": {"test": [i]}}, options={"suite": {"i": i}})
+                 for i in range(5)]
+        first = parts[0].results["suite"]["test"]
+        res = DatazillaResult()
+
+        res.join_all(parts)
+
+        self.assertEqual(res.results, {"suite": {"test": [0, 1, 2, 3, 4]}})
+        self.assertEqual(res.options, {"suite": {"i": 4}})
+        self.assertFalse(res.results["suite"]["test"] is first)
+        self.assertEqual(parts[0].results, {"suite": {"test": [0]}})
+
+
+    def test_join_all_take_compact(self):
+        """Only series in the receiver's storage format are adopted."""
+        compact = DatazillaResult(compact=True)
+        compact.add_test_results("suite", "test", [1])
+        values = compact.results["suite"]["test"]
+        res = DatazillaResult(compact=True)
+
+        res.join_all([DatazillaResult({"suite": {"other": [2]}}), compact],
+                     take=True)
+
+        self.assertTrue(res.results["suite"]["test"] is values)
+        self.assertEqual(res.results["suite"]["other"], array('d', [2]))
+
+    def test_compact_storage(self):
+        """Compact results store values in arrays behind the same API."""
+        res = DatazillaResult(compact=True)
+        res.add_test_results("suite", "test", [1, 2])
+        res.add_test_results("suite", "test", [3.5])
+        res.add_talos_auxiliary("suite", "memory", [10, 20])
+
+        self.assertEqual(res.results["suite"]["test"], array('d', [1, 2, 3.5]))
+        self.assertEqual(res.talos_aux["suite"]["memory"], array('d', [10, 20]))
+
+
+    def test_compact_storage_non_numeric(self):
+        """Series with non-numeric values fall back to lists."""
+        res = DatazillaResult(compact=True)
+        res.add_xperf_results("suite", "name", [1, 2])
+        res.add_xperf_results("suite", "name", [[1, 'hello'], 3])
+
+        self.assertEqual(res.results_xperf["suite"]["name"], [1, 2, [1, 'hello'], 3])
+
+
+    def test_compact_join_results(self):
+        """Compact and list-backed results can be joined either way."""
+        compact = DatazillaResult(compact=True)
+        compact.add_test_results("suite", "test", [1])
+        plain = DatazillaResult({"suite": {"test": [2]}})
+
+        plain.join_results(compact)
+        compact.join_results(DatazillaResult({"suite": {"test": [2]}}))
+
+        self.assertEqual(plain.results, {"suite": {"test": [2, 1]}})
+        self.assertEqual(compact.results["suite"]["test"], array('d', [1, 2]))
+
+
+    def test_compact_datasets(self):
+        """Compactly stored values are serialized as lists."""
+        collection = DatazillaResultsCollection(compact=True)
+        res = DatazillaResult(compact=True)
+        res.add_test_results("suite", "test", [1, 2])
+        collection.add_datazilla_result(res)
+
+        self.assertEqual(collection.datasets()[0]['results'], {"test": [1.0, 2.0]})
+        self.assertTrue(
+            isinstance(collection.results.results["suite"]["test"], array))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from array import array
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import DatazillaRequest, DatazillaResult, FloatListEncoder, get_encoder
+from dzclient.encoders import StandardEncoder, UltraJSONEncoder
+from dzclient.encoding import FormBody, iter_json
+from dzclient.tests.stubserver import StubServer
+from dzclient.tests.test_encoding import large_dataset
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class EncodersTest(unittest.TestCase):
+    def test_get_encoder(self):
+        """Encoders are selected by name, or given as they are."""
+        self.assertTrue(isinstance(get_encoder(), StandardEncoder))
+        self.assertTrue(isinstance(get_encoder('floats'), FloatListEncoder))
+        encoder = FloatListEncoder(3)
+        self.assertTrue(get_encoder(encoder) is encoder)
+        self.assertRaises(AssertionError, get_encoder, 'yaml')
+
+
+    def test_standard(self):
+        """The standard encoder gives json.dumps' text, arrays as lists."""
+        data = large_dataset()
+        data['results']['compact'] = array('d', [1.5, 2])
+
+        text = StandardEncoder().encode(data)
+
+        self.assertEqual(json.loads(text), json.loads(json.dumps(
+            dict(data, results=dict(data['results'], compact=[1.5, 2.0])))))
+
+
+    def test_float_list(self):
+        """Float lists are written with the configured precision."""
+        encoder = FloatListEncoder(precision=4)
+
+        self.assertEqual(encoder.dumps([123.456789, 0.000012345, 2.0]),
+                         '[123.5, 1.234e-05, 2]')
+        self.assertEqual(encoder.dumps(array('d', [1.0, 1e20])),
+                         '[1, 1e+20]')
+
+
+    def test_float_list_fallback(self):
+        """Other values are left to the json module."""
+        encoder = FloatListEncoder(precision=2)
+
+        for value in ([1234567, 1.5], [1.5, 1234567], [1.5, True],
+                      [1.5, None], [1.5, 'a'], [float('inf'), 1.0], [],
+                      {'a': 1.234}, 'text'):
+            self.assertEqual(encoder.dumps(value), json.dumps(value))
+
+
+    def test_float_list_default(self):
+        """By default, floats are written exactly."""
+        values = [0.1, 1 / 3.0, 123456789.123456789, 2.0 ** -60]
+
+        self.assertEqual(json.loads(FloatListEncoder().dumps(values)), values)
+
+
+    def test_float_list_dataset(self):
+        """A dataset encoded with limited precision round trips closely."""
+        data = large_dataset()
+        encoder = FloatListEncoder(precision=6)
+
+        decoded = json.loads(encoder.encode(data))
+
+        self.assertEqual(decoded['results']['test 2'], data['results']['test 2'])
+        for value, original in zip(decoded['results']['test~1'],
+                                   data['results']['test~1']):
+            self.assertTrue(abs(value - original) <= abs(original) * 1e-5)
+
+
+    def test_ujson(self):
+        """UltraJSON, when installed, gives equivalent JSON."""
+        if ujson is None:
+            self.assertRaises(ImportError, get_encoder, 'ujson')
+            return
+        data = large_dataset()
+        self.assertEqual(json.loads(UltraJSONEncoder().encode(data)),
+                         json.loads(json.dumps(data)))
+
+
+    def test_batch_of_compact_datasets(self):
+        """Batches are walked, so their arrays are serialized as lists."""
+        batch = [{'results': {'a': array('d', [1])}}] * 2
+
+        body = FormBody(batch, dumps=FloatListEncoder().dumps)
+
+        self.assertEqual(''.join(iter_json(batch)),
+                         '[{"results": {"a": [1.0]}}, {"results": {"a": [1.0]}}]')
+        self.assertTrue(body.getvalue().startswith('data='))
+
+
+    def test_request_encoder(self):
+        """A request sends and sizes its batches with its encoder."""
+        server = StubServer().start()
+        try:
+            req = DatazillaRequest('http', server.host, 'project', 'key',
+                                   'secret', branch='mozilla-try',
+                                   compact=True, batch_max_datasets=5,
+                                   json_encoder=FloatListEncoder(3))
+            res = DatazillaResult(compact=True)
+            res.add_test_results('suite', 'test', [1.23456, 2.5])
+            res.add_test_results('suite2', 'test', [3.0])
+            req.add_datazilla_result(res)
+
+            response = req.submit()[0]
+            req.close()
+
+            self.assertEqual(response.status, 200)
+            self.assertEqual(
+                sorted([d['results']['test'] for d in server.datasets]),
+                [[1.23, 2.5], [3.0]])
+            datasets = dict([(d['testrun']['suite'], d) for d in
+                             map(json.loads,
+                                 req.json_datasets(FloatListEncoder(2)))])
+            self.assertEqual(datasets['suite']['results']['test'], [1.2, 2.5])
+        finally:
+            server.stop()
@@ -0,0 +1,143 @@
+import cgi
+import random
+import unittest
+import urllib
+import oauth2 as oauth
+from mock import patch
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import DatazillaRequest
+from dzclient.encoding import FormBody, iter_json
+from dzclient.signing import OAuthSigner
+from dzclient.tests.stubserver import StubServer
+
+
+def large_dataset(values=5000):
+    rand = random.Random(0)
+    return {'testrun': {'suite': 'tp5', 'date': 1342229050},
+            'results': {'test~1': [rand.uniform(0, 1000) for i in range(values)],
+                        'test 2': range(values)},
+            'talos_aux': {1: [[1, 'a/b'], None, True]}}
+
+
+class EncodingTest(unittest.TestCase):
+    def test_iter_json(self):
+        """iter_json yields the same JSON text as json.dumps."""
+        data = large_dataset()
+
+        self.assertEqual(''.join(iter_json(data)), json.dumps(data))
+        self.assertEqual(''.join(iter_json([data, data])), json.dumps([data, data]))
+
+
+    @patch("dzclient.signing.oauth.generate_nonce")
+    @patch("dzclient.signing.time.time")
+    def test_oauth_body_matches_oauth2(self, mock_time, mock_generate_nonce):
+        """A signed, streamed body is the one the oauth2 library produces."""
+        mock_time.return_value = 1342229050
+        mock_generate_nonce.return_value = "46810593"
+        data = large_dataset()
+        url = 'https://datazilla.mozilla.org:443/project/api/load_test'
+        signer = OAuthSigner('oauth-key', 'oauth-secret')
+        params = dict(signer.parameters(), user='project')
+
+        body = FormBody(data, params, signer, url, buffer_limit=1024)
+
+        oauth_params = {'user': 'project', 'oauth_version': '1.0',
+                        'oauth_nonce': '46810593',
+                        'oauth_timestamp': 1342229050, 'oauth_token': '',
+                        'oauth_consumer_key': 'oauth-key',
+                        'data': urllib.quote(json.dumps(data))}
+        req = oauth.Request(method="POST", url=url, parameters=oauth_params)
+        req.sign_request(oauth.SignatureMethod_HMAC_SHA1(),
+                         oauth.Consumer(key='oauth-key', secret='oauth-secret'),
+                         oauth.Token(key='', secret=''))
+
+        self.assertTrue(body.content() is body) # streamed, not buffered
+        self.assertEqual(body.getvalue(), req.to_postdata())
+        self.assertEqual(len(body), len(req.to_postdata()))
+
+        # a reused signer signs the next body the same way
+        again = FormBody(data, params, signer, url)
+        self.assertEqual(again.content(), req.to_postdata())
+
+
+    def test_read_and_seek(self):
+        """The body can be read in blocks and rewound."""
+        body = FormBody(large_dataset(), {'user': 'project'}, buffer_limit=0)
+        expected = body.getvalue()
+
+        blocks = []
+        block = body.read(8192)
+        while block:
+            self.assertTrue(len(block) <= 8192)
+            blocks.append(block)
+            block = body.read(8192)
+        self.assertEqual(''.join(blocks), expected)
+
+        body.seek(0)
+        self.assertEqual(body.read(), expected)
+
+
+    def test_small_body_buffered(self):
+        """Bodies within the buffer limit are built as a string."""
+        body = FormBody({'some': 'data'})
+
+        self.assertEqual(body.content(),
+                         'data=%257B%2522some%2522%253A%2520%2522data%2522%257D')
+
+
+    def test_send_streamed_body(self):
+        """A body larger than the buffer limit is streamed to the server."""
+        server = StubServer().start()
+        req = DatazillaRequest('http', server.host, 'project', 'key', 'secret',
+                               branch='mozilla-try')
+        try:
+            data = large_dataset(100000)
+            response = req.send(data)
+
+            self.assertEqual(response.status, 200)
+            self.assertEqual(server.datasets, [json.loads(json.dumps(data))])
+            path, headers, body = server.requests[0]
+            params = cgi.parse_qs(body, keep_blank_values=True)
+            self.assertEqual(int(headers['content-length']), len(body))
+            self.assertEqual(params['oauth_signature_method'], ['HMAC-SHA1'])
+        finally:
+            req.close()
+            server.stop()
+
+
+    def test_send_compressed(self):
+        """Bodies can be sent gzip or deflate compressed."""
+        server = StubServer().start()
+        data = large_dataset(1000)
+        try:
+            for compression in ('gzip', 'deflate'):
+                req = DatazillaRequest('http', server.host, 'project', 'key',
+                                       'secret', branch='mozilla-try',
+                                       compression=compression)
+                response = req.send(data)
+                req.close()
+
+                self.assertEqual(response.status, 200)
+                self.assertEqual(server.requests[-1][1]['content-encoding'],
+                                 compression)
+                self.assertEqual(server.datasets[-1], json.loads(json.dumps(data)))
+                stats = req.metrics.summary()
+                self.assertTrue(stats['sent_bytes'] < stats['body_bytes'] / 2)
+        finally:
+            server.stop()
+
+
+    def test_unsupported_compression(self):
+        """Only gzip and deflate compression are supported."""
+        self.assertRaises(AssertionError, DatazillaRequest, 'http', 'host',
+                          'project', 'key', 'secret', branch='mozilla-try',
+                          compression='br')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import shutil
+import tempfile
+import time
+import unittest
+from dzclient import (AutoFlushingResult, DatazillaRequest, DatazillaResult,
+                      DatazillaSpool, DatazillaSubmitError)
+from dzclient.tests.stubserver import StubServer
+
+
+class AutoFlushingResultTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def result(self, compact=False, **kw):
+        req = DatazillaRequest('http', self.server.host, 'project', 'key',
+                               'secret', branch='mozilla-try',
+                               compact=compact)
+        return AutoFlushingResult(req, **kw)
+
+    def suites(self):
+        return sorted([d['testrun']['suite'] for d in self.server.datasets])
+
+    def test_flush_on_values(self):
+        """Completed suites are sent and released past max_values."""
+        res = self.result(max_values=5)
+        res.add_test_results('tp5', 'a', [1, 2, 3])
+        res.add_xperf_results('tp5', 'io', [4])
+        res.add_test_results('ts', 'b', [5, 6])
+        self.assertEqual(self.server.datasets, []) # tp5 not complete
+
+        res.finish_suite('tp5')
+
+        self.assertEqual(self.suites(), ['tp5'])
+        self.assertEqual(self.server.datasets[0]['results'], {'a': [1, 2, 3]})
+        self.assertEqual(self.server.datasets[0]['results_xperf'],
+                         {'io': [4]})
+        self.assertEqual(res.results.keys(), ['ts'])
+        self.assertEqual(res.results_xperf, {})
+        self.assertEqual(res.values(), 2)
+        self.assertEqual(len(res.request.results.results), 0)
+
+        res.close()
+        self.assertEqual(self.suites(), ['tp5', 'ts'])
+        self.assertEqual([r.status for r in res.responses], [200, 200])
+
+
+    def test_under_threshold(self):
+        """Completed suites are held until a threshold is crossed."""
+        res = self.result(max_values=100)
+        res.add_test_results('tp5', 'a', [1, 2, 3])
+        res.finish_suite('tp5')
+
+        self.assertEqual(self.server.datasets, [])
+        res.close()
+        self.assertEqual(self.suites(), ['tp5'])
+
+
+    def test_sequential(self):
+        """Sequential suites complete when the next one starts."""
+        res = self.result(compact=True, max_bytes=16, sequential=True)
+        res.add_test_results('tp5', 'a', [1, 2])
+        self.assertEqual(self.server.datasets, [])
+
+        res.add_test_results('ts', 'b', [3])
+
+        self.assertEqual(self.suites(), ['tp5'])
+        self.assertEqual(res.results.keys(), ['ts'])
+
+
+    def test_max_age(self):
+        """Completed suites are flushed once max_age has passed."""
+        res = self.result(max_age=0.1)
+        res.add_test_results('tp5', 'a', [1])
+        res.finish_suite('tp5')
+        self.assertEqual(self.server.datasets, [])
+
+        time.sleep(0.15)
+        res.add_test_results('ts', 'b', [2])
+
+        self.assertEqual(self.suites(), ['tp5'])
+
+
+    def test_join_results(self):
+        """Joined results are counted, and may trigger a flush."""
+        res = self.result(max_values=3)
+        res.finish_suite('tp5')
+        res.join_results(DatazillaResult({'tp5': {'a': [1, 2, 3]}}),
+                         take=True)
+
+        self.assertEqual(self.suites(), ['tp5'])
+        self.assertEqual(res.values(), 0)
+
+
+    def test_failed_flush(self):
+        """Suites whose submission fails are kept for the next flush."""
+        self.server.stop()
+        res = self.result(max_values=1)
+        res.add_test_results('tp5', 'a', [1, 2])
+
+        self.assertRaises(Exception, res.finish_suite, 'tp5')
+
+        self.assertEqual(res.results, {'tp5': {'a': [1, 2]}})
+        self.assertEqual(res.values(), 2)
+        self.assertEqual(res.finished, set(['tp5']))
+        self.server = StubServer().start() # for tearDown
+
+
+    def test_failed_flush_keeps_request_results(self):
+        """Results already in the request survive a failed flush."""
+        res = self.result(max_values=1)
+        res.request.add_datazilla_result(
+            DatazillaResult({'ts': {'b': [3]}, 'tp5': {'a': [0]}}))
+        def send(dataset, end=None):
+            raise IOError("unreachable")
+        res.request.send = send
+        res.add_test_results('tp5', 'a', [1, 2])
+
+        self.assertRaises(IOError, res.finish_suite, 'tp5')
+
+        self.assertEqual(res.request.results.results, {'ts': {'b': [3]}})
+        self.assertEqual(res.results, {'tp5': {'a': [0, 1, 2]}})
+        self.assertEqual(res.values(), 3)
+
+        del res.request.send
+        res.close()
+        self.assertEqual(self.suites(), ['tp5', 'ts'])
+        self.assertEqual(len(res.request.results.results), 0)
+
+
+    def test_failed_concurrent_flush(self):
+        """Only the suites that failed to send are kept for the next flush."""
+        req = DatazillaRequest('http', self.server.host, 'project', 'key',
+                               'secret', branch='mozilla-try', max_workers=2)
+        res = AutoFlushingResult(req)
+        res.add_test_results('tp5', 'a', [1])
+        res.add_test_results('ts', 'b', [2])
+        send = req.send
+        def failing(dataset, end=None):
+            if dataset['testrun']['suite'] == 'ts':
+                raise IOError("unreachable")
+            return send(dataset)
+        req.send = failing
+
+        self.assertRaises(DatazillaSubmitError, res.flush, ['tp5', 'ts'])
+
+        self.assertEqual(self.suites(), ['tp5'])
+        self.assertEqual(res.results, {'ts': {'b': [2]}})
+        self.assertEqual(res.finished, set(['ts']))
+
+        del req.send
+        res.close()
+        self.assertEqual(self.suites(), ['tp5', 'ts'])
+
+
+    def test_spool(self):
+        """With a spool, suites that fail to upload are written to disk."""
+        directory = tempfile.mkdtemp()
+        try:
+            spool = DatazillaSpool(directory)
+            req = DatazillaRequest('http', self.server.host, 'project', 'key',
+                                   'secret', branch='mozilla-try',
+                                   spool=spool)
+            self.server.responses = [500]
+            res = AutoFlushingResult(req, max_values=1)
+            res.add_test_results('tp5', 'a', [1])
+            res.finish_suite('tp5')
+
+            self.assertEqual(len(spool), 1)
+            self.assertEqual(res.results, {})
+        finally:
+            shutil.rmtree(directory)
+
+
+    def test_context_manager(self):
+        """Leaving the block flushes all suites, or after an error only
+        the completed ones."""
+        res = self.result()
+        try:
+            res.__enter__()
+            res.add_test_results('tp5', 'a', [1])
+            res.add_test_results('ts', 'b', [2])
+            res.finish_suite('ts')
+            raise ValueError()
+        except ValueError:
+            res.__exit__(ValueError, None, None)
+        self.assertEqual(self.suites(), ['ts'])
+
+        res = self.result()
+        res.__enter__()
+        res.add_test_results('tp5', 'a', [1])
+        res.__exit__(None, None, None)
+        self.assertEqual(self.suites(), ['tp5', 'ts'])
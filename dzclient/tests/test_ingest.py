@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+from dzclient import DatazillaResult
+from dzclient.ingest import ingest, ingest_file, read_json_lines
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+        return path
+
+    def test_json_lines(self):
+        """JSON lines files are ingested by kind, suite and test."""
+        path = self.write('results.jsonl', '\n'.join([
+            '{"suite": "tp5", "test": "a", "values": [1, 2]}',
+            '',
+            '{"suite": "tp5", "test": "a", "value": 3}',
+            '{"suite": "tp5", "test": "rss", "kind": "talos_aux", "values": [9]}',
+            ]))
+        res = DatazillaResult()
+
+        self.assertEqual(ingest_file(res, path), 4)
+        self.assertEqual(res.results, {'tp5': {'a': [1, 2, 3]}})
+        self.assertEqual(res.talos_aux, {'tp5': {'rss': [9]}})
+
+
+    def test_csv(self):
+        """CSV files with a header row are ingested."""
+        path = self.write('results.csv',
+                          'suite,test,value\ntp5,a,1\ntp5,b,2.5\nts,a,3\n')
+        res = DatazillaResult()
+
+        ingest_file(res, path)
+
+        self.assertEqual(res.results,
+                         {'tp5': {'a': [1.0], 'b': [2.5]}, 'ts': {'a': [3.0]}})
+
+
+    def test_empty_file(self):
+        """An empty file adds nothing."""
+        res = DatazillaResult()
+        self.assertEqual(ingest_file(res, self.write('empty.csv', '')), 0)
+        self.assertEqual(res.results, {})
+
+
+    def test_bounded_batches(self):
+        """Values are added in batches of about batch_size, in order."""
+        res = Mock()
+        lines = ['{"suite": "s", "test": "t", "value": %d}' % i
+                 for i in range(10)]
+
+        ingest(res, read_json_lines(iter(lines)), batch_size=3)
+
+        calls = res.add_test_results.call_args_list
+        self.assertEqual([len(c[0][2]) for c in calls], [3, 3, 3, 1])
+        self.assertEqual(sum([c[0][2] for c in calls], []), range(10))
+
+
+    def test_unknown_kind(self):
+        """Records of an unknown kind are rejected."""
+        self.assertRaises(ValueError, ingest, DatazillaResult(),
+                          [('bogus', 's', 't', [1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from StringIO import StringIO
+from dzclient import DatazillaRequest, DatazillaResult, SubmissionMetrics
+from dzclient.metrics import PHASES
+from dzclient.tests.stubserver import StubServer
+
+
+class SubmissionMetricsTest(unittest.TestCase):
+    def test_summary(self):
+        """summary() totals the records of every send and submit."""
+        metrics = SubmissionMetrics()
+        metrics.record({'event': 'send', 'encode_time': 1.0,
+                        'body_bytes': 100, 'sent_bytes': 40, 'retries': 1})
+        metrics.record({'event': 'send', 'encode_time': 3.0,
+                        'body_bytes': 50, 'sent_bytes': 50,
+                        'error': 'timeout()'})
+        metrics.record({'event': 'submit', 'datasets_time': 0.5})
+
+        summary = metrics.summary()
+
+        self.assertEqual(summary['sends'], 2)
+        self.assertEqual(summary['submits'], 1)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['retries'], 1)
+        self.assertEqual(summary['body_bytes'], 150)
+        self.assertEqual(summary['sent_bytes'], 90)
+        self.assertEqual(summary['phases']['encode'],
+                         {'total': 4.0, 'mean': 2.0, 'max': 3.0})
+        self.assertEqual(summary['phases']['datasets']['total'], 0.5)
+        self.assertFalse('compress' in summary['phases'])
+        self.assertEqual(len(metrics.records), 0)
+
+
+    def test_keep(self):
+        """Only the latest `keep` records are kept."""
+        metrics = SubmissionMetrics(keep=2)
+        for i in range(5):
+            metrics.record({'event': 'send', 'body_bytes': i})
+
+        self.assertEqual([r['body_bytes'] for r in metrics.records], [3, 4])
+        self.assertEqual(metrics.summary()['body_bytes'], 10)
+
+
+    def test_dump(self):
+        """dump() writes a line of counts and one per recorded phase."""
+        metrics = SubmissionMetrics()
+        metrics.record({'event': 'send', 'encode_time': 0.25})
+        stream = StringIO()
+
+        metrics.dump(stream)
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "1 sends in 0 submits, 0 errors, 0 retries")
+        self.assertTrue(lines[2].startswith("encode"))
+        self.assertEqual(len(lines), 3)
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def request(self, **kw):
+        kw.setdefault('metrics', SubmissionMetrics(keep=None))
+        req = DatazillaRequest('http', self.server.host, 'project', 'key',
+                               'secret', branch='mozilla-try', **kw)
+        req.add_datazilla_result(DatazillaResult(
+            {'suite1': {'test': [1]}, 'suite2': {'test': [2]}}))
+        return req
+
+    def test_submit(self):
+        """submit() records every phase of each send, and its own timing."""
+        req = self.request()
+        req.submit()
+        req.close()
+
+        sends = [r for r in req.metrics.records if r['event'] == 'send']
+        submits = [r for r in req.metrics.records if r['event'] == 'submit']
+        self.assertEqual(len(sends), 2)
+        for record in sends:
+            for phase in PHASES:
+                self.assertTrue(record[phase + '_time'] >= 0)
+            self.assertEqual(record['status'], 200)
+            self.assertEqual(record['datasets'], 1)
+            self.assertEqual(record['retries'], 0)
+            self.assertTrue(record['body_bytes'] > 0)
+        self.assertEqual(len(submits), 1)
+        self.assertEqual(submits[0]['payloads'], 2)
+        self.assertTrue(submits[0]['total_time'] >= submits[0]['datasets_time'])
+
+
+    def test_batch(self):
+        """A batch's send record counts its datasets."""
+        req = self.request(batch_max_datasets=5)
+        req.submit()
+        req.close()
+
+        self.assertEqual(req.metrics.records[0]['datasets'], 2)
+
+
+    def test_error(self):
+        """A failed send is recorded with its error before it is raised."""
+        self.server.stop()
+        req = self.request()
+
+        self.assertRaises(Exception, req.send, {'test': 1})
+
+        record = req.metrics.records[0]
+        self.assertTrue(record['error'])
+        self.assertFalse('status' in record)
+
+
+    def test_custom_metrics(self):
+        """Records go to the given metrics object."""
+        class Collector(object):
+            def __init__(self):
+                self.events = []
+
+            def record(self, record):
+                self.events.append(record['event'])
+
+        collector = Collector()
+        req = self.request(metrics=collector)
+        req.submit()
+        req.close()
+
+        self.assertEqual(collector.events, ['send', 'send', 'submit'])
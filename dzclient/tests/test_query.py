@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import oauth2 as oauth
+
+from dzclient import ConnectionPool, DatazillaQuery, ResponseCache
+from dzclient.query import DatazillaQueryError
+from dzclient.retry import RetryPolicy
+from dzclient.tests.stubserver import StubServer
+
+RUNS = 'testdata/raw/Mozilla-Inbound/785345035a3b/'
+
+
+def run(suite, index):
+    return {'testrun': {'suite': suite, 'date': 1342229050 + index},
+            'results': {'test': [index, index + 0.5]}}
+
+
+class DatazillaQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StubServer().start()
+        self.server.documents['/talos/' + RUNS] = [run('tp5', i) for i in range(5)]
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def query(self, **kw):
+        kw.setdefault('cache', ResponseCache(self.directory))
+        return DatazillaQuery('http', self.server.host, 'talos', **kw)
+
+    def test_pages(self):
+        """Runs are fetched lazily, page by page."""
+        query = self.query(page_size=2)
+
+        runs = query.test_runs('Mozilla-Inbound', '785345035a3b', suite='tp5')
+        self.assertEqual(runs.next(), run('tp5', 0))
+        self.assertEqual(len(self.server.queries), 1)
+
+        self.assertEqual(list(runs), [run('tp5', i) for i in range(1, 5)])
+        self.assertEqual([q[1]['offset'] for q in self.server.queries],
+                         ['0', '2', '4'])
+        self.assertEqual(self.server.queries[0][1]['test_name'], 'tp5')
+        self.assertEqual(self.server.queries[0][2]['accept-encoding'], 'gzip')
+
+
+    def test_cache(self):
+        """Fresh responses are served from memory, or from disk."""
+        self.query().get(RUNS)
+        query = self.query()
+
+        self.assertEqual(query.get(RUNS), self.server.documents['/talos/' + RUNS])
+        self.assertEqual(len(self.server.queries), 1)
+        self.assertEqual(query.stats, {'hits': 1, 'revalidated': 0,
+                                       'fetched': 0})
+
+
+    def test_revalidation(self):
+        """Stale responses are revalidated with their ETag."""
+        query = self.query(cache=ResponseCache(self.directory, ttl=0.05))
+        query.get(RUNS)
+        time.sleep(0.1)
+
+        self.assertEqual(len(query.get(RUNS)), 5)
+        path, params, headers = self.server.queries[-1]
+        self.assertTrue(headers['if-none-match'])
+        self.assertEqual(query.stats['revalidated'], 1)
+
+        time.sleep(0.1)
+        self.server.documents['/talos/' + RUNS].append(run('ts', 5))
+        self.assertEqual(len(query.get(RUNS)), 6)
+        self.assertEqual(query.stats['fetched'], 2)
+
+
+    def test_memory_bound(self):
+        """Only memory_entries responses are held in memory."""
+        cache = ResponseCache(memory_entries=2)
+        query = self.query(cache=cache)
+        for i in range(3):
+            self.server.documents['/talos/doc%d' % i] = [i]
+            query.get('doc%d' % i)
+
+        url = 'http://%s/talos/doc%%d' % self.server.host
+        self.assertEqual(cache.get(url % 0), None)
+        self.assertEqual(cache.get(url % 2)['body'], '[2]')
+
+
+    def test_paging_ignored(self):
+        """A server ignoring offset and limit ends the paging at once."""
+        self.server.paging = False
+        for size in (2, 5):
+            runs = list(self.query(page_size=size).test_runs(
+                'Mozilla-Inbound', '785345035a3b'))
+            self.assertEqual(runs, [run('tp5', i) for i in range(5)])
+        self.assertEqual(len(self.server.queries), 3)
+
+
+    def test_disk_bound(self):
+        """Past disk_entries, the oldest files are removed."""
+        cache = ResponseCache(self.directory, disk_entries=2)
+        for i in range(5):
+            cache.put('url%d' % i, {'body': '[]', 'fetched': 0})
+            os.utime(cache._path('url%d' % i), (i, i))
+        self.assertTrue(len(os.listdir(self.directory)) <= 4)
+
+        cache = ResponseCache(self.directory, disk_entries=2)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(cache.get('url1'), None)
+        self.assertEqual(cache.get('url4')['body'], '[]')
+
+
+    def test_error(self):
+        """Error statuses raise, after the policy's retries."""
+        policy = RetryPolicy(retries=1, base_delay=0)
+        query = self.query(retry_policy=policy)
+        self.server.responses = [503]
+        self.assertEqual(len(query.get(RUNS)), 5)
+
+        try:
+            query.get('missing')
+        except DatazillaQueryError, e:
+            self.assertEqual(e.status, 404)
+        else:
+            self.fail("no error raised")
+
+
+    def test_signed(self):
+        """Queries with credentials carry a valid OAuth signature."""
+        query = self.query(oauth_key='key', oauth_secret='secret',
+                           pool=ConnectionPool())
+        query.get(RUNS, {'os_name': 'linux'})
+
+        path, params, headers = self.server.queries[0]
+        url = 'http://%s%s' % (self.server.host, path)
+        signature = params.pop('oauth_signature')
+        req = oauth.Request(method='GET', url=url, parameters=params)
+        req.sign_request(oauth.SignatureMethod_HMAC_SHA1(),
+                         oauth.Consumer('key', 'secret'), None)
+        self.assertEqual(req['oauth_signature'], signature)
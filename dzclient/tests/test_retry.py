@@ -0,0 +1,170 @@
+import httplib
+import socket
+import time
+import unittest
+from dzclient import (DatazillaRequest, DatazillaResult, DeadlineExceeded,
+                      RetryPolicy)
+from dzclient.tests.stubserver import StubServer
+
+
+class FakeResponse(object):
+    def __init__(self, status, retry_after=None):
+        self.status = status
+        self.retry_after = retry_after
+
+    def getheader(self, name, default=None):
+        return self.retry_after or default
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_delay(self):
+        """Backoff doubles from base_delay up to max_delay, with jitter."""
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt, full in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+            delay = policy.delay(attempt)
+            self.assertTrue(full * 0.5 <= delay <= full, (attempt, delay))
+
+
+    def test_retry_after(self):
+        """A 429's Retry-After lengthens the backoff."""
+        policy = RetryPolicy(base_delay=1)
+        self.assertEqual(policy.delay(1, FakeResponse(429, '7')), 7)
+        self.assertTrue(policy.delay(1, FakeResponse(429, 'soon')) <= 1)
+
+
+    def test_should_retry(self):
+        """Connection errors, 5xx and 429 are retried; others are not."""
+        policy = RetryPolicy(retries=2)
+        self.assertTrue(policy.should_retry(1, FakeResponse(503)))
+        self.assertTrue(policy.should_retry(2, FakeResponse(429)))
+        self.assertTrue(policy.should_retry(1, error=socket.timeout()))
+        self.assertTrue(policy.should_retry(1, error=httplib.BadStatusLine('')))
+        self.assertFalse(policy.should_retry(1, FakeResponse(400)))
+        self.assertFalse(policy.should_retry(1, error=ValueError()))
+        self.assertFalse(policy.should_retry(3, FakeResponse(503)))
+
+
+    def test_timeouts(self):
+        """Timeouts are shortened to the deadline, and fail past it."""
+        policy = RetryPolicy(connect_timeout=5, read_timeout=60)
+        self.assertEqual(policy.timeouts(), (5, 60))
+
+        connect, read = policy.timeouts(time.time() + 10)
+        self.assertEqual(connect, 5)
+        self.assertTrue(9 < read <= 10)
+
+        self.assertRaises(DeadlineExceeded, policy.timeouts, time.time() - 1)
+
+
+class RequestRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.sleeps = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def request(self, **kw):
+        policy = RetryPolicy(**kw)
+        policy.sleep = self.sleeps.append
+        req = DatazillaRequest('http', self.server.host, 'project', 'key',
+                               'secret', branch='mozilla-try',
+                               retry_policy=policy)
+        req.add_datazilla_result(DatazillaResult({'suite': {'test': [1]}}))
+        return req
+
+    def test_retry_server_errors(self):
+        """Server errors and dropped connections are retried."""
+        self.server.responses = [0, 503, 429]
+        req = self.request(retries=3, base_delay=1)
+
+        response = req.submit()[0]
+        req.close()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(self.server.datasets), 1)
+        self.assertEqual(len(self.sleeps), 3)
+        self.assertEqual(req.metrics.summary()['retries'], 3)
+
+
+    def test_resigned(self):
+        """Each attempt is signed with a new nonce."""
+        self.server.responses = [500]
+        req = self.request(retries=1)
+
+        req.submit()
+        req.close()
+
+        nonces = [body.split('oauth_nonce=')[1].split('&')[0]
+                  for path, headers, body in self.server.requests]
+        self.assertEqual(len(nonces), 2)
+        self.assertNotEqual(nonces[0], nonces[1])
+
+
+    def test_retries_exhausted(self):
+        """The last error response is returned once retries run out."""
+        self.server.responses = [500, 502, 503]
+        req = self.request(retries=2)
+
+        response = req.submit()[0]
+        req.close()
+
+        self.assertEqual(response.status, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+
+    def test_client_error_not_retried(self):
+        """A 4xx other than 429 is returned at once."""
+        self.server.responses = [400]
+        req = self.request(retries=3)
+
+        response = req.submit()[0]
+        req.close()
+
+        self.assertEqual(response.status, 400)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.sleeps, [])
+
+
+    def test_read_timeout(self):
+        """A hung server times out, and the timeout is retried."""
+        self.server.delay = 0.5
+        req = self.request(retries=1, read_timeout=0.1)
+
+        start = time.time()
+        self.assertRaises(socket.timeout, req.send, {'test': 1})
+        req.close()
+
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertEqual(req.metrics.summary()['errors'], 1)
+
+
+    def test_deadline(self):
+        """No retry is started past the deadline."""
+        self.server.responses = [503] * 10
+        req = self.request(retries=10, base_delay=0.2, deadline=0.5)
+        req.retry_policy.sleep = time.sleep
+
+        start = time.time()
+        response = req.submit()[0]
+        req.close()
+
+        self.assertEqual(response.status, 503)
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertTrue(1 < len(self.server.requests) < 10)
+
+
+    def test_submit_deadline(self):
+        """The deadline bounds the whole submission."""
+        req = self.request(deadline=0.4)
+        req.add_datazilla_result(DatazillaResult({'suite2': {'test': [2]}}))
+        self.server.delay = 0.3
+
+        start = time.time()
+        self.assertRaises(socket.timeout, req.submit)
+        req.close()
+
+        self.assertTrue(time.time() - start < 0.55)
+        self.assertEqual(len(self.server.datasets), 1)
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from dzclient import DatazillaRequest, DatazillaResult, SentCache
+from dzclient.sentcache import dataset_key
+from dzclient.tests.stubserver import StubServer
+
+
+class SentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'sent')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_persistence(self):
+        """Saved keys are found by a later cache on the same file."""
+        cache = SentCache(self.path)
+        cache.add('a')
+        cache.add('b')
+        self.assertFalse(os.path.exists(self.path))
+        cache.save()
+
+        cache = SentCache(self.path)
+        self.assertTrue('a' in cache)
+        self.assertTrue('b' in cache)
+        self.assertFalse('c' in cache)
+
+
+    def test_lru(self):
+        """Past max_entries, the least recently used keys are evicted."""
+        cache = SentCache(self.path, max_entries=2)
+        cache.add('a')
+        cache.add('b')
+        self.assertTrue('a' in cache) # now more recent than 'b'
+        cache.add('c')
+        cache.save()
+
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('b' in cache)
+        self.assertEqual(open(self.path).read(), 'a\nc\n')
+
+
+    def test_dataset_key(self):
+        """Keys depend on the contents and destination, not on storage."""
+        dataset = {'testrun': {'suite': 'tp5'}, 'results': {'a': [1.5, 2.0]}}
+        compact = {'testrun': {'suite': 'tp5'},
+                   'results': {'a': array('d', [1.5, 2.0])}}
+        other = {'testrun': {'suite': 'tp5'}, 'results': {'a': [1.5, 2.5]}}
+        dated = {'testrun': {'suite': 'tp5', 'date': 1000},
+                 'results': {'a': [1.5, 2.0]}}
+
+        self.assertEqual(dataset_key(dataset), dataset_key(compact))
+        self.assertEqual(dataset_key(dataset), dataset_key(dated))
+        self.assertNotEqual(dataset_key(dataset), dataset_key(other))
+        self.assertNotEqual(dataset_key(dataset, 'http://host/a'),
+                            dataset_key(dataset, 'http://host/b'))
+
+
+class SubmitTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def request(self, values=[1, 2], test_date=1000, **kw):
+        req = DatazillaRequest(
+            'http', self.server.host, 'project', 'key', 'secret',
+            branch='mozilla-try', test_date=test_date,
+            sent_cache=SentCache(os.path.join(self.directory, 'sent')), **kw)
+        req.add_datazilla_result(DatazillaResult(
+            {'tp5': {'a': values}, 'ts': {'b': [3]}}))
+        return req
+
+    def test_skip_sent(self):
+        """Datasets accepted before, by an earlier run, are skipped."""
+        self.request().submit()
+        self.assertEqual(len(self.server.datasets), 2)
+
+        req = self.request(values=[1, 3], test_date=1001)
+        responses = req.submit()
+
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(len(self.server.datasets), 3)
+        self.assertEqual([d['testrun']['suite'] for d in req.skipped], ['ts'])
+        self.assertEqual(req.metrics.summary()['skipped'], 1)
+
+
+    def test_failures_not_cached(self):
+        """Datasets the server does not accept are sent again."""
+        self.server.responses = [500]
+        statuses = [r.status for r in self.request().submit()]
+        self.assertEqual(sorted(statuses), [200, 500])
+
+        req = self.request()
+        req.submit()
+        self.assertEqual(len(req.skipped), 1)
+        self.assertEqual(len(self.server.datasets), 2)
+
+
+    def test_batches(self):
+        """The datasets of an accepted batch are all cached."""
+        self.request(batch_max_datasets=2).submit()
+
+        req = self.request(batch_max_datasets=2)
+        self.assertEqual(req.submit(), [])
+        self.assertEqual(len(req.skipped), 2)
+        self.assertEqual(len(self.server.requests), 1)
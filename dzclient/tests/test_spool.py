@@ -0,0 +1,211 @@
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+from mock import Mock
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import DatazillaRequest, DatazillaResult, DatazillaSpool, SpoolUploader
+from dzclient.spool import main
+from dzclient.tests.stubserver import StubServer
+
+
+def dataset(suite, build='20120228122102', values=[1]):
+    return {'test_build': {'id': build}, 'test_machine': {'name': 'qm-pxp01'},
+            'testrun': {'suite': suite}, 'results': {'test': values}}
+
+
+def response(status, headers={}):
+    return Mock(status=status,
+                getheader=lambda name, default=None: headers.get(name, default))
+
+
+class DatazillaSpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = DatazillaSpool(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_enqueue_deduplicates(self):
+        """A build's suite is spooled once, the latest copy winning."""
+        self.spool.enqueue(dataset('tp5', values=[1]))
+        self.spool.enqueue(dataset('tp5', values=[2]))
+        self.spool.enqueue(dataset('tp5', build='other'))
+        self.spool.enqueue(dataset('ts'))
+
+        self.assertEqual(len(self.spool), 3)
+        spool = DatazillaSpool(self.directory)
+        datasets = [spool.dataset(e) for e in spool.entries()]
+        self.assertTrue(dataset('tp5', values=[2]) in datasets)
+
+
+    def test_entries(self):
+        """
+        Entries are listed from their headers alone; files of an earlier
+        version are read too, and stale partial writes removed.
+        """
+        self.spool.enqueue(dataset('tp5'))
+        entry, = self.spool.entries()
+        f = open(entry['path'], 'a')
+        f.write('not JSON')
+        f.close()
+        legacy = os.path.join(self.directory, 'a' * 40 + '.json')
+        f = open(legacy, 'w')
+        json.dump({'key': 'legacy', 'attempts': 2, 'next_attempt': 0,
+                   'dataset': dataset('ts')}, f)
+        f.close()
+        fresh = os.path.join(self.directory, 'fresh.tmp')
+        stale = os.path.join(self.directory, 'stale.tmp')
+        open(fresh, 'w').close()
+        open(stale, 'w').close()
+        os.utime(stale, (0, 0))
+
+        entries = self.spool.entries()
+
+        self.assertEqual([(e['key'], e['attempts']) for e in entries],
+                         [('20120228122102/qm-pxp01/tp5', 0), ('legacy', 2)])
+        self.assertRaises(ValueError, self.spool.dataset, entries[0])
+        self.assertEqual(self.spool.dataset(entries[1]), dataset('ts'))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertFalse(os.path.exists(stale))
+
+
+    def test_drain(self):
+        """Accepted datasets are removed; failures are retried with backoff."""
+        self.spool.enqueue(dataset('tp5'))
+        self.spool.enqueue(dataset('ts'))
+        request = Mock()
+        request.send.side_effect = lambda d: response(
+            d['testrun']['suite'] == 'ts' and 503 or 200)
+
+        self.assertEqual(self.spool.drain(request, now=1000), (1, 1))
+        entry, = self.spool.entries()
+        self.assertEqual(self.spool.dataset(entry)['testrun']['suite'], 'ts')
+        self.assertEqual(entry['attempts'], 1)
+        self.assertTrue(1002.5 <= entry['next_attempt'] <= 1005)
+
+        # not due yet
+        self.assertEqual(self.spool.drain(request, now=1001), (0, 0))
+        request.send.side_effect = IOError("unreachable")
+        self.assertEqual(self.spool.drain(request, now=1005), (0, 1))
+        self.assertTrue(self.spool.entries()[0]['next_attempt'] >= 1010)
+
+
+    def test_refused(self):
+        """Refused datasets are moved aside, throttled ones retried later."""
+        self.spool.enqueue(dataset('tp5'))
+        self.spool.enqueue(dataset('ts'))
+        request = Mock()
+        request.send.side_effect = lambda d: (
+            d['testrun']['suite'] == 'ts' and response(401) or
+            response(429, {'Retry-After': '60'}))
+
+        self.assertEqual(self.spool.drain(request, now=1000), (0, 2))
+        entry, = self.spool.entries()
+        self.assertEqual(self.spool.dataset(entry)['testrun']['suite'], 'tp5')
+        self.assertTrue(entry['next_attempt'] >= 1060)
+        failed = DatazillaSpool(os.path.join(self.directory, 'failed'))
+        self.assertEqual(
+            [failed.dataset(e) for e in failed.entries()], [dataset('ts')])
+
+
+    def test_replaced_while_sending(self):
+        """A copy enqueued while an earlier one is sent is kept."""
+        self.spool.enqueue(dataset('tp5', values=[1]))
+        request = Mock()
+        def send(d):
+            self.spool.enqueue(dataset('tp5', values=[2]))
+            return response(status)
+        request.send.side_effect = send
+
+        for status in (200, 503):
+            self.spool.drain(request, now=1e9)
+            entry, = self.spool.entries()
+            self.assertEqual(self.spool.dataset(entry),
+                             dataset('tp5', values=[2]))
+            self.assertEqual(entry['attempts'], 0)
+
+
+    def test_max_attempts(self):
+        """Datasets failing max_attempts times are moved aside."""
+        spool = DatazillaSpool(self.directory, max_attempts=2)
+        spool.enqueue(dataset('tp5'))
+        request = Mock()
+        request.send.side_effect = IOError("unreachable")
+
+        spool.drain(request, now=0)
+        spool.drain(request, now=1e9)
+
+        self.assertEqual(len(spool), 0)
+        self.assertEqual(
+            len(DatazillaSpool(os.path.join(self.directory, 'failed'))), 1)
+
+
+    def test_submit_spools_failures(self):
+        """submit() spools the datasets it fails to send, defer() spools all."""
+        req = DatazillaRequest('http', 'host', 'project', 'key', 'secret',
+                               branch='mozilla-try', spool=self.spool)
+        req.add_datazilla_result(DatazillaResult(
+            {'tp5': {'test': [1]}, 'ts': {'test': [2]}}))
+        ok = Mock(status=200)
+        req.send = lambda d: d['testrun']['suite'] == 'ts' and ok or Mock(status=500)
+
+        responses = req.submit()
+
+        self.assertEqual(sorted(responses), sorted([None, ok]))
+        self.assertEqual(
+            [self.spool.dataset(e)['testrun']['suite']
+             for e in self.spool.entries()],
+            ['tp5'])
+
+        req.defer()
+        self.assertEqual(len(self.spool), 2)
+
+        # a refused dataset is spooled too, rather than lost, once the
+        # response is read
+        refused = Mock(status=401)
+        req.send = lambda d: refused
+        self.assertEqual(req.submit(), [None, None])
+        self.assertEqual(len(self.spool), 2)
+        self.assertEqual(refused.read.call_count, 2)
+
+        # errors other than the connection's are not hidden
+        def send(d):
+            raise TypeError("bug")
+        req.send = send
+        self.assertRaises(TypeError, req.submit)
+
+
+    def test_uploader(self):
+        """The uploader thread and command line drain a spool to the server."""
+        server = StubServer().start()
+        try:
+            self.spool.enqueue(dataset('tp5'))
+            request = DatazillaRequest('http', server.host, 'project', 'key',
+                                       'secret', branch='mozilla-try')
+            uploader = SpoolUploader(self.spool, request, interval=0.01)
+            uploader.start()
+            uploader.stop()
+            request.close()
+            self.assertEqual(server.datasets, [dataset('tp5')])
+
+            self.spool.enqueue(dataset('ts'))
+            out = StringIO()
+            main(['--protocol', 'http', '--host', server.host,
+                  '--project', 'project', '--once', self.directory], out)
+            self.assertEqual(out.getvalue(), "sent 1, failed 0, 0 left\n")
+            self.assertEqual(server.datasets[1:], [dataset('ts')])
+            self.assertEqual(len(self.spool), 0)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
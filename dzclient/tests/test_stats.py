@@ -0,0 +1,71 @@
+import math
+import random
+import unittest
+from array import array
+from dzclient import stats, DatazillaResult, DatazillaResultsCollection
+
+
+class StatsTest(unittest.TestCase):
+    def test_summarize(self):
+        """Summaries hold the usual statistics, filtering outliers."""
+        summary = stats._summarize_python([1, 2, 3, 4, 100])
+
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['mean'], 22)
+        self.assertEqual(summary['median'], 3)
+        self.assertEqual(summary['min'], 1)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['stddev'], math.sqrt(7610 / 4.0))
+        self.assertAlmostEqual(summary['geomean'], 2400 ** 0.2)
+        self.assertEqual(summary['filtered_mean'], 2.5)
+        self.assertEqual(stats._summarize_python([0, 1])['geomean'], None)
+        self.assertEqual(stats._summarize_python([5])['stddev'], 0)
+
+
+    def test_numpy_matches_python(self):
+        """The NumPy and pure-Python engines agree."""
+        if stats.numpy is None:
+            return
+        rand = random.Random(0)
+        for values in ([rand.gauss(100, 10) for i in range(1001)],
+                       array('d', [rand.uniform(1, 2) for i in range(50)]),
+                       [3], [-1, 0, 1, 1000]):
+            python = stats._summarize_python(values)
+            vectorized = stats._summarize_numpy(values)
+            self.assertEqual(sorted(python.keys()), sorted(vectorized.keys()))
+            for key, value in python.items():
+                if value is None:
+                    self.assertEqual(vectorized[key], None)
+                else:
+                    self.assertAlmostEqual(vectorized[key], value)
+
+
+    def test_result_summaries(self):
+        """DatazillaResult summarizes each test and suite."""
+        res = DatazillaResult({'suite': {'a': [1, 1], 'b': [4, 4], 'empty': []}})
+
+        summaries = res.summaries()['suite']
+
+        self.assertEqual(sorted(summaries['tests'].keys()), ['a', 'b'])
+        self.assertEqual(summaries['suite'],
+                         {'tests': 2, 'count': 4,
+                          'geomean_mean': 2.0, 'geomean_median': 2.0})
+
+
+    def test_datasets_with_summaries(self):
+        """Datasets can carry summaries and leave out large raw results."""
+        collection = DatazillaResultsCollection(max_values=2)
+        collection.add_datazilla_result(
+            DatazillaResult({'suite': {'small': [1, 2], 'large': [1, 2, 3]}}))
+
+        dataset, = collection.datasets()
+
+        self.assertEqual(dataset['results'], {'small': [1, 2]})
+        self.assertEqual(
+            sorted(dataset['results_summary']['tests'].keys()), ['large', 'small'])
+        self.assertEqual(
+            collection.results.results['suite']['large'], [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from StringIO import StringIO
+from mock import patch
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dzclient import archive
+from dzclient.tests.stubserver import StubServer
+from dzclient.tests.test_archive import collection
+from dzclient.upload import RateLimiter, find_files, main
+
+
+def dataset(suite):
+    return {'testrun': {'suite': suite, 'date': 1342229050},
+            'test_build': {'id': '20120228122102'},
+            'test_machine': {'name': 'qm-pxp01'},
+            'results': {'test': [1, 2]}}
+
+
+class UploadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = StubServer().start()
+        self.write('run1/a.json', dataset('a'))
+        self.write('run1/b.json', [dataset('b1'), dataset('b2')])
+        self.write('run2/c.json', dataset('c'))
+        self.write('run2/notes.txt', 'not a dataset')
+        self.journal = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'w')
+        json.dump(data, f)
+        f.close()
+        return path
+
+    def main(self, *args):
+        """Run the command line; return its status, stdout and stderr."""
+        stdout, stderr = StringIO(), StringIO()
+        args = ['--protocol', 'http', '--host', self.server.host,
+                '--project', 'project', '--retries', '0'] + list(args)
+        stdout_patch = patch('sys.stdout', stdout)
+        stderr_patch = patch('sys.stderr', stderr)
+        stdout_patch.start()
+        stderr_patch.start()
+        try:
+            status = main(args)
+        finally:
+            stdout_patch.stop()
+            stderr_patch.stop()
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def suites(self):
+        return sorted([d['testrun']['suite'] for d in self.server.datasets])
+
+    def test_find_files(self):
+        """Directories are searched for dataset files; globs expanded."""
+        path = lambda name: os.path.join(self.directory, name)
+
+        self.assertEqual(find_files([self.directory]),
+                         [path('run1/a.json'), path('run1/b.json'),
+                          path('run2/c.json')])
+        self.assertEqual(find_files([path('run*/c.json'), path('run2')]),
+                         [path('run2/c.json')])
+
+
+    def test_upload(self):
+        """Every dataset of every file is uploaded, and stats printed."""
+        status, out, err = self.main('--workers', '2', self.directory)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self.suites(), ['a', 'b1', 'b2', 'c'])
+        self.assertTrue(out.startswith(
+            "sent 4 datasets from 3 files, 0 skipped, 0 failed in "), out)
+        self.assertTrue("datasets/s" in out and "MB/s" in out)
+
+
+    def test_archive(self):
+        """Binary archives are uploaded too."""
+        path = os.path.join(self.directory, 'run3', 'run.dzc')
+        os.makedirs(os.path.dirname(path))
+        archive.dump(collection(), path)
+
+        status, out, err = self.main(os.path.dirname(path))
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self.suites(), ['tp5', 'ts'])
+        # loaded as they were archived, integers not turned into floats
+        tp5 = [d for d in self.server.datasets
+               if d['testrun']['suite'] == 'tp5'][0]
+        self.assertEqual(map(type, tp5['results']['b']), [int, int])
+
+
+    def test_resume(self):
+        """Failed datasets are not journaled, and are retried on resume."""
+        self.server.responses = [500]
+        status, out, err = self.main('--workers', '1', '--journal',
+                                     self.journal, self.directory)
+
+        self.assertEqual(status, 1)
+        self.assertTrue("a.json[0]: upload failed: status 500" in err, err)
+        self.assertEqual(self.suites(), ['b1', 'b2', 'c'])
+        self.assertEqual(len(open(self.journal).readlines()), 3)
+
+        status, out, err = self.main('--journal', self.journal,
+                                     self.directory)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self.suites(), ['a', 'b1', 'b2', 'c'])
+        self.assertTrue(", 3 skipped, 0 failed" in out, out)
+
+
+    def test_dry_run(self):
+        """A dry run counts the datasets without sending them."""
+        status, out, err = self.main('--dry-run', '--journal', self.journal,
+                                     self.directory)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(out.startswith(
+            "dry run: 4 datasets in 3 files, 0 already uploaded"), out)
+        self.assertFalse(os.path.exists(self.journal))
+
+
+    def test_bad_file(self):
+        """Unreadable files are reported and make the upload fail."""
+        f = open(os.path.join(self.directory, 'run2', 'bad.json'), 'w')
+        f.write('{')
+        f.close()
+
+        status, out, err = self.main(self.directory)
+
+        self.assertEqual(status, 1)
+        self.assertTrue("bad.json: cannot read" in err)
+        self.assertEqual(len(self.server.datasets), 4)
+
+
+    def test_not_datasets(self):
+        """Files of JSON other than datasets are unreadable."""
+        self.write('run2/number.json', 5)
+        self.write('run2/numbers.json', [dataset('d'), 5])
+
+        status, out, err = self.main(self.directory)
+
+        self.assertEqual(status, 1)
+        self.assertTrue("number.json: cannot read: not a dataset" in err, err)
+        self.assertTrue("numbers.json: cannot read: not a dataset" in err, err)
+        self.assertTrue("2 files could not be read" in out, out)
+        self.assertEqual(len(self.server.datasets), 4)
+
+
+    def test_journal_error(self):
+        """Errors outside the uploads themselves make the upload fail."""
+        def record(self, key):
+            raise IOError("disk full")
+
+        record_patch = patch('dzclient.upload.ProgressJournal.record', record)
+        record_patch.start()
+        try:
+            status, out, err = self.main('--journal', self.journal,
+                                         os.path.join(self.directory, 'run2'))
+        finally:
+            record_patch.stop()
+
+        self.assertEqual(status, 1)
+        self.assertTrue("c.json: upload failed: disk full" in err, err)
+        self.assertTrue(", 1 failed" in out, out)
+
+
+    def test_bad_option(self):
+        """An unknown JSON encoder is a usage error."""
+        try:
+            self.main('--json-encoder', 'bogus', self.directory)
+        except SystemExit, e:
+            self.assertEqual(e.code, 2)
+        else:
+            self.fail("no usage error")
+
+
+    def test_rate_limiter(self):
+        """Calls are spaced by the rate limit."""
+        limiter = RateLimiter(50)
+        start = time.time()
+        for i in range(6):
+            limiter.wait()
+        self.assertTrue(time.time() - start >= 0.1)
@@ -0,0 +1,326 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Bulk upload of dataset files, installed as the `dzclient` command:
+
+    dzclient --project talos --key KEY --secret SECRET \\
+        --journal uploaded.journal results/ 'archive/*.json'
+
+Directories are searched for dataset files, which hold either the JSON
+of a dataset or of a list of datasets (as saved from `datasets()`), or a
+binary archive (see dzclient.archive). Files are uploaded in parallel
+through a shared connection pool, each dataset in its own POST.
+"""
+
+import glob
+import os
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from . import archive
+from .encoders import ENCODERS, get_encoder
+from .pool import ConnectionPool
+from .retry import RetryPolicy
+from .spool import uploader_request
+from .workers import run_concurrently
+
+SUFFIXES = ('.json', archive.SUFFIX)
+
+
+def find_files(patterns):
+    """
+    Return the dataset files named by paths, directories (searched
+    recursively) and glob patterns, in order and without duplicates.
+    """
+    found = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if not os.path.isdir(path):
+                found.append(path)
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend([os.path.join(root, name) for name in sorted(files)
+                              if name.endswith(SUFFIXES)])
+    seen = set()
+    unique = []
+    for path in found:
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def read_datasets(path):
+    """
+    Return the datasets of a JSON file or binary archive; raises
+    ValueError if the JSON is neither a dataset nor a list of them.
+    """
+    if path.endswith(archive.SUFFIX):
+        return list(archive.load(path).iter_datasets())
+    f = open(path)
+    try:
+        data = json.load(f)
+    finally:
+        f.close()
+    if isinstance(data, dict):
+        return [data]
+    if not isinstance(data, list):
+        raise ValueError("not a dataset or list of datasets")
+    for dataset in data:
+        if not isinstance(dataset, dict):
+            raise ValueError("not a dataset or list of datasets")
+    return data
+
+
+class RateLimiter(object):
+    """Spaces calls to wait() at most `rate` per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        self._lock.acquire()
+        try:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        finally:
+            self._lock.release()
+        if start > now:
+            time.sleep(start - now)
+
+
+class ProgressJournal(object):
+    """
+    An append-only file recording the datasets uploaded, one per line as
+    their file's absolute path and their index in it, so that an
+    interrupted upload can be resumed. A `readonly` journal is only
+    consulted.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            f = open(path)
+            try:
+                self.done.update([line.rstrip('\n') for line in f])
+            finally:
+                f.close()
+        self._file = None
+        if not readonly:
+            self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def key(self, path, index):
+        return '%s\t%d' % (os.path.abspath(path), index)
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def record(self, key):
+        self._lock.acquire()
+        try:
+            self.done.add(key)
+            self._file.write(key + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._lock.release()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class BulkUploader(object):
+    """
+    Uploads the datasets of many files through a DatazillaRequest, with
+    `workers` files in parallel and at most `rate` uploads per second, if
+    given. Datasets recorded in `journal`, a ProgressJournal, are skipped,
+    and those accepted are recorded. With `dry_run`, files are read and
+    counted but nothing is sent. Failures are reported to `errors`
+    (stderr by default).
+    """
+
+    def __init__(self, request, workers=4, rate=None, journal=None,
+                 dry_run=False, errors=None):
+        self.request = request
+        self.workers = workers
+        self.limiter = rate and RateLimiter(rate) or None
+        self.journal = journal
+        self.dry_run = dry_run
+        self.errors = errors or sys.stderr
+        self.stats = {'files': 0, 'datasets': 0, 'sent': 0, 'skipped': 0,
+                      'failed': 0, 'bad_files': 0, 'json_bytes': 0,
+                      'elapsed': 0}
+        self._lock = threading.Lock()
+
+    def upload(self, paths):
+        """Upload the datasets of the given files; returns the stats."""
+        paths = list(paths)
+        start = time.time()
+        results, errors = run_concurrently(self._upload_file, paths,
+                                           self.workers)
+        self.stats['elapsed'] += time.time() - start
+        for index in sorted(errors):
+            self._fail("%s: upload failed: %s" % (paths[index], errors[index]))
+            self._count(failed=1)
+        return self.stats
+
+    def _count(self, **counts):
+        self._lock.acquire()
+        try:
+            for name, count in counts.items():
+                self.stats[name] += count
+        finally:
+            self._lock.release()
+
+    def _fail(self, message):
+        self._lock.acquire()
+        try:
+            self.errors.write(message + '\n')
+        finally:
+            self._lock.release()
+
+    def _upload_file(self, path):
+        try:
+            datasets = read_datasets(path)
+        except Exception, e:
+            self._fail("%s: cannot read: %s" % (path, e))
+            self._count(bad_files=1)
+            return
+        self._count(files=1, datasets=len(datasets))
+
+        for index, dataset in enumerate(datasets):
+            key = None
+            if self.journal is not None:
+                key = self.journal.key(path, index)
+                if key in self.journal:
+                    self._count(skipped=1)
+                    continue
+            if self.dry_run:
+                self._count(json_bytes=len(
+                    self.request.json_encoder.encode(dataset)))
+                continue
+
+            if self.limiter is not None:
+                self.limiter.wait()
+            try:
+                response = self.request.send(dataset)
+                response.read()
+                if not 200 <= response.status < 300:
+                    raise IOError("status %d" % response.status)
+            except Exception, e:
+                self._fail("%s[%d]: upload failed: %s" % (path, index, e))
+                self._count(failed=1)
+                continue
+            if key is not None:
+                self.journal.record(key)
+            self._count(sent=1)
+
+    def report(self, stream=None):
+        """Write the upload's statistics to `stream` (stdout by default)."""
+        stream = stream or sys.stdout
+        stats = dict(self.stats)
+        elapsed = max(stats['elapsed'], 1e-6)
+        if self.dry_run:
+            stream.write("dry run: %(datasets)d datasets in %(files)d files, "
+                         "%(skipped)d already uploaded, " % stats)
+            stream.write("%.1f MB of JSON to send\n" %
+                         (stats['json_bytes'] / 1e6))
+        else:
+            summary = self.request.metrics.summary()
+            stream.write("sent %(sent)d datasets from %(files)d files, "
+                         "%(skipped)d skipped, %(failed)d failed" % stats)
+            stream.write(" in %.1fs: %.1f datasets/s, %.2f MB/s (%.1f MB)\n" %
+                         (elapsed, stats['sent'] / elapsed,
+                          summary['sent_bytes'] / 1e6 / elapsed,
+                          summary['sent_bytes'] / 1e6))
+        if stats['bad_files']:
+            stream.write("%(bad_files)d files could not be read\n" % stats)
+
+
+def main(args=None):
+    """Upload dataset files from the command line; returns the exit status."""
+    if args is None:
+        args = sys.argv[1:]
+    parser = OptionParser(usage="%prog [options] FILE|DIRECTORY|GLOB...")
+    parser.add_option('--protocol', default='https')
+    parser.add_option('--host', default='datazilla.mozilla.org')
+    parser.add_option('--project')
+    parser.add_option('--key', default=os.environ.get('DATAZILLA_OAUTH_KEY'),
+                      help="OAuth key; defaults to $DATAZILLA_OAUTH_KEY")
+    parser.add_option('--secret',
+                      default=os.environ.get('DATAZILLA_OAUTH_SECRET'),
+                      help="OAuth secret; defaults to $DATAZILLA_OAUTH_SECRET")
+    parser.add_option('--workers', type='int', default=4,
+                      help="files uploaded in parallel")
+    parser.add_option('--rate', type='float',
+                      help="maximum uploads per second")
+    parser.add_option('--journal',
+                      help="file recording the datasets uploaded; datasets "
+                      "already in it are skipped")
+    parser.add_option('--dry-run', action='store_true',
+                      help="read and count the datasets without sending them")
+    parser.add_option('--retries', type='int', default=2,
+                      help="retries of failed uploads")
+    parser.add_option('--timeout', type='float', default=60,
+                      help="socket timeout in seconds")
+    parser.add_option('--compression', choices=['gzip', 'deflate'])
+    parser.add_option('--json-encoder', default='json',
+                      choices=sorted(ENCODERS),
+                      help="'json', 'ujson' or 'floats'")
+    options, args = parser.parse_args(args)
+    if not args or not options.project:
+        parser.error("a project and at least one file are required")
+
+    try:
+        json_encoder = get_encoder(options.json_encoder)
+    except ImportError, e:
+        parser.error("JSON encoder '%s' not available: %s" %
+                     (options.json_encoder, e))
+
+    paths = find_files(args)
+    if not paths:
+        parser.error("no dataset files found")
+
+    request = uploader_request(
+        options.protocol, options.host, options.project, options.key,
+        options.secret, pool=ConnectionPool(maxsize=options.workers),
+        compression=options.compression,
+        json_encoder=json_encoder,
+        retry_policy=RetryPolicy(retries=options.retries,
+                                 connect_timeout=options.timeout,
+                                 read_timeout=options.timeout))
+    journal = None
+    if options.journal:
+        journal = ProgressJournal(options.journal, readonly=options.dry_run)
+    uploader = BulkUploader(request, options.workers, options.rate, journal,
+                            options.dry_run)
+    try:
+        uploader.upload(paths)
+    finally:
+        request.close()
+        if journal is not None:
+            journal.close()
+    uploader.report()
+    if uploader.stats['failed'] or uploader.stats['bad_files']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
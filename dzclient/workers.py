@@ -0,0 +1,216 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import threading
+from Queue import Queue, Empty
+
+
+def run_concurrently(func, items, max_workers):
+    """
+    Call func(item) for every item using up to `max_workers` threads.
+
+    Returns a (results, errors) pair: `results` is a list in the same
+    order as `items`, holding None where the call raised, and `errors` is
+    a dict of {index: exception} for the calls that raised. A failing
+    call does not stop the others.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = {}
+    if not items:
+        return results, errors
+
+    queue = Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception:
+                errors[index] = sys.exc_info()[1]
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+class PendingTimeout(Exception):
+    """Raised when waiting on a Pending call times out."""
+
+
+class Cancelled(Exception):
+    """Raised when waiting on a Pending call that was cancelled."""
+
+
+class Pending(object):
+    """
+    The eventual result of a call run by BackgroundWorkers, in the manner
+    of a future: it can be waited on, cancelled before it starts, and have
+    callbacks attached.
+    """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self._state = 'pending' # then 'running', 'done' or 'cancelled'
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Cancel the call if it has not started; return whether it was."""
+        self._lock.acquire()
+        try:
+            if self._state != 'pending':
+                return self._state == 'cancelled'
+            self._state = 'cancelled'
+        finally:
+            self._lock.release()
+        self._finish()
+        return True
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def running(self):
+        return self._state == 'running'
+
+    def done(self):
+        return self._state in ('done', 'cancelled')
+
+    def result(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for the call and return its result,
+        raising its exception if it failed, or Cancelled if it was
+        cancelled.
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait up to `timeout` seconds and return the call's exception."""
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(pending) once the call is done or cancelled; it is
+        called from the worker thread, or at once if already done.
+        """
+        self._lock.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def run(self):
+        """Run the call, unless it was cancelled."""
+        self._lock.acquire()
+        try:
+            if self._state != 'pending':
+                return
+            self._state = 'running'
+        finally:
+            self._lock.release()
+
+        try:
+            self._result = self.func(*self.args)
+        except Exception:
+            self._exception = sys.exc_info()[1]
+        self._state = 'done'
+        self._finish()
+
+    def _wait(self, timeout):
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise PendingTimeout("call not done after %s seconds" % timeout)
+        if self.cancelled():
+            raise Cancelled("call was cancelled")
+
+    def _finish(self):
+        self._lock.acquire()
+        try:
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        self._done.set()
+        for callback in callbacks:
+            callback(self)
+
+
+class BackgroundWorkers(object):
+    """
+    Runs calls on up to `max_workers` daemon threads, returning a Pending
+    for each. Threads are started as calls are queued.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self, func, *args):
+        """Queue func(*args) and return its Pending."""
+        pending = Pending(func, args)
+        self._queue.put(pending)
+
+        self._lock.acquire()
+        try:
+            self._threads = [t for t in self._threads if t.isAlive()]
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+
+        return pending
+
+    def shutdown(self, cancel=False):
+        """
+        Stop the worker threads once the queued calls are done; with
+        `cancel=True` the calls that have not started are cancelled.
+        """
+        if cancel:
+            while True:
+                try:
+                    pending = self._queue.get_nowait()
+                except Empty:
+                    break
+                if pending is not None:
+                    pending.cancel()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            pending = self._queue.get()
+            if pending is None:
+                return
+            pending.run()
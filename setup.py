@@ -27,6 +27,7 @@ setup(name='datazilla',
       packages=['dzclient'],
       zip_safe=False,
       install_requires=deps,
+      entry_points={'console_scripts': ['dzclient = dzclient.upload:main']},
       test_suite='dzclient.tests',
       tests_require=["mock"],
       )